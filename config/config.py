@@ -0,0 +1,538 @@
+
+"""
+统一配置加载
+1）定位 yaml 文件：显式传入根目录，或用 sys._getframe 取调用者所在目录向上查找
+（inspect.stack() 会构建所有栈帧并读取源码上下文，开销大得多）；定位结果按目录缓存
+2）解析结果按 (路径, mtime) 缓存，同一进程内重复读取不会再次解析，文件被修改后自动失效
+3）get_config() 返回带类型、已校验的配置对象；utils.operate_yaml.read_yaml 保留为兼容的薄封装
+"""
+import copy
+import os
+import sys
+import threading
+from dataclasses import dataclass, field, fields, is_dataclass
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple, Union, get_type_hints, get_origin, get_args
+
+import yaml
+
+from exceptions.exceptions import ConfigError
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CONFIG_FILE = "pytest_app_config.yaml"
+
+_LOCK = threading.Lock()
+_PATH_CACHE: Dict[Tuple[str, str, int], Path] = {}
+_PARSED_CACHE: Dict[str, Tuple[float, Any]] = {}
+_CONFIG_CACHE: Dict[str, Tuple[float, "Config"]] = {}
+
+
+# ---------------------------------------------------------------- 定位与解析
+
+def locate_yaml(yaml_filename: str, start_dir: Union[str, Path], max_depth: int = 5) -> Path:
+    """
+    从 start_dir 开始逐级向上查找 yaml/<yaml_filename>，找不到时再尝试 start_dir/<yaml_filename>
+    """
+    key = (str(start_dir), yaml_filename, max_depth)
+    cached = _PATH_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    current_dir = Path(start_dir)
+    found = None
+    for _ in range(max_depth + 1):
+        yaml_path = current_dir / "yaml" / yaml_filename
+        if yaml_path.is_file():
+            found = yaml_path
+            break
+        if current_dir.parent == current_dir:  # 到达根目录
+            break
+        current_dir = current_dir.parent
+
+    if found is None and (Path(start_dir) / yaml_filename).is_file():
+        found = Path(start_dir) / yaml_filename
+
+    if found is None:
+        raise FileNotFoundError(
+            f"找不到 YAML 文件: {yaml_filename}\n"
+            f"在以下位置查找:\n"
+            f"- {start_dir}/yaml/{yaml_filename}\n"
+            f"- 以及向上 {max_depth} 级目录"
+        )
+    _PATH_CACHE[key] = found
+    return found
+
+
+def load_yaml(path: Union[str, Path]) -> Any:
+    """解析 yaml 文件，结果按 (路径, mtime) 缓存；返回的是缓存对象，调用方不要修改"""
+    path = str(path)
+    mtime = os.stat(path).st_mtime
+    with _LOCK:
+        cached = _PARSED_CACHE.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path, "r", encoding="utf-8") as file:
+        data = yaml.safe_load(file)
+    with _LOCK:
+        _PARSED_CACHE[path] = (mtime, data)
+    return data
+
+
+def read_yaml_from_caller(yaml_filename: str, max_depth: int = 5, depth: int = 1) -> Any:
+    """
+    以调用者文件所在目录为起点读取 yaml（返回副本，调用方可以随意修改）
+    :param depth: 调用者相对本函数的栈帧层数
+    """
+    caller_file = sys._getframe(depth + 1).f_code.co_filename
+    path = locate_yaml(yaml_filename, Path(caller_file).resolve().parent, max_depth)
+    return copy.deepcopy(load_yaml(path))
+
+
+# ---------------------------------------------------------------- 类型化配置
+
+@dataclass(frozen=True)
+class HealthMonitorConfig:
+    interval: float = 5
+    ttl: float = 15
+
+
+@dataclass(frozen=True)
+class OutputConfig:
+    buffer_lines: int = 2000
+    log_file: Optional[str] = None
+    log_max_bytes: int = 5 * 1024 * 1024
+    log_backups: int = 3
+
+
+@dataclass(frozen=True)
+class DatabaseConfig:
+    file: Optional[str] = None  # 相对 app.dir 的数据文件，为空时不做快照/恢复
+    seed_file: Optional[str] = None
+    reseed_endpoint: Optional[str] = None  # 相对 api.base_url
+    reseed_payload: bool = False  # 把快照作为请求体 POST 给 reseed_endpoint，而不是写种子文件
+    isolate_attached: bool = False  # 附加到不是本次会话启动的应用时也做快照/恢复
+    isolation: str = "none"
+    snapshot_dir: str = ".cache/db_snapshots"
+
+    def validate(self):
+        _check_choice("app.database.isolation", self.isolation, ("none", "class", "test"))
+        if self.file and not self.reseed_endpoint:
+            raise ConfigError("app.database.file 需要同时配置 reseed_endpoint（lowdb 数据在内存中，只能通过接口恢复）")
+        if self.reseed_endpoint and not self.reseed_payload and not self.seed_file:
+            raise ConfigError("app.database.reseed_endpoint 需要同时配置 seed_file，或设置 reseed_payload")
+
+
+@dataclass(frozen=True)
+class InstancesConfig:
+    mode: str = "shared"
+    count: int = 0
+    reuse: bool = False
+    copy: List[str] = field(default_factory=lambda: ["data"])
+    env: Dict[str, str] = field(default_factory=dict)
+    state_dir: str = ".cache/instances"
+
+    def validate(self):
+        _check_choice("app.instances.mode", self.mode, ("shared", "per_worker"))
+        if self.count < 0:
+            raise ConfigError(f"app.instances.count 不能为负数: {self.count}")
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    """app.services 中的单个服务（如前端、后端），没有依赖关系的服务并发启动"""
+    name: str
+    command: Union[List[str], str]
+    dir: Optional[str] = None  # 相对 app.dir 的工作目录，默认就是 app.dir
+    port: Optional[int] = None
+    health_check: Optional[str] = None  # 不填时用 http://localhost:<port>/
+    ready_pattern: Optional[str] = None
+    startup_timeout: Optional[float] = None  # 不填时用 app.startup_timeout
+    depends_on: List[str] = field(default_factory=list)
+    env: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def health_url(self) -> Optional[str]:
+        if self.health_check:
+            return self.health_check
+        return f"http://localhost:{self.port}/" if self.port else None
+
+    def validate(self):
+        if self.startup_timeout is not None:
+            _check_positive(f"app.services[{self.name}].startup_timeout", self.startup_timeout)
+        _check_regex(f"app.services[{self.name}].ready_pattern", self.ready_pattern)
+
+
+@dataclass(frozen=True)
+class AppConfig:
+    dir: str
+    command: Union[List[str], str, None] = None
+    health_check: Optional[str] = None
+    startup_timeout: float = 30
+    ready_pattern: Optional[str] = None
+    max_retries: int = 2
+    attach: str = "auto"
+    health_monitor: HealthMonitorConfig = field(default_factory=HealthMonitorConfig)
+    output: OutputConfig = field(default_factory=OutputConfig)
+    shared_state_dir: Optional[str] = None
+    stop_timeout: float = 10  # 停止时温和结束的等待时间，超时后强制结束整个进程组
+    process_registry: str = ".cache/app_processes.json"
+    services: List[ServiceConfig] = field(default_factory=list)
+    database: DatabaseConfig = field(default_factory=DatabaseConfig)
+    instances: InstancesConfig = field(default_factory=InstancesConfig)
+
+    def validate(self):
+        _check_choice("app.attach", self.attach, ("auto", "never"))
+        _check_positive("app.startup_timeout", self.startup_timeout)
+        _check_positive("app.stop_timeout", self.stop_timeout)
+        if self.max_retries < 0:
+            raise ConfigError(f"app.max_retries 不能为负数: {self.max_retries}")
+        _check_regex("app.ready_pattern", self.ready_pattern)
+        if not self.command and not self.services:
+            raise ConfigError("app.command 和 app.services 至少要配置一个")
+
+        names = [service.name for service in self.services]
+        duplicated = sorted({name for name in names if names.count(name) > 1})
+        if duplicated:
+            raise ConfigError(f"app.services 中服务名重复: {duplicated}")
+        for service in self.services:
+            unknown = [dep for dep in service.depends_on if dep not in names]
+            if unknown:
+                raise ConfigError(f"app.services[{service.name}].depends_on 中有未知服务: {unknown}")
+        self.start_order()
+        if self.instances.mode == "per_worker":
+            missing = [service.name for service in self.service_list() if not service.port]
+            if missing:
+                raise ConfigError(f"app.instances.mode 为 per_worker 时每个服务都要配置 port: {missing}")
+
+    def service_list(self) -> List[ServiceConfig]:
+        """要启动的服务；没有配置 services 时，把单个 command/health_check 当成一个名为 app 的服务"""
+        if self.services:
+            return list(self.services)
+        return [ServiceConfig(name="app", command=self.command, health_check=self.health_check,
+                              ready_pattern=self.ready_pattern)]
+
+    def start_order(self) -> List[str]:
+        """按依赖关系排好的服务名（依赖在前），存在循环依赖时报错"""
+        services = {service.name: service for service in self.services}
+        order: List[str] = []
+        visiting: List[str] = []
+
+        def visit(name: str):
+            if name in order:
+                return
+            if name in visiting:
+                cycle = visiting[visiting.index(name):] + [name]
+                raise ConfigError(f"app.services 存在循环依赖: {' -> '.join(cycle)}")
+            visiting.append(name)
+            for dep in services[name].depends_on:
+                visit(dep)
+            visiting.pop()
+            order.append(name)
+
+        for name in services:
+            visit(name)
+        return order
+
+
+@dataclass(frozen=True)
+class ApiConfig:
+    base_url: str = "http://localhost:3001"
+    frontend_url: str = "http://localhost:3000"
+    default_password: str = "password123"
+    auth_storage_key: Optional[str] = "authState"
+
+
+@dataclass(frozen=True)
+class UserPoolConfig:
+    size: int = 8
+    concurrency: int = 8
+    path: str = ".cache/user_pool.json"
+
+    def validate(self):
+        _check_positive("user_pool.size", self.size)
+        _check_positive("user_pool.concurrency", self.concurrency)
+
+
+@dataclass(frozen=True)
+class DataFactoryConfig:
+    scenario_file: str = "yaml/data_scenarios.yaml"
+    cache: str = ".cache/scenarios.json"
+    concurrency: int = 8
+
+    def validate(self):
+        _check_positive("data_factory.concurrency", self.concurrency)
+
+
+@dataclass(frozen=True)
+class BrowserConfig:
+    reuse: str = "worker"
+    recycle_after: int = 50
+    profile_commands: bool = True
+    profile_top: int = 5
+
+    def validate(self):
+        _check_choice("browser.reuse", self.reuse, ("worker", "class", "none"))
+        _check_positive("browser.recycle_after", self.recycle_after)
+        _check_positive("browser.profile_top", self.profile_top)
+
+
+@dataclass(frozen=True)
+class NetworkBlockingConfig:
+    enabled: bool = True
+    url_patterns: List[str] = field(default_factory=list)
+    resource_types: List[str] = field(default_factory=list)
+    report: bool = True
+    size_cache: str = ".cache/blocked_sizes.json"
+
+    def validate(self):
+        for resource_type in self.resource_types:
+            _check_choice("network_blocking.resource_types", resource_type, ("Image", "Font", "Media"))
+
+
+@dataclass(frozen=True)
+class PerfConfig:
+    enabled: bool = False
+    history_file: str = ".cache/perf_history.json"
+    history_size: int = 50
+    baseline_window: int = 10
+    min_samples: int = 3
+    regression_threshold: float = 0.5
+    regression_min_delta: float = 100
+    regression_metrics: List[str] = field(default_factory=lambda: ["lcp", "load", "long_task_time"])
+    # 路由（default 为所有路由）-> 指标 -> 上限
+    budgets: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    # 路径正则 -> 归并后的路由
+    route_patterns: Dict[str, str] = field(default_factory=dict)
+
+    def validate(self):
+        metrics = ("ttfb", "dom_content_loaded", "load", "lcp", "cls", "long_tasks", "long_task_time",
+                   "resources", "transfer_bytes")
+        _check_positive("perf.history_size", self.history_size)
+        _check_positive("perf.baseline_window", self.baseline_window)
+        _check_positive("perf.min_samples", self.min_samples)
+        _check_positive("perf.regression_threshold", self.regression_threshold)
+        for metric in self.regression_metrics:
+            _check_choice("perf.regression_metrics", metric, metrics)
+        for route, budget in self.budgets.items():
+            if not isinstance(budget, dict):
+                raise ConfigError(f"perf.budgets[{route}] 应为 指标 -> 上限 的字典，实际为: {budget!r}")
+            for metric, limit in budget.items():
+                _check_choice(f"perf.budgets[{route}]", metric, metrics)
+                if isinstance(limit, bool) or not isinstance(limit, (int, float)):
+                    raise ConfigError(f"perf.budgets[{route}].{metric} 应为数字，实际为: {limit!r}")
+        for pattern in self.route_patterns:
+            _check_regex("perf.route_patterns", pattern)
+
+
+@dataclass(frozen=True)
+class LoadConfig:
+    users: int = 10
+    iterations: int = 5
+    # 设置后按时长运行（秒），每个虚拟用户循环执行流程直到时间用完，忽略 iterations
+    duration: Optional[float] = None
+    ramp_up: float = 0
+    think_time: float = 0
+    timeout: float = 10
+    output: str = "reports/load.json"
+    restore_data: bool = True
+
+    def validate(self):
+        _check_positive("load.users", self.users)
+        _check_positive("load.iterations", self.iterations)
+        _check_positive("load.timeout", self.timeout)
+        if self.duration is not None:
+            _check_positive("load.duration", self.duration)
+        if self.ramp_up < 0 or self.think_time < 0:
+            raise ConfigError(f"load.ramp_up / load.think_time 不能为负数: {self.ramp_up} / {self.think_time}")
+
+
+@dataclass(frozen=True)
+class TimingConfig:
+    output: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class RetryConfig:
+    base_delay: float = 1
+    max_delay: float = 10
+    jitter: float = 0.5
+    budget: int = 20
+
+    def validate(self):
+        _check_positive("retry.max_delay", self.max_delay)
+        if self.base_delay < 0:
+            raise ConfigError(f"retry.base_delay 不能为负数: {self.base_delay}")
+        if not 0 <= self.jitter <= 1:
+            raise ConfigError(f"retry.jitter 必须在 0 到 1 之间: {self.jitter}")
+        if self.budget < 0:
+            raise ConfigError(f"retry.budget 不能为负数: {self.budget}")
+
+
+@dataclass(frozen=True)
+class SchedulingConfig:
+    mode: str = "lpt"
+    default_duration: float = 5
+    smoothing: float = 0.5
+
+    def validate(self):
+        _check_choice("scheduling.mode", self.mode, ("lpt", "none"))
+        _check_positive("scheduling.default_duration", self.default_duration)
+        if not 0 < self.smoothing <= 1:
+            raise ConfigError(f"scheduling.smoothing 必须在 (0, 1] 之间: {self.smoothing}")
+
+
+@dataclass(frozen=True)
+class IncrementalConfig:
+    enabled: bool = False
+    # 所有测试共同依赖的文件（相对项目根目录的 glob），.py 文件连同其 import 闭包一起算
+    global_files: List[str] = field(default_factory=lambda: ["conftest.py", "pytest.ini", "yaml/*.yaml"])
+
+
+@dataclass(frozen=True)
+class PytestConfig:
+    fail_strategy: str = "skip"
+    require_app_marker: str = "requires_app"
+
+    def validate(self):
+        _check_choice("pytest.fail_strategy", self.fail_strategy, ("skip", "fail", "xfail"))
+
+
+@dataclass(frozen=True)
+class LoggingConfig:
+    level: str = "INFO"
+    format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+@dataclass(frozen=True)
+class Config:
+    """pytest_app_config.yaml 对应的配置对象"""
+    app: AppConfig
+    api: ApiConfig = field(default_factory=ApiConfig)
+    user_pool: UserPoolConfig = field(default_factory=UserPoolConfig)
+    data_factory: DataFactoryConfig = field(default_factory=DataFactoryConfig)
+    browser: BrowserConfig = field(default_factory=BrowserConfig)
+    network_blocking: NetworkBlockingConfig = field(default_factory=NetworkBlockingConfig)
+    perf: PerfConfig = field(default_factory=PerfConfig)
+    load: LoadConfig = field(default_factory=LoadConfig)
+    timing: TimingConfig = field(default_factory=TimingConfig)
+    retry: RetryConfig = field(default_factory=RetryConfig)
+    scheduling: SchedulingConfig = field(default_factory=SchedulingConfig)
+    incremental: IncrementalConfig = field(default_factory=IncrementalConfig)
+    pytest: PytestConfig = field(default_factory=PytestConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+    path: Optional[str] = None
+    # 原始字典，供尚未类型化的扩展配置使用
+    raw: Dict[str, Any] = field(default_factory=dict, compare=False, repr=False)
+
+    def resolve_path(self, path: Optional[str]) -> Optional[str]:
+        """把配置中的相对路径解析为相对项目根目录的绝对路径"""
+        if not path or os.path.isabs(path):
+            return path
+        return str(PROJECT_ROOT / path)
+
+
+def _check_choice(name: str, value, choices) -> None:
+    if value not in choices:
+        raise ConfigError(f"{name} 的取值必须是 {list(choices)} 之一，实际为: {value!r}")
+
+
+def _check_positive(name: str, value) -> None:
+    if value <= 0:
+        raise ConfigError(f"{name} 必须大于 0，实际为: {value!r}")
+
+
+def _check_regex(name: str, value: Optional[str]) -> None:
+    if not value:
+        return
+    import re
+    try:
+        re.compile(value)
+    except re.error as e:
+        raise ConfigError(f"{name} 不是合法的正则: {e}")
+
+
+def _convert(name: str, value, tp):
+    """按类型注解转换/校验单个值"""
+    origin = get_origin(tp)
+    if origin is Union:
+        if value is None and type(None) in get_args(tp):
+            return None
+        for arg in get_args(tp):
+            if arg is type(None):
+                continue
+            try:
+                return _convert(name, value, arg)
+            except ConfigError:
+                continue
+        raise ConfigError(f"{name} 类型不正确: {value!r}")
+    if origin in (list, List):
+        if not isinstance(value, list):
+            raise ConfigError(f"{name} 应为列表，实际为: {value!r}")
+        (item_type,) = get_args(tp) or (Any,)
+        return [_convert(f"{name}[{i}]", v, item_type) for i, v in enumerate(value)]
+    if origin in (dict, Dict):
+        if not isinstance(value, dict):
+            raise ConfigError(f"{name} 应为字典，实际为: {value!r}")
+        key_type, value_type = get_args(tp) or (Any, Any)
+        return {_convert(f"{name} 的键", k, key_type): _convert(f"{name}.{k}", v, value_type) for k, v in value.items()}
+    if is_dataclass(tp):
+        return _build(tp, value, name)
+    if tp is Any:
+        return value
+    if tp is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if tp is bool and isinstance(value, bool):
+        return value
+    if tp in (int, str) and isinstance(value, tp) and not isinstance(value, bool):
+        return value
+    raise ConfigError(f"{name} 应为 {getattr(tp, '__name__', tp)}，实际为: {value!r}")
+
+
+def _build(cls, data, section: str):
+    """按 dataclass 定义构建配置段：缺省字段用默认值，未知字段报错，构建后调用 validate()"""
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise ConfigError(f"{section} 应为字典，实际为: {data!r}")
+    hints = get_type_hints(cls)
+    # Config 的 path/raw 不来自 yaml；顶层允许出现尚未类型化的扩展配置段
+    reserved = ("path", "raw") if cls is Config else ()
+    known = {f.name for f in fields(cls) if f.name not in reserved}
+    unknown = set(data) - known
+    if unknown and cls is not Config:
+        raise ConfigError(f"{section} 中有未知配置项: {sorted(unknown)}")
+
+    kwargs = {}
+    for f in fields(cls):
+        if f.name not in data or f.name in reserved:
+            continue
+        kwargs[f.name] = _convert(f"{section}.{f.name}" if section else f.name, data[f.name], hints[f.name])
+    try:
+        obj = cls(**kwargs)
+    except TypeError as e:
+        raise ConfigError(f"{section or '配置'} 缺少必填项: {e}")
+    if hasattr(obj, "validate"):
+        obj.validate()
+    return obj
+
+
+def get_config(root: Union[str, Path, None] = None, filename: str = DEFAULT_CONFIG_FILE) -> Config:
+    """
+    获取类型化配置（按路径和 mtime 缓存，多次调用返回同一个对象）
+    :param root: 查找起点，默认项目根目录
+    :param filename: 配置文件名
+    """
+    path = locate_yaml(filename, root or PROJECT_ROOT)
+    mtime = os.stat(path).st_mtime
+    cached = _CONFIG_CACHE.get(str(path))
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    data = load_yaml(path) or {}
+    if "app" not in data:
+        raise ConfigError(f"{path} 缺少 app 配置段")
+    built = _build(Config, data, "")
+    config = Config(**{f.name: getattr(built, f.name) for f in fields(Config) if f.name not in ("path", "raw")},
+                    path=str(path), raw=data)
+    _CONFIG_CACHE[str(path)] = (mtime, config)
+    return config
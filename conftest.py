@@ -2,28 +2,49 @@
 """
 统一配置 - 使用统一异常处理机制+缓存机制
 """
+import logging
 import time
-from typing import Dict, Any
+from typing import Dict, Optional
 
 import pytest
 
 
+from utils import timing
+from utils.app_state import SharedAppState
+from utils.instances import InstanceRegistry
+from utils.process_tree import ProcessRegistry
 from utils.excep_manager import AppManager, AppStatus, handle_app_failure
-from utils.operate_yaml import read_yaml
+from config.config import get_config
 
 #读取yaml文件
 import os
 
-config=read_yaml("pytest_app_config.yaml")
+logger = logging.getLogger(__name__)
+config = get_config()
+
+# 阶段耗时插件（--timing-output 启用）、按历史耗时调度插件（并行时生效）
+pytest_plugins = ["plugins.timing", "plugins.scheduling", "plugins.incremental"]
 
 # 全局应用管理器
 _APP_MANAGER = None
-_REQUIRES_APP_CACHE: Dict[str, bool] = {}
-_HEALTH_CHECK_CACHE: Dict[str, Any] = {
-    "status": None,
-    "timestamp": 0,
-    "ttl": 60  # 缓存有效期（秒）
-}
+# 收集阶段解析出的“是否依赖应用”，存在各个 item 上，运行阶段 O(1) 读取
+REQUIRES_APP = pytest.StashKey[bool]()
+# 应用启动失败后只汇总提示一次
+_APP_FAILURE_REPORTED = False
+
+def get_shared_state() -> Optional[SharedAppState]:
+    """
+    pytest-xdist 下返回所有 worker 共用的状态文件，单进程运行时返回 None
+    xdist 会给每个 worker 设置 PYTEST_XDIST_WORKER，并给同一次运行设置相同的 PYTEST_XDIST_TESTRUNUID
+    每个 worker 使用独立实例（app.instances.mode 为 per_worker）时不共享，同样返回 None
+    """
+    if config.app.instances.mode == "per_worker":
+        return None
+    run_id = os.environ.get("PYTEST_XDIST_TESTRUNUID")
+    if not os.environ.get("PYTEST_XDIST_WORKER") or not run_id:
+        return None
+    return SharedAppState.for_session(run_id, config.app.shared_state_dir)
+
 
 def get_app_manager(app_dir: str = None,health_check_url:str=None) -> AppManager:
     """
@@ -36,18 +57,39 @@ def get_app_manager(app_dir: str = None,health_check_url:str=None) -> AppManager
 
     if _APP_MANAGER is None:
         if app_dir is None:
-            app_dir =config["app"]["dir"]
+            app_dir = config.app.dir
         if health_check_url is None:
-            health_check_url = config["app"]["health_check"]
+            health_check_url = config.app.health_check
 
         _APP_MANAGER = AppManager(
             app_dir=app_dir,
-            max_retries=config["app"]["max_retries"],
-            health_check_url=health_check_url
+            max_retries=config.app.max_retries,
+            health_check_url=health_check_url,
+            shared_state=get_shared_state(),
+            worker_id=os.environ.get("PYTEST_XDIST_WORKER", "master"),
+            attach_existing=config.app.attach == "auto",
+            instances=InstanceRegistry.from_config() if config.app.instances.mode == "per_worker" else None
         )
 
     return _APP_MANAGER
 
+
+def configure_app_manager(pytest_config) -> AppManager:
+    """按命令行参数配置应用管理器（--app-dir 不在命令行输入的话，会在 get_app_manager 内自动取默认值）"""
+    manager = get_app_manager(pytest_config.getoption("--app-dir"))
+    if not manager.started:
+        manager.max_retries = pytest_config.getoption("--app-retry")
+        attach = pytest_config.getoption("--app-attach")
+        if attach is not None:
+            manager.attach_existing = attach == "auto"
+    manager.fail_strategy = pytest_config.getoption("--app-fail-strategy")
+    return manager
+
+
+class SleepInTestWarning(pytest.PytestWarning):
+    """测试函数体内使用了固定等待 time.sleep"""
+
+
 # Hook函数
 def pytest_addoption(parser):
     """添加pytest命令行参数配置"""
@@ -71,75 +113,245 @@ def pytest_addoption(parser):
         default=2,
         help="应用启动重试次数"
     )
+    parser.addoption(
+        "--app-attach",
+        action="store",
+        default=None,
+        choices=["auto", "never"],
+        help="auto：应用已健康运行时直接附加，不再启动；never：总是启动新进程（默认取 yaml 中的 app.attach）"
+    )
+    parser.addoption(
+        "--db-isolation",
+        action="store",
+        default=None,
+        choices=["none", "class", "test"],
+        help="测试之间恢复数据库快照的粒度（默认取 yaml 中的 app.database.isolation），可用 db_isolation 标记单独指定"
+    )
+    parser.addoption(
+        "--browser-reuse",
+        action="store",
+        default=None,
+        choices=["worker", "class", "none"],
+        help="浏览器复用范围，none 为每条用例新开浏览器（默认取 yaml 中的 browser.reuse）"
+    )
+    parser.addoption(
+        "--network-blocking",
+        action="store",
+        default=None,
+        choices=["on", "off"],
+        help="是否通过 CDP 拦截图片、字体等请求（默认取 yaml 中的 network_blocking.enabled）；"
+             "off 时记录被拦截资源的实际大小，用于估算节省的字节数"
+    )
+    parser.addoption(
+        "--perf-budget",
+        action="store_true",
+        default=False,
+        help="性能预算模式：采集每次页面加载/路由切换的性能数据，超出 yaml 中 perf.budgets 或比滚动基线退化时用例失败"
+    )
+
+
+def pytest_configure(config):
+    """命令行指定了浏览器复用范围、请求拦截开关、性能预算模式时，覆盖 yaml 配置；性能预算模式下不拦截请求"""
+    config.addinivalue_line("markers", "requires_app: 测试依赖被测应用（使用 app_manager fixture 时自动添加）")
+    config.addinivalue_line("markers", "db_isolation(level): 数据库隔离级别 none/class/test，覆盖 --db-isolation")
+    browser_reuse = config.getoption("--browser-reuse")
+    if browser_reuse is not None:
+        from utils.base_test import BaseTest
+        BaseTest.browser_reuse = browser_reuse
+    network_blocking = config.getoption("--network-blocking")
+    if network_blocking is not None:
+        from utils.base_test import NETWORK_BLOCKER
+        NETWORK_BLOCKER.enabled = network_blocking == "on"
+    if config.getoption("--perf-budget"):
+        from utils.base_test import PERF_RECORDER
+        PERF_RECORDER.enabled = True
+    if config.getoption("--perf-budget") or get_config().perf.enabled:
+        # 拦截图片、字体会让 LCP、加载时间和传输量偏小，和不拦截时记下的历史不可比，性能模式下一律关闭
+        from utils.base_test import NETWORK_BLOCKER
+        if NETWORK_BLOCKER.enabled:
+            logger.info("性能预算模式下关闭请求拦截")
+            NETWORK_BLOCKER.enabled = False
 
 
 @pytest.fixture(scope="session")
 def app_manager(request):
     """提供应用管理器fixture，主要用于 管理应用程序的生命周期:
-    启动->运行->（失败-按策略执行）->终止进程
+    启动->运行->（失败-按策略执行），进程在会话结束时由 global_app_setup 统一终止
+    应用通常已在收集完成后开始后台启动（pytest_collection_finish），这里只等待启动结果
     """
-    app_dir = request.config.getoption("--app-dir")
-    max_retries = request.config.getoption("--app-retry")
+    manager = configure_app_manager(request.config)
 
-    #app_dir不在命令行输入的话，会在get_app_manager方法内自动取默认值
-    #get_app_manager方法会返回一个AppManager对象
-    manager = get_app_manager(app_dir)
-    manager.max_retries = max_retries
-
-    # 启动应用
-    result = manager.start_app()
+    # 等待后台启动完成（还没开始启动时立即开始）
+    result = manager.wait_for_app()
 
     # 如果启动失败，根据策略处理
     if result.status == AppStatus.FAILED:
         strategy = request.config.getoption("--app-fail-strategy")
         handle_app_failure(manager, strategy=strategy, test_item=request)
 
-    yield manager
+    return manager
+
+
+@pytest.fixture(scope="session")
+def user_pool(app_manager):
+    """会话开始时补齐用户池（已有的持久化用户直接复用），供需要现成用户的测试租借"""
+    from utils.test_data import get_user_pool
+    return get_user_pool(app_manager)
+
+
+@pytest.fixture(scope="session")
+def data_scenario(app_manager):
+    """按名称取得批量造好的测试数据场景：data_scenario("transaction_feed")，见 yaml/data_scenarios.yaml"""
+    from utils.test_data import get_scenario
+    return lambda name: get_scenario(name, app_manager)
+
+
+def _db_isolation_level(node, pytest_config) -> str:
+    """隔离级别：最近的 db_isolation 标记 > --db-isolation > yaml 中的 app.database.isolation"""
+    marker = node.get_closest_marker("db_isolation")
+    if marker and marker.args:
+        return marker.args[0]
+    return pytest_config.getoption("--db-isolation") or config.app.database.isolation
 
-    # 测试结束后清理
-    manager.stop_app()
+
+def _restore_database(level: str) -> None:
+    # 应用没启动过（或不能隔离）时 restore_database 直接返回 None
+    if _APP_MANAGER is None or not _APP_MANAGER.started:
+        return
+    try:
+        duration = _APP_MANAGER.restore_database()
+    except (OSError, RuntimeError) as e:
+        # 恢复失败不影响当前测试的结果，只是后续测试失去隔离
+        logger.warning(f"数据库恢复失败（{level}）: {e}")
+        return
+    if duration is not None:
+        logger.debug(f"数据库已恢复（{level}），耗时 {duration * 1000:.1f}ms")
+
+
+@pytest.fixture(scope="class", autouse=True)
+def db_isolation_class(request):
+    """隔离级别为 class 时，每个测试类（没有类的测试按模块）结束后把数据恢复到快照"""
+    yield
+    if _db_isolation_level(request.node, request.config) == "class":
+        _restore_database("class")
+
+
+@pytest.fixture(autouse=True)
+def db_isolation(request):
+    """隔离级别为 test 时，每条用例结束后把数据恢复到快照"""
+    yield
+    if _db_isolation_level(request.node, request.config) == "test":
+        _restore_database("test")
 
 
 @pytest.fixture(scope="session", autouse=True)
-def global_app_setup(app_manager, request):
-    """全局应用设置（可选）"""
+def global_app_setup(request):
+    """
+    全局应用设置：不再依赖 app_manager，不需要应用的会话不会因此阻塞等待启动
+    会话结束时，只要应用启动过（前台或后台），就在这里统一停止
+    """
     # 这里可以添加全局的设置逻辑
     yield
 
     # 这里可以添加全局的清理逻辑
+    if _APP_MANAGER is not None and _APP_MANAGER.started:
+        _APP_MANAGER.wait_for_app()
+        _APP_MANAGER.stop_app()
 
 
 # 全局Hook：在测试运行前检查应用状态
+@pytest.hookimpl(tryfirst=True)
 def pytest_runtest_setup(item, ):
     """测试设置阶段检查应用状态
-    1）这里不能直接取全局变量里的值，虽然前面app_manager会先执行，但是是有条件的
-    也就是必须使用上述fixture的测试才可以，否则会取出来一个None值，会有问题
-    2）此处还增加了缓存机制，设置了全局变量后，在每个测试进行检查之前，可以先判断缓存中有没有，如果有，可以直接取用
-    减小了性能开销
+    1）tryfirst：在任何 fixture（以及 BaseTest.setUp 里的浏览器启动）之前执行
+    2）是否依赖应用在收集阶段已经解析好并存在 item 上，这里只读一个布尔值、启动结果和健康状态缓存，没有网络 I/O；
+       后台监控发现应用中途挂掉时，在这条测试开始前重启
+    3）应用已确定启动失败时，依赖应用的测试直接按 --app-fail-strategy 批量 skip/fail/xfail，不再为它们做任何准备工作
     """
-    app_manager = get_app_manager()
-    # app_manager = _APP_MANAGER
+    with timing.timed("app_check"):
+        _check_app_before_test(item)
+
+
+def _check_app_before_test(item):
+    """pytest_runtest_setup 的检查逻辑，单独拆出来便于计时"""
+    if not item.stash.get(REQUIRES_APP, False):
+        return
+
+    # 这里不能用 get_app_manager()，否则不需要应用的会话也会创建管理器
+    app_manager = _APP_MANAGER
+    # 还没开始启动，或后台启动尚未完成（result 为 None）时，交给 fixture / BaseTest.setUp 等待
+    if app_manager is None or app_manager.result is None:
+        return
+    if app_manager.result.status == AppStatus.RUNNING:
+        # 只读后台监控刷新的健康状态缓存（O(1)，没有网络 I/O）；缓存过期（None）时交给监控线程刷新
+        if app_manager.health.get() is not False:
+            return
+        # 监控已发现应用在会话中途挂掉：在这条测试开始前重启（已被别的线程/worker 重启好时直接复用）
+        logger.warning(f"应用在会话中途变为不健康，{item.nodeid} 开始前尝试重启")
+        if app_manager.restart_app().status == AppStatus.RUNNING:
+            return
+    if app_manager.result.status == AppStatus.FAILED:
+        _report_app_failure(item.session, app_manager)
+        handle_app_failure(app_manager, strategy=None, test_item=item)
 
 
-    # 如果应用正常且缓存有效，直接返回
-    if app_manager.result and app_manager.result.status == AppStatus.RUNNING:
-        # 检查健康检查缓存是否有效
-        cache = _HEALTH_CHECK_CACHE
-        current_time = time.time()
-        if cache["status"] is True and (current_time - cache["timestamp"]) < cache["ttl"]:
-            return  # 缓存有效，直接返回
+def _report_app_failure(session, app_manager: AppManager) -> None:
+    """应用启动失败后，一次性汇总受影响的测试数量"""
+    global _APP_FAILURE_REPORTED
+    if _APP_FAILURE_REPORTED:
+        return
+    _APP_FAILURE_REPORTED = True
+    affected = sum(1 for item in session.items if item.stash.get(REQUIRES_APP, False))
+    strategy = session.config.getoption("--app-fail-strategy")
+    logger.warning(f"应用启动失败（{app_manager.result.error}），{affected} 条依赖应用的测试将直接按 {strategy} 处理")
 
-    # 如果应用状态失败，才需要进一步检查
-    if app_manager.result and app_manager.result.status == AppStatus.FAILED:
-        # 使用缓存避免重复遍历 markers
-        item_id = item.nodeid
-        if item_id not in _REQUIRES_APP_CACHE:
-            _REQUIRES_APP_CACHE[item_id] = "requires_app" in [mark.name for mark in item.iter_markers()]
 
-        if _REQUIRES_APP_CACHE[item_id]:
-            handle_app_failure(app_manager, strategy=None, test_item=item)
+def pytest_sessionstart(session):
+    """上次会话崩溃或被强制中断时，它启动的 yarn/node 进程组还占着端口，先清理掉（xdist 下只在主进程清理）"""
+    if hasattr(session.config, "workerinput"):
+        return
+    reaped = ProcessRegistry.from_config().reap_orphans()
+    if reaped:
+        logger.warning(f"已清理上次会话遗留的 {len(reaped)} 个应用进程组: {reaped}")
 
 
+def pytest_sessionfinish(session):
+    """
+    1）应用启动过但 global_app_setup 没有停止它（例如测试全部在 setup 前被跳过、会话被中断）时，在这里兜底停止
+    2）保存关闭拦截时记下的资源大小、本次采集的页面性能历史（每个 worker 各自合并写入）
+    """
+    import sys
+    if _APP_MANAGER is not None and _APP_MANAGER.started and not _APP_MANAGER.teardown:
+        _APP_MANAGER.wait_for_app()
+        _APP_MANAGER.stop_app()
+    base_test = sys.modules.get("utils.base_test")
+    if base_test:
+        base_test.NETWORK_BLOCKER.save_sizes()
+        base_test.PERF_RECORDER.save()
+
+
+def _will_run(item) -> bool:
+    """是否会真正执行：带 skip 标记或 skipif 条件成立的测试不会执行，不为它们启动应用"""
+    from _pytest.skipping import evaluate_skip_marks
+    try:
+        return evaluate_skip_marks(item) is None
+    except Exception:
+        # skipif 条件本身出错时 pytest 会在 setup 阶段报错，这里按会执行处理
+        return True
+
+
+def pytest_collection_finish(session):
+    """
+    收集（含 -k/-m 筛选）完成后立即在后台启动应用，和会话级 fixture、浏览器启动并行进行
+    1）--collect-only / --setup-plan 不执行测试，不启动
+    2）一条会真正执行的、需要应用的测试都没有时完全不启动
+    """
+    option = session.config.option
+    if option.collectonly or getattr(option, "setupplan", False):
+        return
+    if any(item.stash.get(REQUIRES_APP, False) and _will_run(item) for item in session.items):
+        configure_app_manager(session.config).start_app_async()
+
 
 # Hook：在测试集合阶段标记需要应用的测试
 def pytest_collection_modifyitems(config, items):
@@ -148,8 +360,75 @@ def pytest_collection_modifyitems(config, items):
     也就是说，使用了app_manager标记的一定要使用requires_app标记
     2）为什么要做这一步？看起来有点多余，实际上是因为有时候不会显式调用app_manager
     有可能是间接依赖，但也需要启动服务，所有这种方式拓展性更好
+    继承 BaseTest 且声明了 requires_app = True 的测试类同样会加上标记
+    标记结果直接存到 item.stash[REQUIRES_APP]，之后的 hook 不必再遍历 markers
+    3）顺带扫描测试函数里的 time.sleep，提示改用 utils.waits 中的条件等待
     """
+    sleep_calls_by_file: Dict[str, Dict[str, list]] = {}
+
     for item in items:
         # 检查测试是否使用app_manager fixture
         if hasattr(item, 'fixturenames') and 'app_manager' in item.fixturenames:
-            item.add_marker(pytest.mark.requires_app)
\ No newline at end of file
+            item.add_marker(pytest.mark.requires_app)
+        elif getattr(getattr(item, "cls", None), "requires_app", False):
+            item.add_marker(pytest.mark.requires_app)
+        item.stash[REQUIRES_APP] = item.get_closest_marker("requires_app") is not None
+
+        path = str(item.path)
+        if path not in sleep_calls_by_file:
+            if path.endswith(".py"):
+                # 只在有 Python 测试文件时才导入（utils.waits 本身不依赖 selenium）
+                from utils.waits import find_sleep_calls
+                sleep_calls_by_file[path] = find_sleep_calls(path)
+            else:
+                sleep_calls_by_file[path] = {}
+        for func_name in (getattr(item, "originalname", None) or item.name, "setUp"):
+            lines = sleep_calls_by_file[path].get(func_name)
+            if lines:
+                item.warn(SleepInTestWarning(
+                    f"{func_name} 中使用了 time.sleep（第 {lines} 行），请改用 utils.waits 中的条件等待"
+                ))
+
+
+def pytest_terminal_summary(terminalreporter):
+    """
+    会话结束时输出：
+    1）浏览器 setUp 耗时汇总（对比 --browser-reuse 不同取值的效果）
+    2）重试预算的使用情况（只有用过重试装饰器时才输出）、请求拦截的效果、每条用例的 WebDriver 命令往返、
+       各路由的页面性能
+    3）应用停止耗时和端口释放情况、数据库恢复次数和耗时
+    4）健康检查缓存的命中情况，便于观察每条测试前检查的剩余开销
+    """
+    import sys
+    base_test = sys.modules.get("utils.base_test")
+    latency_summary = base_test.setup_latency_summary() if base_test else None
+    if latency_summary:
+        terminalreporter.write_line(latency_summary)
+    decorators = sys.modules.get("deractors.exception_deractor")
+    retry_summary = decorators.RETRY_BUDGET.summary() if decorators else None
+    if retry_summary:
+        terminalreporter.write_line(retry_summary)
+    blocking_summary = base_test.NETWORK_BLOCKER.summary() if base_test else None
+    for line in blocking_summary or []:
+        terminalreporter.write_line(line)
+    command_summary = base_test.COMMAND_PROFILER.summary() if base_test else None
+    for line in command_summary or []:
+        terminalreporter.write_line(line)
+    perf_summary = base_test.PERF_RECORDER.summary() if base_test else None
+    for line in perf_summary or []:
+        terminalreporter.write_line(line)
+
+    if _APP_MANAGER is None or _APP_MANAGER.result is None:
+        return
+    teardown_summary = _APP_MANAGER.teardown_summary()
+    if teardown_summary:
+        terminalreporter.write_line(teardown_summary)
+    db_summary = _APP_MANAGER.database.summary() if _APP_MANAGER.database else None
+    if db_summary:
+        terminalreporter.write_line(db_summary)
+    stats = _APP_MANAGER.health.stats()
+    changed_at = time.strftime("%H:%M:%S", time.localtime(stats["changed_at"])) if stats["changed_at"] else "-"
+    terminalreporter.write_line(
+        f"应用健康检查缓存: 命中 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+        f"实际请求 {stats['probes']} 次，状态变化 {stats['changes']} 次（最近一次 {changed_at}）"
+    )
@@ -6,15 +6,22 @@
 
 2)直接用类似注解的方式访问
 这里主要是两个注解：异常处理+重试处理
+3)重试会先对失败分类，应用挂掉时自动重启；重试间隔为指数退避+随机抖动，并受会话级重试预算限制
 """
 import functools
 import logging
+import random
+import threading
 import time
+from typing import Optional
 
 
+from config.config import get_config
+from utils import timing
 from utils.excep_manager import AppManager, handle_app_failure, AppStatus
 from conftest import get_app_manager
 logger = logging.getLogger(__name__)
+config = get_config()
 
 
 def handle_app_exception(strategy: str = "skip", app_manager: AppManager = None):
@@ -49,6 +56,10 @@ def handle_app_exception(strategy: str = "skip", app_manager: AppManager = None)
                     # 从全局获取
                     manager = get_app_manager()
 
+            # 应用在后台启动时，先等待启动结果
+            if manager.started:
+                manager.wait_for_app()
+
             # 检查应用状态
             if manager.result and manager.result.status == AppStatus.FAILED:
                 handle_app_failure(manager, strategy=strategy)
@@ -60,32 +71,118 @@ def handle_app_exception(strategy: str = "skip", app_manager: AppManager = None)
     return decorator
 
 
-def retry_on_app_failure(max_retries: int = 3, delay: int = 2):
+class RetryBudget:
+    """整个会话（每个进程）共用的重试预算：环境整体坏掉时，避免每条用例都重试到上限、成倍拉长总耗时"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.used = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def consume(self) -> bool:
+        """占用一次重试机会，预算用完返回 False"""
+        with self._lock:
+            if self.used >= self.total:
+                self.denied += 1
+                return False
+            self.used += 1
+            return True
+
+    def summary(self) -> Optional[str]:
+        if not self.used and not self.denied:
+            return None
+        return f"重试预算: 已用 {self.used}/{self.total} 次，预算用完后放弃重试 {self.denied} 次"
+
+
+RETRY_BUDGET = RetryBudget(config.retry.budget)
+
+
+def classify_failure(error: Exception, manager: AppManager) -> str:
+    """
+    对测试失败分类，决定重试方式：
+    app_down：应用健康检查失败（后端挂了），重试前需要先重启应用
+    assertion：应用健康时的断言失败，属于确定性的测试失败，重试没有意义
+    transient：浏览器/网络类异常（超时、元素过期、连接中断等），退避后重试
+    """
+    # 应用还没启动过（不依赖应用的测试），健康检查没有意义
+    if manager.started and not manager.quick_health_check(force=True):
+        return "app_down"
+    if isinstance(error, AssertionError):
+        return "assertion"
+    return "transient"
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float, jitter: float) -> float:
+    """
+    第 attempt 次（从 0 开始）重试前的等待：指数退避，封顶 max_delay，再按 jitter 比例随机缩短
+    随机抖动让多个 worker 不会在同一时刻一起重试
+    """
+    delay = min(max_delay, base_delay * (2 ** attempt))
+    return random.uniform(delay * (1 - jitter), delay)
+
+
+def retry_on_app_failure(max_retries: int = 3, delay: Optional[float] = None,
+                         max_delay: Optional[float] = None, jitter: Optional[float] = None):
     """
        装饰器：测试失败时重试整个测试
+       1）每次失败先分类（classify_failure）：断言失败不重试；应用挂了先重启一次（加锁，多个测试同时发现只重启一次）
+       2）重试前按指数退避 + 随机抖动等待，不再固定 sleep
+       3）所有测试共用会话级重试预算（yaml 中的 retry.budget），用完后直接失败
+
+       :param max_retries: 最多执行次数（含第一次）
+       :param delay: 首次重试等待（秒），默认取 yaml 中的 retry.base_delay
+       :param max_delay: 单次等待上限（秒），默认取 retry.max_delay
+       :param jitter: 随机抖动比例，默认取 retry.jitter
 
        使用示例:
            @retry_on_app_failure(max_retries=3, delay=2)
            def test_something(self):
                ...
     """
+    base_delay = config.retry.base_delay if delay is None else delay
+    max_delay = config.retry.max_delay if max_delay is None else max_delay
+    jitter = config.retry.jitter if jitter is None else jitter
 
     def decorator(test_func):
         @functools.wraps(test_func)
         def wrapper(*args, **kwargs):
             last_exception = None
+            restarted = False
 
             for attempt in range(max_retries):
                 try:
-                    return test_func(*args, **kwargs)
+                    # 每次尝试单独计时（由 plugins/timing.py 输出）
+                    with timing.timed("retry_attempt", attempt=attempt + 1, test=test_func.__qualname__) as info:
+                        info["outcome"] = "failed"
+                        result = test_func(*args, **kwargs)
+                        info["outcome"] = "passed"
+                    return result
                 except Exception as e:
                     last_exception = e
-                    logger.warning(f"测试失败，尝试 {attempt + 1}/{max_retries}: {str(e)}")
-
-                    if attempt < max_retries - 1:
-                        time.sleep(delay)
-                        # 捕捉到异常之后，可以在这里尝试重启应用
-                        continue
+                    manager = get_app_manager()
+                    kind = classify_failure(e, manager)
+                    logger.warning(f"测试失败（{kind}），尝试 {attempt + 1}/{max_retries}: {str(e)}")
+
+                    if attempt >= max_retries - 1 or kind == "assertion":
+                        break
+                    if kind == "app_down" and restarted:
+                        # 重启过一次仍然挂掉，继续重试只会白白等待
+                        break
+                    if not RETRY_BUDGET.consume():
+                        logger.warning(f"会话重试预算（{RETRY_BUDGET.total} 次）已用完，不再重试")
+                        break
+
+                    if kind == "app_down":
+                        restarted = True
+                        if manager.restart_app().status != AppStatus.RUNNING:
+                            # 重启失败，按启动失败策略处理（skip/fail/xfail）
+                            handle_app_failure(manager, strategy=manager.fail_strategy)
+                            break
+
+                    wait = backoff_delay(attempt, base_delay, max_delay, jitter)
+                    timing.record("retry_backoff", wait, attempt=attempt + 1, kind=kind, test=test_func.__qualname__)
+                    time.sleep(wait)
 
             # 所有重试都失败
             raise last_exception if last_exception else Exception("测试失败")
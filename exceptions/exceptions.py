@@ -1,2 +1,7 @@
 class AppStartupError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class ConfigError(ValueError):
+    """配置文件内容不合法（类型错误、取值越界、缺少必填项等）"""
+    pass
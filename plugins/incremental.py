@@ -0,0 +1,265 @@
+
+"""
+增量测试选择 - 只改了 utils 里的一个辅助函数时，不必把几十秒的浏览器流程全部重跑一遍
+1）记录每条测试依赖的项目文件：测试文件及其静态 import 闭包，加上运行期间实际调用过函数的项目文件
+   （sys.setprofile 只看函数调用事件，按文件名去重）；conftest.py 及其 import 闭包、yaml、pytest.ini 等是所有测试的公共依赖
+2）每条测试的依赖文件内容哈希和结果（是否通过）保存在 pytest 缓存中（.pytest_cache）
+3）下次运行加 --incremental 时只选中：新测试、上次失败的测试、依赖文件有变化的测试；--run-all 仍然全部运行；
+   这次被跳过的测试没有真正运行，保留原记录（没有记录的下次照常选中）
+   只有加了 --incremental / --run-all（或 yaml 中 incremental.enabled）时才记录依赖，平时不挂 profile 钩子
+4）xdist 下依赖随测试报告（user_properties）传回主进程，由主进程统一写缓存；各 worker 读同一份缓存，选中结果一致
+"""
+import ast
+import glob
+import hashlib
+import os
+import sys
+import threading
+from typing import Dict, Optional, Set
+
+import pytest
+
+CACHE_KEY = "rwa/incremental"
+DEPS_PROPERTY = "rwa_deps"
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("incremental", "增量测试选择")
+    group.addoption(
+        "--incremental",
+        action="store_true",
+        default=None,
+        help="只运行受改动影响的测试和上次没有通过的测试（默认取 yaml 中的 incremental.enabled）"
+    )
+    group.addoption(
+        "--run-all",
+        action="store_true",
+        default=False,
+        help="忽略增量选择，运行全部测试（依赖和结果照常记录）"
+    )
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(IncrementalPlugin(config), "rwa-incremental")
+
+
+def file_hash(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def merge_results(records: Dict[str, Dict], results: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    把本次运行的结果合并进历史记录：没运行的测试保留原记录；
+    跳过且没有失败的测试这次没有真正运行，同样保留原记录（例如应用没起来时被跳过，不代表上次的通过/失败失效）
+    """
+    merged = dict(records)
+    for nodeid, result in results.items():
+        if not result["deps"] or (result.get("skipped") and result["passed"]):
+            continue
+        merged[nodeid] = {"passed": result["passed"], "deps": result["deps"]}
+    return merged
+
+
+class IncrementalPlugin:
+    """记录依赖与结果，按改动选择测试"""
+
+    def __init__(self, config):
+        from config.config import get_config
+        self.config = config
+        self.settings = get_config().incremental
+        self.root = str(config.rootpath)
+        enabled = bool(config.getoption("--incremental") or self.settings.enabled)
+        self.selecting = enabled and not config.getoption("--run-all")
+        # 记录依赖要在每次 Python 调用时回调，只在需要增量数据时开启
+        self.recording = enabled or config.getoption("--run-all")
+        self.is_xdist_worker = hasattr(config, "workerinput")
+        cache = getattr(config, "cache", None)
+        self.cache = cache
+        self.records: Dict[str, Dict] = dict(cache.get(CACHE_KEY, {})) if cache else {}
+        self._hashes: Dict[str, Optional[str]] = {}
+        self._closures: Dict[str, Set[str]] = {}
+        self._global_deps: Optional[Set[str]] = None
+        self._touched: Set[str] = set()
+        # 本次运行的结果：nodeid -> {"deps": {文件: 哈希}, "passed": bool, "skipped": bool}
+        self.results: Dict[str, Dict] = {}
+        self.deselected = 0
+
+    # ------------------------------------------------------------ 依赖
+
+    def _rel(self, path: str) -> Optional[str]:
+        """项目内的文件返回相对路径，项目外（标准库、site-packages）返回 None"""
+        path = os.path.abspath(path)
+        if not path.startswith(self.root + os.sep) or "site-packages" in path:
+            return None
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _hash(self, rel_path: str) -> Optional[str]:
+        if rel_path not in self._hashes:
+            self._hashes[rel_path] = file_hash(os.path.join(self.root, rel_path))
+        return self._hashes[rel_path]
+
+    def _resolve_module(self, name: str) -> Optional[str]:
+        parts = name.split(".")
+        base = os.path.join(self.root, *parts)
+        for candidate in (base + ".py", os.path.join(base, "__init__.py")):
+            if os.path.isfile(candidate):
+                return self._rel(candidate)
+        return None
+
+    @staticmethod
+    def _import_time_nodes(tree: ast.AST):
+        """导入模块时会执行的语句节点（跳过函数体）"""
+        pending = [tree]
+        while pending:
+            node = pending.pop()
+            yield node
+            for child in ast.iter_child_nodes(node):
+                if not isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                    pending.append(child)
+
+    def import_closure(self, rel_path: str) -> Set[str]:
+        """文件及其在导入时直接/间接 import 的项目模块（静态分析；函数内的 import 由运行时记录覆盖）"""
+        if rel_path in self._closures:
+            return self._closures[rel_path]
+        closure: Set[str] = set()
+        pending = [rel_path]
+        while pending:
+            current = pending.pop()
+            if current in closure:
+                continue
+            closure.add(current)
+            try:
+                with open(os.path.join(self.root, current), "r", encoding="utf-8") as f:
+                    tree = ast.parse(f.read())
+            except (OSError, SyntaxError, ValueError):
+                continue
+            for node in self._import_time_nodes(tree):
+                names = []
+                if isinstance(node, ast.Import):
+                    names = [alias.name for alias in node.names]
+                elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                    names = [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+                for name in names:
+                    resolved = self._resolve_module(name)
+                    if resolved and resolved not in closure:
+                        pending.append(resolved)
+        self._closures[rel_path] = closure
+        return closure
+
+    def global_deps(self) -> Set[str]:
+        """所有测试共同依赖的文件：conftest.py 及其 import 闭包，加上 yaml 中 incremental.global_files 匹配的文件"""
+        if self._global_deps is not None:
+            return self._global_deps
+        deps: Set[str] = set()
+        for pattern in self.settings.global_files:
+            for path in glob.glob(os.path.join(self.root, pattern), recursive=True):
+                rel_path = self._rel(path)
+                if rel_path:
+                    deps |= self.import_closure(rel_path) if rel_path.endswith(".py") else {rel_path}
+        self._global_deps = deps
+        return deps
+
+    # ------------------------------------------------------------ 选择
+
+    def is_affected(self, nodeid: str, global_hashes: Dict[str, Optional[str]]) -> bool:
+        record = self.records.get(nodeid)
+        if not record or not record.get("passed"):
+            return True
+        recorded = record.get("deps", {})
+        if any(recorded.get(path) != digest for path, digest in global_hashes.items()):
+            return True
+        return any(self._hash(path) != digest for path, digest in recorded.items())
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_collection_modifyitems(self, session, config, items):
+        """在其他插件（标记、-k/-m 筛选、调度分组）之前先去掉不受影响的测试"""
+        if self.selecting and self.records:
+            global_hashes = {path: self._hash(path) for path in self.global_deps()}
+            selected, deselected = [], []
+            for item in items:
+                (selected if self.is_affected(item.nodeid, global_hashes) else deselected).append(item)
+            if deselected:
+                config.hook.pytest_deselected(items=deselected)
+                items[:] = selected
+                self.deselected = len(deselected)
+        yield
+
+    # ------------------------------------------------------------ 记录
+
+    def _profiler(self, previous):
+        """记录调用事件的 profile 函数；原来已经装了 profiler 时继续转发给它"""
+        touched = self._touched
+
+        def profile(frame, event, arg):
+            if event == "call":
+                touched.add(frame.f_code.co_filename)
+            if previous is not None:
+                previous(frame, event, arg)
+        return profile
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        if not self.recording:
+            yield
+            return
+        self._touched = set()
+        previous = sys.getprofile()
+        # threading.getprofile 从 Python 3.10 开始才有
+        previous_thread = threading.getprofile() if hasattr(threading, "getprofile") \
+            else getattr(threading, "_profile_hook", None)
+        sys.setprofile(self._profiler(previous))
+        threading.setprofile(self._profiler(previous_thread))
+        try:
+            yield
+        finally:
+            sys.setprofile(previous)
+            threading.setprofile(previous_thread)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        if not self.recording or report.when != "teardown":
+            return
+        # 测试文件及其 import 闭包 + 运行期间实际调用过的项目文件
+        test_file = self._rel(str(item.path))
+        deps = set(self.import_closure(test_file)) if test_file else set()
+        for filename in list(self._touched):
+            rel_path = self._rel(filename)
+            if rel_path:
+                deps.add(rel_path)
+        deps |= self.global_deps()
+        report.user_properties.append((DEPS_PROPERTY, {path: self._hash(path) for path in sorted(deps)}))
+
+    def pytest_runtest_logreport(self, report):
+        if not self.recording:
+            return
+        nodeid = report.nodeid.split("@", 1)[0]
+        result = self.results.setdefault(nodeid, {"passed": True, "skipped": False, "deps": {}})
+        if report.failed:
+            result["passed"] = False
+        elif report.skipped:
+            result["skipped"] = True
+        for name, value in report.user_properties:
+            if name == DEPS_PROPERTY:
+                result["deps"] = value
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        """主进程把本次运行过的测试的依赖和结果写回缓存，没运行的测试保留原记录"""
+        if self.deselected and exitstatus == pytest.ExitCode.NO_TESTS_COLLECTED:
+            # 没有受影响的测试不算失败
+            session.exitstatus = pytest.ExitCode.OK
+        if self.is_xdist_worker or self.cache is None or not self.results:
+            return
+        self.cache.set(CACHE_KEY, merge_results(self.records, self.results))
+
+    def pytest_report_collectionfinish(self, config, start_path, items):
+        if self.selecting and not self.is_xdist_worker:
+            if not self.records:
+                return "增量选择: 没有历史记录，运行全部测试"
+            return f"增量选择: 运行 {len(items)} 条受影响的测试，跳过 {self.deselected} 条未受影响的测试"
+        return None
@@ -0,0 +1,158 @@
+
+"""
+按历史耗时调度 - 让并行运行的各个 worker 尽量同时结束
+1）每次运行结束后把每条测试的耗时（setup + call + teardown）按指数平滑写入 pytest 缓存（.pytest_cache）
+2）pytest-xdist 并行时，每个 worker 在收集阶段用同一份历史耗时做 LPT（最长处理时间优先）分组：
+   按预估耗时从长到短，每条测试放进当前总耗时最小的组，再打上 xdist_group 标记，由 --dist loadgroup 按组分给 worker
+   没有历史耗时的新测试按已有耗时的中位数估算（完全没有历史时用 yaml 中的 scheduling.default_duration）
+3）会话结束时对比预测的 makespan（最慢一组的预估总耗时）和实际的 makespan（最忙 worker 的实际总耗时）
+
+启用：pytest tests/ -n 4（yaml 中 scheduling.mode 为 lpt 时自动改为 --dist loadgroup）；--schedule none 关闭
+"""
+import statistics
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import pytest
+
+CACHE_KEY = "rwa/durations"
+GROUP_PREFIX = "lpt"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--schedule",
+        action="store",
+        default=None,
+        choices=["lpt", "none"],
+        help="并行时按历史耗时分组调度（默认取 yaml 中的 scheduling.mode）"
+    )
+
+
+def _mode(config) -> str:
+    from config.config import get_config
+    return config.getoption("--schedule") or get_config().scheduling.mode
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_cmdline_main(config):
+    """在 xdist 处理 --dist 之前，把默认的 load 分发方式换成按组分发的 loadgroup"""
+    numprocesses = getattr(config.option, "numprocesses", None)
+    if numprocesses and _mode(config) == "lpt" and getattr(config.option, "dist", "no") in ("no", "load"):
+        config.option.dist = "loadgroup"
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(SchedulingPlugin(config), "rwa-scheduling")
+
+
+def base_nodeid(nodeid: str) -> str:
+    """去掉 loadgroup 加在 nodeid 后面的 @分组名"""
+    return nodeid.split("@", 1)[0]
+
+
+def lpt_groups(estimates: Dict[str, float], workers: int) -> Dict[str, int]:
+    """
+    LPT 分组：按预估耗时从长到短，依次放进当前总耗时最小的组
+    :param estimates: nodeid -> 预估耗时（秒）
+    :param workers: 组数（worker 数）
+    :return: nodeid -> 组号；相同输入在每个 worker 上得到相同结果
+    """
+    loads = [0.0] * workers
+    assignment = {}
+    for nodeid, duration in sorted(estimates.items(), key=lambda kv: (-kv[1], kv[0])):
+        group = min(range(workers), key=lambda i: (loads[i], i))
+        assignment[nodeid] = group
+        loads[group] += duration
+    return assignment
+
+
+class SchedulingPlugin:
+    """读取/更新历史耗时，在 worker 上分组，在主进程上汇总预测与实际的 makespan"""
+
+    def __init__(self, config):
+        from config.config import get_config
+        self.config = config
+        self.settings = get_config().scheduling
+        self.enabled = _mode(config) == "lpt"
+        self.is_xdist_worker = hasattr(config, "workerinput")
+        cache = getattr(config, "cache", None)
+        self.history: Dict[str, float] = dict(cache.get(CACHE_KEY, {})) if cache else {}
+        self.default_estimate = (statistics.median(self.history.values()) if self.history
+                                 else self.settings.default_duration)
+        # 本次运行：nodeid -> 实际耗时、所在 worker、是否跳过
+        self.actual: Dict[str, float] = defaultdict(float)
+        self.worker_of: Dict[str, str] = {}
+        self.skipped: set = set()
+        self.groups: Dict[str, str] = {}
+        self.session_start = time.perf_counter()
+
+    def estimate(self, nodeid: str) -> float:
+        return self.history.get(nodeid, self.default_estimate)
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collection_modifyitems(self, config, items):
+        """xdist worker 上给每条测试打 LPT 分组标记（必须在 xdist 给 nodeid 加 @分组名之前执行）"""
+        if not (self.enabled and self.is_xdist_worker):
+            return
+        workers = config.workerinput.get("workercount", 1)
+        candidates = [item for item in items if not item.get_closest_marker("xdist_group")]
+        assignment = lpt_groups({item.nodeid: self.estimate(item.nodeid) for item in candidates}, workers)
+        for item in candidates:
+            item.add_marker(pytest.mark.xdist_group(name=f"{GROUP_PREFIX}{assignment[item.nodeid]}"))
+
+    def pytest_runtest_logreport(self, report):
+        nodeid = base_nodeid(report.nodeid)
+        self.actual[nodeid] += report.duration
+        if "@" in report.nodeid:
+            self.groups[nodeid] = report.nodeid.split("@", 1)[1]
+        node = getattr(report, "node", None)
+        self.worker_of[nodeid] = node.gateway.id if node is not None else "master"
+        if report.skipped:
+            self.skipped.add(nodeid)
+
+    def pytest_sessionfinish(self, session):
+        """主进程（或单进程运行）把本次耗时按指数平滑写回缓存；跳过的测试耗时没有参考价值，不更新"""
+        cache = getattr(self.config, "cache", None)
+        if self.is_xdist_worker or cache is None or not self.actual:
+            return
+        alpha = self.settings.smoothing
+        history = dict(self.history)
+        for nodeid, duration in self.actual.items():
+            if nodeid in self.skipped:
+                continue
+            previous = history.get(nodeid)
+            history[nodeid] = round(duration if previous is None else alpha * duration + (1 - alpha) * previous, 3)
+        cache.set(CACHE_KEY, history)
+
+    def parallel(self) -> bool:
+        """本次运行是否并行（启用了 xdist 且 -n 大于 0），或者确实有测试被分了组"""
+        numprocesses = getattr(self.config.option, "numprocesses", None)
+        return bool(self.groups) or bool(self.config.pluginmanager.hasplugin("xdist") and numprocesses)
+
+    def makespan_report(self) -> Optional[List[str]]:
+        """makespan 只对并行运行有意义，串行运行不输出"""
+        if self.is_xdist_worker or not self.actual or not self.parallel():
+            return None
+        busy: Dict[str, float] = defaultdict(float)
+        for nodeid, duration in self.actual.items():
+            busy[self.worker_of.get(nodeid, "master")] += duration
+        lines = [f"实际 makespan（最忙 worker）: {max(busy.values()):.1f}s，"
+                 f"墙钟 {time.perf_counter() - self.session_start:.1f}s，"
+                 f"各 worker: " + ", ".join(f"{w} {t:.1f}s" for w, t in sorted(busy.items()))]
+        if self.groups:
+            predicted: Dict[str, float] = defaultdict(float)
+            for nodeid, group in self.groups.items():
+                predicted[group] += self.estimate(nodeid)
+            unknown = sum(1 for nodeid in self.groups if nodeid not in self.history)
+            lines.insert(0, f"预测 makespan（LPT 最慢一组）: {max(predicted.values()):.1f}s，"
+                            f"{len(predicted)} 组，{unknown} 条测试没有历史耗时（按 {self.default_estimate:.1f}s 估算）")
+        return lines
+
+    def pytest_terminal_summary(self, terminalreporter):
+        lines = self.makespan_report()
+        if lines:
+            terminalreporter.write_sep("-", "调度")
+            for line in lines:
+                terminalreporter.write_line(line)
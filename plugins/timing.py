@@ -0,0 +1,192 @@
+
+"""
+阶段耗时插件 - 记录每条测试各阶段的耗时，输出为 JSONL，并提供两次运行的对比命令
+1）记录的阶段：fixture 初始化（含 app_manager 启动）、setup/call/teardown、conftest 的应用检查、
+BaseTest.setUp、AppManager 每次启动尝试、retry_on_app_failure 每次尝试
+2）每个事件一行 JSON：nodeid、worker、phase、duration、ts 以及附加字段；后台线程（后台启动、健康监控等）
+   记录的事件 nodeid 为空，归到会话，不算在当时正在运行的测试上
+3）xdist 下每个 worker 先写自己的分片文件，会话结束时由主进程合并
+
+启用：pytest tests/ --timing-output=timing.jsonl（或 yaml 中的 timing.output）
+对比：python -m plugins.timing compare base.jsonl new.jsonl --threshold 0.2
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Optional, Dict, List, Any
+
+import pytest
+
+from utils import timing
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--timing-output",
+        action="store",
+        default=None,
+        help="各阶段耗时输出的 JSONL 文件路径（默认取 yaml 中的 timing.output，为空则不记录）"
+    )
+
+
+def pytest_configure(config):
+    from config.config import get_config
+    output = config.getoption("--timing-output") or get_config().timing.output
+    if output:
+        config.pluginmanager.register(TimingPlugin(output, config), "rwa-timing")
+
+
+class TimingPlugin:
+    """按测试收集阶段耗时并写入 JSONL"""
+
+    def __init__(self, output: str, config):
+        self.config = config
+        self.worker = os.environ.get("PYTEST_XDIST_WORKER", "master")
+        self.is_xdist_worker = hasattr(config, "workerinput")
+        self.output = os.path.abspath(output)
+        # xdist worker 写分片文件，避免多个进程同时追加同一个文件
+        self.path = f"{self.output}.{self.worker}.part" if self.is_xdist_worker else self.output
+        self.current_nodeid: Optional[str] = None
+        self.session_start = time.perf_counter()
+        timing.enable()
+        if not self.is_xdist_worker:
+            for part in glob.glob(f"{self.output}.*.part"):
+                os.remove(part)
+            open(self.output, "w").close()
+
+    def _write(self, events: List[Dict[str, Any]]) -> None:
+        """事件的 nodeid 在记录时已经确定（后台线程的事件为 None，归到会话）"""
+        if not events:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for event in events:
+                event["worker"] = self.worker
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self.current_nodeid = item.nodeid
+        # 上一条测试结束后到现在记录的事件（收集阶段、后台线程）先写出去
+        self._write(timing.drain())
+        start_time = time.perf_counter()
+        with timing.attribute_to(item.nodeid):
+            yield
+            timing.record("test_total", time.perf_counter() - start_time)
+        self._write(timing.drain())
+        self.current_nodeid = None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_setup(self, item):
+        start_time = time.perf_counter()
+        yield
+        timing.record("setup", time.perf_counter() - start_time)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        start_time = time.perf_counter()
+        yield
+        timing.record("call", time.perf_counter() - start_time)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_teardown(self, item, nextitem):
+        start_time = time.perf_counter()
+        yield
+        timing.record("teardown", time.perf_counter() - start_time)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        start_time = time.perf_counter()
+        yield
+        timing.record("fixture_setup", time.perf_counter() - start_time,
+                      fixture=fixturedef.argname, scope=fixturedef.scope)
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_sessionfinish(self, session):
+        timing.record("session_total", time.perf_counter() - self.session_start)
+        self._write(timing.drain())
+        if self.is_xdist_worker:
+            return
+        # 主进程合并 worker 分片（所有 worker 都已结束）
+        parts = sorted(glob.glob(f"{self.output}.*.part"))
+        if parts:
+            with open(self.output, "a", encoding="utf-8") as out:
+                for part in parts:
+                    with open(part, "r", encoding="utf-8") as f:
+                        out.write(f.read())
+                    os.remove(part)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        terminalreporter.write_line(f"阶段耗时已写入: {self.output}")
+
+
+def load_phase_totals(path: str) -> Dict[str, Dict[str, float]]:
+    """读取 JSONL，按阶段汇总：次数、总耗时、平均耗时"""
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "total": 0.0})
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            phase = event["phase"]
+            if phase == "fixture_setup":
+                phase = f"fixture_setup[{event.get('fixture')}]"
+            totals[phase]["count"] += 1
+            totals[phase]["total"] += event["duration"]
+    for stats in totals.values():
+        stats["mean"] = stats["total"] / stats["count"]
+    return dict(totals)
+
+
+def compare(base_path: str, new_path: str, threshold: float = 0.2, min_delta: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    对比两次运行，返回退化的阶段
+    :param threshold: 平均耗时增长超过该比例视为退化
+    :param min_delta: 平均耗时增长的绝对值低于该值（秒）时忽略，避免毫秒级抖动误报
+    """
+    base = load_phase_totals(base_path)
+    new = load_phase_totals(new_path)
+    regressions = []
+    for phase, new_stats in sorted(new.items()):
+        base_stats = base.get(phase)
+        if not base_stats:
+            continue
+        delta = new_stats["mean"] - base_stats["mean"]
+        ratio = delta / base_stats["mean"] if base_stats["mean"] else float("inf")
+        if delta >= min_delta and ratio > threshold:
+            regressions.append({"phase": phase, "base_mean": base_stats["mean"],
+                                "new_mean": new_stats["mean"], "ratio": ratio})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="对比两次运行的阶段耗时")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare_parser = subparsers.add_parser("compare", help="对比两个 JSONL 文件，找出退化的阶段")
+    compare_parser.add_argument("base", help="基准运行的 JSONL")
+    compare_parser.add_argument("new", help="本次运行的 JSONL")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="平均耗时增长比例阈值（默认 0.2）")
+    compare_parser.add_argument("--min-delta", type=float, default=0.05, help="平均耗时增长的最小绝对值（秒）")
+    args = parser.parse_args(argv)
+
+    base = load_phase_totals(args.base)
+    new = load_phase_totals(args.new)
+    print(f"{'阶段':<40}{'基准平均(s)':>14}{'本次平均(s)':>14}{'变化':>10}")
+    for phase in sorted(set(base) | set(new)):
+        base_mean = base.get(phase, {}).get("mean")
+        new_mean = new.get(phase, {}).get("mean")
+        change = f"{(new_mean - base_mean) / base_mean:+.1%}" if base_mean and new_mean is not None else "-"
+        print(f"{phase:<40}{base_mean if base_mean is not None else '-':>14.6}"
+              f"{new_mean if new_mean is not None else '-':>14.6}{change:>10}")
+
+    regressions = compare(args.base, args.new, args.threshold, args.min_delta)
+    for item in regressions:
+        print(f"退化: {item['phase']} {item['base_mean']:.3f}s -> {item['new_mean']:.3f}s ({item['ratio']:+.1%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+接口压测统计（utils/api_load.py）的单元测试：分位数、步骤统计、报告格式和版本对比
+"""
+import pytest
+
+from config.config import ConfigError
+from utils.api_load import LoadRunner, StepStats, compare, format_report, load_settings, main, percentile
+
+
+def _step(p95, error_rate=0.0):
+    return {"requests": 10, "errors": 0, "error_rate": error_rate, "throughput": 1.0,
+            "latency_ms": {"p50": p95, "p95": p95, "p99": p95, "max": p95}, "error_types": {}}
+
+
+class PercentileTest:
+    """最近秩法"""
+
+    @pytest.mark.parametrize("pct, expected", [(50, 5), (90, 9), (95, 10), (99, 10), (100, 10), (1, 1), (0, 1)])
+    def test_nearest_rank(self, pct, expected):
+        assert percentile(list(range(10, 0, -1)), pct) == expected
+
+    def test_single_value(self):
+        assert percentile([0.3], 99) == 0.3
+
+    def test_empty(self):
+        assert percentile([], 50) is None
+
+
+class StepStatsTest:
+    """成功请求记延迟，失败请求按原因计数"""
+
+    def test_report(self):
+        stats = StepStats("login")
+        for duration in (0.1, 0.2, 0.3, 0.4):
+            stats.add(duration)
+        stats.add(1.0, error="HTTP 500")
+        report = stats.report(elapsed=2.0)
+        assert report["requests"] == 5
+        assert report["errors"] == 1
+        assert report["error_rate"] == pytest.approx(0.2)
+        # 吞吐只算成功的请求
+        assert report["throughput"] == pytest.approx(2.0)
+        assert report["latency_ms"]["p50"] == pytest.approx(200)
+        assert report["latency_ms"]["max"] == pytest.approx(400)
+        assert report["error_types"] == {"HTTP 500": 1}
+
+    def test_report_without_requests(self):
+        report = StepStats("logout").report(elapsed=0)
+        assert report["requests"] == 0
+        assert report["error_rate"] == 0.0
+        assert report["throughput"] == 0.0
+        assert report["latency_ms"] == {"p50": None, "p95": None, "p99": None, "max": None}
+
+
+class CompareTest:
+    """p95 同时超过比例阈值和绝对阈值才算退化；错误率上升即算退化"""
+
+    def test_p95_regression(self):
+        regressions = compare({"steps": {"login": _step(100)}}, {"steps": {"login": _step(130)}}, threshold=0.2)
+        assert regressions == [{"step": "login", "metric": "p95", "base": 100, "new": 130}]
+
+    def test_small_absolute_change_ignored(self):
+        # 增长 50% 但只有 2ms
+        assert compare({"steps": {"login": _step(4)}}, {"steps": {"login": _step(6)}}, min_delta=5) == []
+
+    def test_within_threshold(self):
+        assert compare({"steps": {"login": _step(100)}}, {"steps": {"login": _step(115)}}, threshold=0.2) == []
+
+    def test_error_rate_increase(self):
+        regressions = compare({"steps": {"register": _step(100)}},
+                              {"steps": {"register": _step(100, error_rate=0.1)}})
+        assert regressions == [{"step": "register", "metric": "error_rate", "base": 0.0, "new": 0.1}]
+
+    def test_missing_latency_and_new_steps(self):
+        base = {"steps": {"login": _step(None)}}
+        new = {"steps": {"login": _step(200), "logout": _step(500)}}
+        assert compare(base, new) == []
+
+
+class FormatReportTest:
+    def test_lines(self):
+        stats = StepStats("login")
+        stats.add(0.05)
+        stats.add(0.0, error="timeout")
+        report = {"api_url": "http://localhost:3001", "label": "v1", "users": 2, "flows": 2, "failed_flows": 1,
+                  "elapsed": 1.0, "flow_throughput": 1.0,
+                  "steps": {"login": stats.report(1.0), "logout": StepStats("logout").report(1.0)}}
+        lines = format_report(report)
+        assert "http://localhost:3001（v1）" in lines[0]
+        assert lines[2].startswith("login") and "50.0" in lines[2] and "50.0%" in lines[2]
+        assert lines[3] == "  错误: timeout x1"
+        # 没有成功请求的步骤延迟显示为 -
+        assert lines[4].startswith("logout") and lines[4].count("-") == 3
+
+
+class LoadSettingsTest:
+    def test_overrides_and_none_ignored(self):
+        load = load_settings(users=3, iterations=None, ramp_up=0.5)
+        assert load.users == 3 and load.ramp_up == 0.5
+        runner = LoadRunner.from_config("http://localhost:3001", users=3, iterations=2)
+        assert (runner.users, runner.iterations) == (3, 2)
+
+    @pytest.mark.parametrize("overrides", [
+        {"users": 0}, {"users": -1}, {"iterations": -1}, {"duration": -5}, {"ramp_up": -1}, {"think_time": -0.5},
+    ])
+    def test_rejects_invalid(self, overrides):
+        with pytest.raises(ConfigError):
+            load_settings(**overrides)
+        with pytest.raises(ConfigError):
+            LoadRunner.from_config("http://localhost:3001", **overrides)
+
+    def test_cli_reports_invalid_users(self, capsys):
+        """不合法的命令行参数在启动应用之前就报错退出，不会走到 ThreadPoolExecutor(max_workers=0)"""
+        with pytest.raises(SystemExit) as excinfo:
+            main(["run", "--users", "0", "--api-url", "http://localhost:3001"])
+        assert excinfo.value.code == 2
+        assert "load.users 必须大于 0" in capsys.readouterr().err
@@ -0,0 +1,107 @@
+"""
+类型化配置（config/config.py _build/_convert）的单元测试：默认值、类型转换、未知字段和校验错误
+"""
+from typing import Dict, List, Optional, Union
+
+import pytest
+
+from config.config import (AppConfig, ConfigError, DatabaseConfig, LoadConfig, RetryConfig, ServiceConfig,
+                           _build, _convert)
+
+
+class ConvertTest:
+    @pytest.mark.parametrize("value, tp, expected", [
+        (3, float, 3.0),
+        (2.5, float, 2.5),
+        (True, bool, True),
+        (5, int, 5),
+        ("x", str, "x"),
+        (None, Optional[int], None),
+        (7, Optional[int], 7),
+        (["a", "b"], Union[List[str], str], ["a", "b"]),
+        ("yarn dev", Union[List[str], str], "yarn dev"),
+        ([1, 2], List[float], [1.0, 2.0]),
+        ({"A": "1"}, Dict[str, str], {"A": "1"}),
+        ({"/": {"lcp": 2500}}, Dict[str, Dict[str, float]], {"/": {"lcp": 2500.0}}),
+    ])
+    def test_converts(self, value, tp, expected):
+        result = _convert("x", value, tp)
+        assert result == expected and type(result) is type(expected)
+
+    @pytest.mark.parametrize("value, tp", [
+        (True, int),  # bool 不能当成数字
+        (True, float),
+        ("1", int),
+        (1, str),
+        (1, bool),
+        ("a", List[str]),
+        ([1], Dict[str, str]),
+        ({"PORT": 3000}, Dict[str, str]),
+        ({1: "a"}, Dict[str, str]),
+        ({"/": {"lcp": "fast"}}, Dict[str, Dict[str, float]]),
+        ({"a": 1}, Union[List[str], str]),
+    ])
+    def test_rejects(self, value, tp):
+        with pytest.raises(ConfigError):
+            _convert("x", value, tp)
+
+    def test_list_item_path_in_message(self):
+        with pytest.raises(ConfigError, match=r"perf\.metrics\[1\]"):
+            _convert("perf.metrics", ["lcp", 3], List[str])
+
+    def test_dict_value_path_in_message(self):
+        with pytest.raises(ConfigError, match=r"app\.instances\.env\.PORT"):
+            _convert("app.instances.env", {"PORT": 3000}, Dict[str, str])
+
+
+class BuildTest:
+    def test_defaults(self):
+        assert _build(RetryConfig, None, "retry") == RetryConfig()
+        assert _build(RetryConfig, {}, "retry") == RetryConfig()
+
+    def test_overrides_and_int_to_float(self):
+        retry = _build(RetryConfig, {"base_delay": 2, "budget": 5}, "retry")
+        assert retry.base_delay == 2.0 and isinstance(retry.base_delay, float)
+        assert retry.budget == 5
+
+    def test_unknown_field(self):
+        with pytest.raises(ConfigError, match=r"retry 中有未知配置项: \['retries'\]"):
+            _build(RetryConfig, {"retries": 3}, "retry")
+
+    def test_not_a_dict(self):
+        with pytest.raises(ConfigError, match="retry 应为字典"):
+            _build(RetryConfig, ["base_delay"], "retry")
+
+    def test_wrong_type_names_the_field(self):
+        with pytest.raises(ConfigError, match=r"load\.users 应为 int"):
+            _build(LoadConfig, {"users": "10"}, "load")
+
+    def test_validate_called(self):
+        with pytest.raises(ConfigError, match="retry.jitter"):
+            _build(RetryConfig, {"jitter": 1.5}, "retry")
+        with pytest.raises(ConfigError, match="load.users 必须大于 0"):
+            _build(LoadConfig, {"users": 0}, "load")
+
+    def test_missing_required(self):
+        with pytest.raises(ConfigError, match="缺少必填项"):
+            _build(ServiceConfig, {"command": "yarn dev"}, "app.services[0]")
+
+    def test_nested_sections(self):
+        app = _build(AppConfig, {
+            "dir": "../cypress-realworld-app",
+            "services": [{"name": "api", "command": ["yarn", "start:api"], "port": 3001}],
+            "database": {"file": "data/database.json", "reseed_endpoint": "/testData/seed", "reseed_payload": True},
+        }, "app")
+        assert app.services == [ServiceConfig(name="api", command=["yarn", "start:api"], port=3001)]
+        assert app.database.reseed_payload is True
+        assert app.startup_timeout == 30.0
+
+    def test_nested_error_path(self):
+        with pytest.raises(ConfigError, match=r"app\.database\.isolation"):
+            _build(AppConfig, {"dir": ".", "database": {"isolation": "module"}}, "app")
+
+    def test_database_requires_reseed(self):
+        with pytest.raises(ConfigError, match="reseed_endpoint"):
+            _build(DatabaseConfig, {"file": "data/database.json"}, "app.database")
+        with pytest.raises(ConfigError, match="seed_file"):
+            _build(DatabaseConfig, {"file": "data/database.json", "reseed_endpoint": "/seed"}, "app.database")
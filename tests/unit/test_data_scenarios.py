@@ -0,0 +1,100 @@
+"""
+数据场景定义（utils/test_data.py normalize_scenario / scenario_hash）的单元测试，不调用接口
+"""
+import pytest
+
+from config.config import ConfigError
+from utils.test_data import normalize_scenario, scenario_hash
+
+
+def _spec(**extra):
+    spec = {"users": {"sender": {"bank_accounts": 1}, "friends": {"count": 3, "bank_accounts": 1}}}
+    spec.update(extra)
+    return spec
+
+
+class NormalizeScenarioTest:
+    def test_defaults(self):
+        scenario = normalize_scenario("s", {"users": {"member": None}})
+        assert scenario == {"users": {"member": {"count": 1, "bank_accounts": 0, "settings": {}}},
+                            "contacts": [], "transactions": []}
+
+    def test_transaction_defaults(self):
+        scenario = normalize_scenario("s", _spec(transactions=[{"from": "sender", "to": "friends", "amount": 5}]))
+        assert scenario["transactions"] == [{"from": "sender", "to": "friends", "type": "payment", "amount": 5,
+                                             "count": 1, "description": "", "privacy": None}]
+
+    def test_contact_aliases_normalized_to_lists(self):
+        spec = _spec(contacts=[{"user": "sender", "contacts": "friends"},
+                               {"user": ["sender", "friends"], "contacts": ["sender", "friends"]}])
+        assert normalize_scenario("s", spec)["contacts"] == [
+            {"user": ["sender"], "contacts": ["friends"]},
+            {"user": ["sender", "friends"], "contacts": ["sender", "friends"]},
+        ]
+
+    def test_equivalent_specs_hash_equal(self):
+        """写法不同但含义相同（省略默认值、单个别名不写成列表）的定义哈希一致"""
+        short = _spec(contacts=[{"user": "sender", "contacts": "friends"}],
+                      transactions=[{"from": "sender", "to": "friends", "amount": 5}])
+        full = {"users": {"friends": {"count": 3, "bank_accounts": 1, "settings": {}},
+                          "sender": {"count": 1, "bank_accounts": 1}},
+                "contacts": [{"user": ["sender"], "contacts": ["friends"]}],
+                "transactions": [{"from": "sender", "to": "friends", "amount": 5, "type": "payment", "count": 1}]}
+        assert scenario_hash(normalize_scenario("a", short)) == scenario_hash(normalize_scenario("b", full))
+        changed = _spec(transactions=[{"from": "sender", "to": "friends", "amount": 6}])
+        assert scenario_hash(normalize_scenario("a", short)) != scenario_hash(normalize_scenario("a", changed))
+
+    @pytest.mark.parametrize("spec, message", [
+        ("users", "只支持"),
+        ({"users": {"a": {}}, "extra": 1}, "只支持"),
+        ({}, "至少需要一个用户"),
+        ({"users": ["a"]}, "users 必须是"),
+        ({"users": {"a": "x"}}, "users.a 必须是"),
+        ({"users": {"a": 3}}, "users.a 必须是"),
+        ({"users": {"a": {"age": 3}}}, "未知字段"),
+        ({"users": {"a": {"count": 0}}}, "count 必须大于 0"),
+        ({"users": {"a": {"bank_accounts": -1}}}, "bank_accounts 不能为负数"),
+        ({"users": {"a": {"count": "abc"}}}, r"users\.a\.count 必须是整数"),
+        ({"users": {"a": {"count": 2.7}}}, r"users\.a\.count 必须是整数"),
+        ({"users": {"a": {"count": True}}}, r"users\.a\.count 必须是整数"),
+        ({"users": {"a": {"bank_accounts": "abc"}}}, r"users\.a\.bank_accounts 必须是整数"),
+        ({"users": {"a": {"bank_accounts": 1.5}}}, r"users\.a\.bank_accounts 必须是整数"),
+        ({"users": {"a": {"bank_accounts": False}}}, r"users\.a\.bank_accounts 必须是整数"),
+        (_spec(contacts=[{"user": "nobody", "contacts": "friends"}]), "contacts.user 引用了未定义的用户 'nobody'"),
+        (_spec(contacts=[{"user": ["sender", "nobody"], "contacts": "friends"}]), "nobody"),
+        (_spec(contacts="sender"), "contacts 必须是字典列表"),
+        (_spec(transactions=[{"from": ["sender", "friends"], "to": "friends", "amount": 1}]),
+         "transactions.from 只能是一个别名"),
+        (_spec(transactions=[{"from": "sender", "to": "friends", "amount": 0}]), "amount 必须是正数"),
+        (_spec(transactions=[{"from": "sender", "to": "friends", "amount": True}]), "amount 必须是正数"),
+        (_spec(transactions=[{"from": "sender", "to": "friends", "amount": 1, "type": "refund"}]), "type"),
+        (_spec(transactions=[{"from": "sender", "to": "friends", "amount": 1, "privacy": "secret"}]), "privacy"),
+        (_spec(transactions=[{"from": "sender", "to": "friends", "amount": 1, "count": 0}]), "count 必须大于 0"),
+        (_spec(transactions=[{"from": "sender", "to": "friends", "amount": 1, "count": "abc"}]),
+         r"transactions\.count 必须是整数"),
+        (_spec(transactions=[{"from": "sender", "to": "friends", "amount": 1, "count": 2.7}]),
+         r"transactions\.count 必须是整数"),
+        (_spec(transactions=[{"from": "sender", "to": "friends", "amount": 1, "count": True}]),
+         r"transactions\.count 必须是整数"),
+        (_spec(transactions=[{"from": "sender", "to": "sender", "amount": 1}]), "不能给自己发起交易"),
+        ({"users": {"a": {}, "b": {"bank_accounts": 1}}, "transactions": [{"from": "a", "to": "b", "amount": 1}]},
+         "发起人 a 至少需要一个银行账户"),
+    ])
+    def test_invalid(self, spec, message):
+        with pytest.raises(ConfigError, match=message) as excinfo:
+            normalize_scenario("bad", spec)
+        assert str(excinfo.value).startswith("数据场景 bad:")
+        # ConfigError 是 ValueError 的子类，调用方按 ValueError 捕获同样有效
+        assert isinstance(excinfo.value, ValueError)
+
+    def test_same_group_transactions_need_two_users(self):
+        spec = _spec(transactions=[{"from": "friends", "to": "friends", "amount": 1}])
+        assert normalize_scenario("s", spec)["transactions"][0]["to"] == "friends"
+
+    def test_project_scenarios_valid(self):
+        """yaml/data_scenarios.yaml 中的场景都能通过校验"""
+        from config.config import get_config, load_yaml
+        config = get_config()
+        scenarios = load_yaml(config.resolve_path(config.data_factory.scenario_file))["scenarios"]
+        for name, spec in scenarios.items():
+            normalize_scenario(name, spec)
@@ -0,0 +1,126 @@
+"""
+增量测试选择（plugins/incremental.py）的单元测试：依赖闭包、受影响判断、结果合并
+"""
+import pytest
+
+from plugins.incremental import IncrementalPlugin, file_hash, merge_results
+
+
+class _Config:
+    """IncrementalPlugin 只用到的 pytest config 部分"""
+
+    def __init__(self, root, records=None, **options):
+        self.rootpath = root
+        self.options = {"--incremental": True, "--run-all": False, **options}
+        self.cache = _Cache(records or {})
+
+    def getoption(self, name):
+        return self.options[name]
+
+
+class _Cache:
+    def __init__(self, records):
+        self.data = {"rwa/incremental": records}
+
+    def get(self, key, default):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+
+@pytest.fixture
+def project(tmp_path):
+    """tests/test_a.py -> helpers/util.py -> helpers/deep.py；函数内的 import 不算静态依赖"""
+    (tmp_path / "helpers").mkdir()
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "helpers" / "__init__.py").write_text("")
+    (tmp_path / "helpers" / "deep.py").write_text("VALUE = 1\n")
+    (tmp_path / "helpers" / "util.py").write_text("from helpers import deep\n")
+    (tmp_path / "helpers" / "lazy.py").write_text("VALUE = 2\n")
+    (tmp_path / "tests" / "test_a.py").write_text(
+        "import os\nfrom helpers.util import deep\n\ndef test_x():\n    import helpers.lazy\n")
+    return tmp_path
+
+
+def _plugin(root, records=None, **options):
+    plugin = IncrementalPlugin(_Config(root, records, **options))
+    plugin._global_deps = set()
+    return plugin
+
+
+def _deps(root, *paths):
+    return {path: file_hash(str(root / path)) for path in paths}
+
+
+class ImportClosureTest:
+    def test_static_imports_only(self, project):
+        closure = _plugin(project).import_closure("tests/test_a.py")
+        assert closure == {"tests/test_a.py", "helpers/util.py", "helpers/__init__.py", "helpers/deep.py"}
+
+
+class IsAffectedTest:
+    """新测试、上次失败的测试、依赖有变化的测试会被选中"""
+
+    def test_new_test(self, project):
+        assert _plugin(project).is_affected("tests/test_a.py::test_x", {})
+
+    def test_previously_failed(self, project):
+        records = {"t": {"passed": False, "deps": _deps(project, "helpers/deep.py")}}
+        assert _plugin(project, records).is_affected("t", {})
+
+    def test_unchanged_deps(self, project):
+        records = {"t": {"passed": True, "deps": _deps(project, "helpers/deep.py", "tests/test_a.py")}}
+        assert not _plugin(project, records).is_affected("t", {})
+
+    def test_changed_dep(self, project):
+        records = {"t": {"passed": True, "deps": _deps(project, "helpers/deep.py")}}
+        (project / "helpers" / "deep.py").write_text("VALUE = 3\n")
+        assert _plugin(project, records).is_affected("t", {})
+
+    def test_deleted_dep(self, project):
+        records = {"t": {"passed": True, "deps": _deps(project, "helpers/lazy.py")}}
+        (project / "helpers" / "lazy.py").unlink()
+        assert _plugin(project, records).is_affected("t", {})
+
+    def test_changed_global_dep(self, project):
+        (project / "pytest.ini").write_text("[pytest]\n")
+        records = {"t": {"passed": True, "deps": _deps(project, "pytest.ini")}}
+        assert not _plugin(project, records).is_affected("t", {"pytest.ini": file_hash(str(project / "pytest.ini"))})
+        assert _plugin(project, records).is_affected("t", {"pytest.ini": "changed"})
+
+    def test_global_dep_missing_from_record(self, project):
+        """新加入的公共依赖（记录里没有）同样要重跑"""
+        records = {"t": {"passed": True, "deps": {}}}
+        assert _plugin(project, records).is_affected("t", {"conftest.py": "abc"})
+
+
+class RecordingTest:
+    def test_recording_only_when_requested(self, project):
+        assert not _plugin(project, **{"--incremental": None}).recording
+        assert _plugin(project).recording and _plugin(project).selecting
+        run_all = _plugin(project, **{"--incremental": None, "--run-all": True})
+        assert run_all.recording and not run_all.selecting
+
+
+class MergeResultsTest:
+    """本次运行的结果合并进历史：跳过的测试保留原记录"""
+
+    def test_merge(self):
+        records = {"kept": {"passed": True, "deps": {"a.py": "1"}},
+                   "skipped": {"passed": False, "deps": {"a.py": "1"}},
+                   "rerun": {"passed": False, "deps": {"a.py": "1"}}}
+        results = {"skipped": {"passed": True, "skipped": True, "deps": {"a.py": "2"}},
+                   "rerun": {"passed": True, "skipped": False, "deps": {"a.py": "2"}},
+                   "failed": {"passed": False, "skipped": False, "deps": {"a.py": "2"}},
+                   "no_deps": {"passed": True, "skipped": False, "deps": {}},
+                   "new_skipped": {"passed": True, "skipped": True, "deps": {"a.py": "2"}}}
+        merged = merge_results(records, results)
+        assert merged == {"kept": records["kept"],
+                          "skipped": records["skipped"],
+                          "rerun": {"passed": True, "deps": {"a.py": "2"}},
+                          "failed": {"passed": False, "deps": {"a.py": "2"}}}
+
+    def test_failed_then_skipped_in_teardown_counts_as_failed(self):
+        results = {"t": {"passed": False, "skipped": True, "deps": {"a.py": "2"}}}
+        assert merge_results({}, results) == {"t": {"passed": False, "deps": {"a.py": "2"}}}
@@ -0,0 +1,68 @@
+"""
+LPT 分组和 makespan 汇总（plugins/scheduling.py）的单元测试，不需要浏览器和被测应用
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from plugins.scheduling import SchedulingPlugin, lpt_groups
+
+
+class LptGroupsTest:
+    """按预估耗时从长到短放进当前最空的组"""
+
+    def test_longest_first_into_least_loaded_group(self):
+        estimates = {"a": 8, "b": 7, "c": 6, "d": 5, "e": 4}
+        groups = lpt_groups(estimates, 2)
+        loads = [sum(estimates[n] for n, g in groups.items() if g == i) for i in range(2)]
+        # 8 -> 0，7 -> 1，6 -> 1（7 < 8），5 -> 0（8 < 13），4 -> 0（13 = 13 时取编号小的组）
+        assert groups == {"a": 0, "b": 1, "c": 1, "d": 0, "e": 0}
+        assert sorted(loads) == [13, 17]
+
+    def test_every_test_assigned_to_a_valid_group(self):
+        estimates = {f"t{i}": float(i % 4 + 1) for i in range(20)}
+        groups = lpt_groups(estimates, 3)
+        assert set(groups) == set(estimates)
+        assert set(groups.values()) <= {0, 1, 2}
+
+    def test_deterministic_regardless_of_input_order(self):
+        """每个 worker 独立计算，结果必须一致：同耗时按 nodeid 排序，同负载选编号小的组"""
+        estimates = {"x": 1.0, "y": 1.0, "z": 1.0, "w": 2.0}
+        reordered = dict(reversed(list(estimates.items())))
+        assert lpt_groups(estimates, 2) == lpt_groups(reordered, 2)
+        assert lpt_groups(estimates, 2) == {"w": 0, "x": 1, "y": 1, "z": 0}
+
+    def test_more_workers_than_tests(self):
+        groups = lpt_groups({"a": 3, "b": 1}, 4)
+        assert groups == {"a": 0, "b": 1}
+
+    def test_empty(self):
+        assert lpt_groups({}, 3) == {}
+
+
+class MakespanReportTest:
+    """makespan 汇总只在并行运行时输出"""
+
+    @staticmethod
+    def plugin(numprocesses, xdist=True):
+        config = SimpleNamespace(
+            option=SimpleNamespace(numprocesses=numprocesses, schedule=None),
+            pluginmanager=SimpleNamespace(hasplugin=lambda name: xdist and name == "xdist"),
+            getoption=lambda name: "lpt",
+        )
+        plugin = SchedulingPlugin(config)
+        plugin.actual["t"] = 1.0
+        return plugin
+
+    @pytest.mark.parametrize("numprocesses, xdist", [(None, True), (0, True), (4, False)])
+    def test_serial_run_reports_nothing(self, numprocesses, xdist):
+        assert self.plugin(numprocesses, xdist).makespan_report() is None
+
+    def test_parallel_run_reports(self):
+        assert self.plugin(4).makespan_report()
+
+    def test_assigned_groups_report(self):
+        plugin = self.plugin(None, xdist=False)
+        plugin.groups["t"] = "lpt0"
+        lines = plugin.makespan_report()
+        assert lines and lines[0].startswith("预测 makespan")
@@ -0,0 +1,49 @@
+"""
+应用输出环形缓冲区（utils/stream_capture.py RingBuffer）的单元测试
+"""
+import threading
+
+from utils.stream_capture import RingBuffer
+
+
+class RingBufferTest:
+    def test_keeps_last_lines(self):
+        buffer = RingBuffer(max_lines=3)
+        for i in range(5):
+            buffer.append(f"line {i}\n")
+        assert buffer.text() == "line 2\nline 3\nline 4\n"
+        assert buffer.total_lines == 5
+
+    def test_tail(self):
+        buffer = RingBuffer(max_lines=10)
+        for i in range(4):
+            buffer.append(f"{i}\n")
+        assert buffer.tail(2) == "2\n3\n"
+        assert buffer.tail(100) == "0\n1\n2\n3\n"
+        assert buffer.tail(0) == ""
+
+    def test_empty(self):
+        buffer = RingBuffer()
+        assert buffer.text() == "" and buffer.tail(5) == "" and buffer.total_lines == 0
+
+    def test_truncates_long_lines(self):
+        buffer = RingBuffer(max_lines=2, max_line_length=5)
+        buffer.append("abcdefgh\n")
+        buffer.append("abc\n")
+        assert buffer.text() == "abcde...(截断)\nabc\n"
+
+    def test_concurrent_appends(self):
+        """stdout、stderr 两个读取线程同时写入时不丢计数"""
+        buffer = RingBuffer(max_lines=100)
+
+        def write(prefix):
+            for i in range(2000):
+                buffer.append(f"{prefix}{i}\n")
+
+        threads = [threading.Thread(target=write, args=(name,)) for name in ("out", "err")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert buffer.total_lines == 4000
+        assert len(buffer.text().splitlines()) == 100
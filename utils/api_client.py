@@ -0,0 +1,123 @@
+
+"""
+Real World App 后端 HTTP API 客户端
+1）注册、登录、登出都直接走后端接口，不经过浏览器，单次只需几十毫秒
+2）基于 requests.Session，登录后的会话 cookie（connect.sid）自动保存在 session 中，可以注入到浏览器
+"""
+import logging
+import uuid
+from typing import Optional, Dict, Any, List
+
+from config.config import get_config
+from utils import endpoints
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+
+class ApiError(Exception):
+    """后端接口返回非预期状态码"""
+
+    def __init__(self, method: str, url: str, status_code: int, body: str):
+        super().__init__(f"{method} {url} 返回 {status_code}: {body[:200]}")
+        self.status_code = status_code
+
+
+class RwaApiClient:
+    """Real World App 后端接口客户端，一个实例对应一个登录会话"""
+
+    def __init__(self, base_url: Optional[str] = None, timeout: float = 10):
+        """
+        :param base_url: 后端地址，默认取当前进程的后端地址（utils.endpoints，未使用独立实例时即 yaml 中的 api.base_url）
+        :param timeout: 单次请求超时（秒）
+        """
+        import requests
+        self.base_url = (base_url or endpoints.api_url()).rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.user: Optional[Dict[str, Any]] = None
+
+    def request(self, method: str, path: str, expected=(200, 201, 204), **kwargs):
+        """发送请求并校验状态码"""
+        url = f"{self.base_url}{path}"
+        response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        if response.status_code not in expected:
+            raise ApiError(method, url, response.status_code, response.text)
+        return response
+
+    def register(self, username: str, password: str, first_name: str = "Test", last_name: str = "User") -> Dict[str, Any]:
+        """注册用户（等价于注册表单提交）"""
+        response = self.request("POST", "/users", json={
+            "firstName": first_name,
+            "lastName": last_name,
+            "username": username,
+            "password": password,
+            "confirmPassword": password,
+        })
+        return response.json().get("user", {})
+
+    def login(self, username: str, password: str) -> Dict[str, Any]:
+        """登录，成功后会话 cookie 保存在 self.session 中"""
+        response = self.request("POST", "/login", json={
+            "username": username,
+            "password": password,
+        })
+        self.user = response.json().get("user", {})
+        return self.user
+
+    def logout(self) -> None:
+        self.request("POST", "/logout", expected=(200, 204, 302), allow_redirects=False)
+        self.user = None
+
+    def update_user(self, user_id: str, **fields) -> None:
+        """修改用户信息（等价于用户设置页保存），如 email、phoneNumber、defaultPrivacyLevel"""
+        self.request("PATCH", f"/users/{user_id}", json=fields)
+
+    def create_bank_account(self, bank_name: str, account_number: str, routing_number: str) -> Dict[str, Any]:
+        """为当前登录用户添加银行账户"""
+        response = self.request("POST", "/bankAccounts", json={
+            "bankName": bank_name,
+            "accountNumber": account_number,
+            "routingNumber": routing_number,
+        })
+        return response.json().get("account", {})
+
+    def add_contact(self, contact_user_id: str) -> Dict[str, Any]:
+        """把另一个用户加为当前登录用户的联系人"""
+        response = self.request("POST", "/contacts", json={"contactUserId": contact_user_id})
+        return response.json().get("contact", {})
+
+    def create_transaction(self, receiver_id: str, amount: float, transaction_type: str = "payment",
+                           description: str = "", privacy_level: Optional[str] = None) -> Dict[str, Any]:
+        """
+        当前登录用户向 receiver_id 付款（payment）或收款请求（request）
+        :param amount: 金额（美元，后端按分保存）；付款时余额不足由发起人的第一个银行账户转入
+        """
+        payload = {
+            "transactionType": transaction_type,
+            "receiverId": receiver_id,
+            "amount": amount,
+            "description": description,
+        }
+        if privacy_level:
+            payload["privacyLevel"] = privacy_level
+        response = self.request("POST", "/transactions", json=payload)
+        return response.json().get("transaction", {})
+
+    def create_user(self, prefix: str = "testuser", password: Optional[str] = None) -> Dict[str, Any]:
+        """注册一个唯一用户名的新用户，返回用户信息（附带明文密码，便于后续登录）"""
+        unique_id = str(uuid.uuid4())[:8]
+        password = password or config.api.default_password
+        user = self.register(f"{prefix}_{unique_id}", password)
+        user["password"] = password
+        return user
+
+    def session_cookies(self) -> List[Dict[str, Any]]:
+        """
+        导出会话 cookie，格式与 WebDriver add_cookie 一致
+        不带 domain：requests 会把 localhost 记成 localhost.local，交给浏览器按当前页面域名处理
+        """
+        return [{"name": c.name, "value": c.value, "path": c.path or "/"} for c in self.session.cookies]
+
+    def close(self) -> None:
+        self.session.close()
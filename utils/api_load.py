@@ -0,0 +1,331 @@
+
+"""
+接口压测 - 用 N 个并发虚拟用户重放 test_register_and_login_and_logout 的 注册 -> 登录 -> 登出 流程
+1）不经过浏览器，直接调用后端接口（复用 RwaApiClient 的 register/login/logout），用 asyncio 调度虚拟用户，
+   每个虚拟用户使用独立的客户端，同步请求通过 asyncio.to_thread 在线程池中执行
+2）应用通过 AppManager 启动（已在运行时直接附加），结束后按 load.restore_data 把数据恢复到压测前的快照；
+   指定 --api-url 时直接压测该后端，不启动应用
+3）输出每一步的请求数、吞吐、p50/p95/p99 延迟和错误率，结果写成 JSON，便于对比不同版本的应用
+
+运行：python -m utils.api_load run --users 20 --iterations 10 --label v1.2 --output reports/load.json
+对比：python -m utils.api_load compare base.json new.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Optional, Dict, Any, List
+
+from config.config import ConfigError, LoadConfig, get_config
+from utils.api_client import RwaApiClient, ApiError
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+# 流程中的步骤，某一步失败时本次流程的后续步骤不再执行（登录依赖注册，登出依赖登录）
+STEPS = ("register", "login", "logout")
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法分位数（pct 为 0~100），没有数据时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class StepStats:
+    """一个步骤的统计：成功请求的延迟（秒）和失败原因"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors: Counter = Counter()
+
+    def add(self, duration: float, error: Optional[str] = None) -> None:
+        if error:
+            self.errors[error] += 1
+        else:
+            self.latencies.append(duration)
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies) + sum(self.errors.values())
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """
+        :param elapsed: 压测总时长（秒），用于计算吞吐
+        """
+        errors = sum(self.errors.values())
+        return {
+            "requests": self.count,
+            "errors": errors,
+            "error_rate": errors / self.count if self.count else 0.0,
+            "throughput": len(self.latencies) / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                name: (value * 1000 if value is not None else None)
+                for name, value in (("p50", percentile(self.latencies, 50)),
+                                    ("p95", percentile(self.latencies, 95)),
+                                    ("p99", percentile(self.latencies, 99)),
+                                    ("max", max(self.latencies, default=None)))
+            },
+            "error_types": dict(self.errors),
+        }
+
+
+class LoadRunner:
+    """并发虚拟用户执行认证流程并汇总结果"""
+
+    def __init__(self, api_url: str, users: int, iterations: int, duration: Optional[float] = None,
+                 ramp_up: float = 0, think_time: float = 0, timeout: float = 10):
+        """
+        :param api_url: 后端地址
+        :param users: 并发虚拟用户数
+        :param iterations: 每个虚拟用户执行流程的次数（duration 为 None 时有效）
+        :param duration: 按时长运行（秒），每个虚拟用户循环执行直到时间用完
+        :param ramp_up: 虚拟用户在这么多秒内均匀启动
+        :param think_time: 每次流程之间的间隔（秒）
+        :param timeout: 单次请求超时（秒）
+        """
+        self.api_url = api_url
+        self.users = users
+        self.iterations = iterations
+        self.duration = duration
+        self.ramp_up = ramp_up
+        self.think_time = think_time
+        self.timeout = timeout
+        self.steps = {name: StepStats(name) for name in STEPS}
+        self.flows = 0
+        self.failed_flows = 0
+        self.elapsed = 0.0
+
+    @classmethod
+    def from_config(cls, api_url: str, **overrides) -> "LoadRunner":
+        """yaml 中的 load 段作为默认值，命令行参数（不为 None 的）覆盖；不合法时抛 ConfigError"""
+        load = load_settings(**overrides)
+        return cls(api_url, users=load.users, iterations=load.iterations, duration=load.duration,
+                   ramp_up=load.ramp_up, think_time=load.think_time, timeout=load.timeout)
+
+    async def _step(self, name: str, func, *args) -> bool:
+        """在线程池中执行一步并记录延迟，返回是否成功"""
+        start_time = time.perf_counter()
+        try:
+            await asyncio.to_thread(func, *args)
+        except ApiError as e:
+            self.steps[name].add(time.perf_counter() - start_time, f"HTTP {e.status_code}")
+            return False
+        except Exception as e:
+            self.steps[name].add(time.perf_counter() - start_time, e.__class__.__name__)
+            return False
+        self.steps[name].add(time.perf_counter() - start_time)
+        return True
+
+    async def _flow(self, client: RwaApiClient) -> bool:
+        """一次完整流程，和 UI 测试一样每次注册一个唯一用户名的新用户"""
+        username = f"loaduser_{uuid.uuid4().hex[:12]}"
+        password = config.api.default_password
+        return (await self._step("register", client.register, username, password)
+                and await self._step("login", client.login, username, password)
+                and await self._step("logout", client.logout))
+
+    async def _virtual_user(self, index: int, deadline: Optional[float]) -> None:
+        if self.ramp_up:
+            await asyncio.sleep(self.ramp_up * index / self.users)
+        iteration = 0
+        while (time.monotonic() < deadline) if deadline else iteration < self.iterations:
+            # 每次流程使用新的会话，避免上一次的 cookie 影响注册
+            client = RwaApiClient(self.api_url, timeout=self.timeout)
+            try:
+                ok = await self._flow(client)
+            finally:
+                client.close()
+            self.flows += 1
+            self.failed_flows += not ok
+            iteration += 1
+            if self.think_time:
+                await asyncio.sleep(self.think_time)
+
+    async def _run(self) -> None:
+        # 默认线程池的大小和 CPU 数有关，会限制并发，按虚拟用户数单独设置
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.users, thread_name_prefix="load")
+        loop.set_default_executor(executor)
+        deadline = time.monotonic() + self.ramp_up + self.duration if self.duration else None
+        try:
+            await asyncio.gather(*(self._virtual_user(index, deadline) for index in range(self.users)))
+        finally:
+            executor.shutdown(wait=False)
+
+    def run(self) -> Dict[str, Any]:
+        logger.info(f"开始压测 {self.api_url}: {self.users} 个虚拟用户，"
+                    + (f"持续 {self.duration}s" if self.duration else f"每个执行 {self.iterations} 次"))
+        start_time = time.perf_counter()
+        asyncio.run(self._run())
+        self.elapsed = time.perf_counter() - start_time
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "api_url": self.api_url,
+            "users": self.users,
+            "iterations": None if self.duration else self.iterations,
+            "duration": self.duration,
+            "elapsed": self.elapsed,
+            "flows": self.flows,
+            "failed_flows": self.failed_flows,
+            "flow_throughput": (self.flows - self.failed_flows) / self.elapsed if self.elapsed else 0.0,
+            "steps": {name: stats.report(self.elapsed) for name, stats in self.steps.items()},
+        }
+
+
+def format_report(report: Dict[str, Any]) -> List[str]:
+    lines = [f"压测 {report['api_url']}（{report.get('label') or '-'}）: {report['users']} 个虚拟用户，"
+             f"{report['flows']} 次流程（失败 {report['failed_flows']}），耗时 {report['elapsed']:.1f}s，"
+             f"完整流程 {report['flow_throughput']:.1f} 次/s",
+             f"{'步骤':<12}{'请求数':>8}{'吞吐(/s)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'错误率':>9}"]
+    for name, step in report["steps"].items():
+        latency = step["latency_ms"]
+        cells = "".join(f"{latency[key]:>10.1f}" if latency[key] is not None else f"{'-':>10}"
+                        for key in ("p50", "p95", "p99"))
+        lines.append(f"{name:<12}{step['requests']:>8}{step['throughput']:>10.1f}{cells}{step['error_rate']:>9.1%}")
+        if step["error_types"]:
+            lines.append("  错误: " + "，".join(f"{error} x{count}" for error, count in step["error_types"].items()))
+    return lines
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.2,
+            min_delta: float = 5) -> List[Dict[str, Any]]:
+    """
+    对比两次压测，找出 p95 延迟退化或错误率上升的步骤
+    :param threshold: p95 增长比例阈值
+    :param min_delta: p95 增长的最小绝对值（毫秒）
+    """
+    regressions = []
+    for name, new_step in new["steps"].items():
+        base_step = base["steps"].get(name)
+        if not base_step:
+            continue
+        base_p95, new_p95 = base_step["latency_ms"]["p95"], new_step["latency_ms"]["p95"]
+        if base_p95 and new_p95 is not None and new_p95 - base_p95 >= min_delta \
+                and new_p95 / base_p95 - 1 > threshold:
+            regressions.append({"step": name, "metric": "p95", "base": base_p95, "new": new_p95})
+        if new_step["error_rate"] > base_step["error_rate"]:
+            regressions.append({"step": name, "metric": "error_rate",
+                                "base": base_step["error_rate"], "new": new_step["error_rate"]})
+    return regressions
+
+
+def _app_revision(app_dir: str) -> Optional[str]:
+    """被测应用目录的 git 提交号，便于区分压测的是哪个版本"""
+    try:
+        return subprocess.run(["git", "-C", app_dir, "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5, check=True).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _run_against_app(args) -> Optional[Dict[str, Any]]:
+    """通过 AppManager 启动（或附加）应用后压测，结束后恢复数据并停止本进程启动的应用"""
+    from utils import endpoints
+    from utils.excep_manager import AppManager, AppStatus
+
+    manager = AppManager(
+        app_dir=config.app.dir,
+        max_retries=config.app.max_retries,
+        health_check_url=config.app.health_check,
+        attach_existing=config.app.attach == "auto",
+    )
+    result = manager.start_app()
+    if result.status != AppStatus.RUNNING:
+        logger.error(f"应用启动失败，无法压测: {result.error}")
+        manager.stop_app()
+        return None
+    try:
+        return LoadRunner.from_config(endpoints.api_url(), **_overrides(args)).run()
+    finally:
+        if config.load.restore_data and not args.keep_data and manager.restore_database() is not None:
+            logger.info("已把应用数据恢复到压测前的快照")
+        manager.stop_app()
+
+
+def load_settings(**overrides) -> LoadConfig:
+    """yaml 中的 load 段合并不为 None 的覆盖项，按 LoadConfig.validate 校验（users 至少 1，时长、间隔不能为负数等）"""
+    load = replace(config.load, **{key: value for key, value in overrides.items() if value is not None})
+    load.validate()
+    return load
+
+
+def _overrides(args) -> Dict[str, Any]:
+    return {"users": args.users, "iterations": args.iterations, "duration": args.duration,
+            "ramp_up": args.ramp_up, "think_time": args.think_time}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="后端接口压测：并发重放 注册 -> 登录 -> 登出 流程")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="执行压测并输出 JSON 结果")
+    run_parser.add_argument("--users", type=int, help="并发虚拟用户数（默认 yaml 中的 load.users）")
+    run_parser.add_argument("--iterations", type=int, help="每个虚拟用户执行流程的次数")
+    run_parser.add_argument("--duration", type=float, help="按时长运行（秒），设置后忽略 iterations")
+    run_parser.add_argument("--ramp-up", type=float, help="虚拟用户在这么多秒内均匀启动")
+    run_parser.add_argument("--think-time", type=float, help="每次流程之间的间隔（秒）")
+    run_parser.add_argument("--api-url", help="直接压测这个后端，不通过 AppManager 启动应用")
+    run_parser.add_argument("--label", help="写入结果的版本标识，如 v1.2")
+    run_parser.add_argument("--output", help="JSON 结果路径（默认 yaml 中的 load.output，- 为只输出到终端）")
+    run_parser.add_argument("--keep-data", action="store_true", help="不恢复压测前的应用数据")
+    compare_parser = subparsers.add_parser("compare", help="对比两次压测的 JSON 结果，找出退化的步骤")
+    compare_parser.add_argument("base", help="基准版本的结果")
+    compare_parser.add_argument("new", help="本次的结果")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="p95 增长比例阈值（默认 0.2）")
+    compare_parser.add_argument("--min-delta", type=float, default=5, help="p95 增长的最小绝对值（毫秒）")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.base, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.new, "r", encoding="utf-8") as f:
+            new = json.load(f)
+        regressions = compare(base, new, args.threshold, args.min_delta)
+        for item in regressions:
+            if item["metric"] == "p95":
+                print(f"退化: {item['step']} p95 {item['base']:.1f}ms -> {item['new']:.1f}ms "
+                      f"({item['new'] / item['base'] - 1:+.1%})")
+            else:
+                print(f"退化: {item['step']} 错误率 {item['base']:.1%} -> {item['new']:.1%}")
+        return 1 if regressions else 0
+
+    try:
+        load_settings(**_overrides(args))
+    except ConfigError as e:
+        run_parser.error(str(e))
+
+    logging.basicConfig(level=config.logging.level, format=config.logging.format)
+    if args.api_url:
+        report = LoadRunner.from_config(args.api_url.rstrip("/"), **_overrides(args)).run()
+    else:
+        report = _run_against_app(args)
+        if report is None:
+            return 2
+    report.update({"label": args.label, "app_revision": _app_revision(config.app.dir), "ts": time.time()})
+
+    print("\n".join(format_report(report)))
+    output = args.output or config.resolve_path(config.load.output)
+    if output != "-":
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
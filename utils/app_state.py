@@ -0,0 +1,198 @@
+
+"""
+应用共享状态 - 用于 pytest-xdist 多个 worker 之间协调同一个应用进程
+1）只有一个 worker 真正启动应用（owner），其余 worker 读取状态文件后直接附加，不再重复启动
+2）状态文件的读写都在文件锁保护下进行；锁基于 O_CREAT|O_EXCL 实现，Windows/Linux 通用
+3）atomic_replace / write_json_atomic：项目里各种共享文件（状态、注册表、缓存、历史、数据库快照）统一的原子写入
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def pid_alive(pid: Optional[int]) -> bool:
+    """
+    判断进程是否存活
+    注意：Windows 上 os.kill(pid, 0) 会直接结束目标进程，因此单独走 OpenProcess 查询
+    """
+    if not pid:
+        return False
+    if os.name == "nt":
+        import ctypes
+        process_query_limited_information = 0x1000
+        still_active = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(process_query_limited_information, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == still_active
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def atomic_replace(path: str):
+    """
+    原子替换文件：产出同目录下 mkstemp 创建的临时文件路径，with 块正常结束后 os.replace 到 path，
+    读方任何时刻看到的都是完整文件；临时文件名每次唯一，同一进程的多个线程也不会互相覆盖，出错时在 finally 中删除
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def write_json_atomic(path: str, data: Any, indent: Optional[int] = None) -> None:
+    """
+    原子写入 JSON（见 atomic_replace）
+    多个进程/线程同时写时以最后一次替换为准，需要读-改-写时在文件锁内调用
+    """
+    with atomic_replace(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+
+
+class FileLock:
+    """跨进程文件锁：持有者进程已退出或锁文件超过 stale 秒未释放时，自动回收"""
+
+    def __init__(self, path: str, timeout: float = 60, stale: float = 120, poll: float = 0.01):
+        """
+        :param path: 锁文件路径
+        :param timeout: 获取锁的最长等待时间（秒）
+        :param stale: 锁文件超过该时长视为失效（秒）
+        :param poll: 抢锁失败后的轮询间隔（秒）
+        """
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+        self.poll = poll
+
+    def acquire(self) -> None:
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                self._break_stale()
+                if time.time() > deadline:
+                    raise TimeoutError(f"获取文件锁超时: {self.path}")
+                time.sleep(self.poll)
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return
+
+    def release(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _read_owner(path: str) -> Optional[Tuple[int, int]]:
+        """锁文件的持有者 pid 和修改时间（纳秒），两者一起标识“同一个”锁文件"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with open(path, "r") as f:
+                return int(f.read() or 0), mtime_ns
+        except (OSError, ValueError):
+            return None
+
+    def _break_stale(self) -> None:
+        """
+        回收失效的锁：持有者已退出，或持有时间过长
+        判断和删除之间别的进程可能已经回收并重新拿到了锁，所以先把锁文件改名成本进程独有的名字，
+        确认改名拿到的还是刚才判断为失效的那个文件再删除；不是的话还回去
+        """
+        owner = self._read_owner(self.path)
+        if owner is None:
+            return
+        owner_pid, mtime_ns = owner
+        age = time.time() - mtime_ns / 1e9
+        if not (age > self.stale or (owner_pid and not pid_alive(owner_pid))):
+            return
+        broken = f"{self.path}.{os.getpid()}.{threading.get_ident()}.stale"
+        try:
+            os.rename(self.path, broken)
+        except OSError:
+            # 已经被别的进程回收（或释放）了
+            return
+        if self._read_owner(broken) != owner:
+            try:
+                # link 在目标已存在时失败，不会覆盖又一个新持有者的锁
+                os.link(broken, self.path)
+            except OSError:
+                logger.warning(f"回收文件锁时拿到了别人刚获取的锁，且无法还原: {self.path}")
+            os.remove(broken)
+            return
+        logger.warning(f"回收失效的文件锁: {self.path} (pid={owner_pid}, age={age:.1f}s)")
+        os.remove(broken)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class SharedAppState:
+    """
+    多个 worker 共享的应用状态文件，内容为 JSON：
+    status（AppStatus 名称）、owner/owner_pid（负责启动的 worker）、app_pid、healthy、checked_at、
+    error、clients（正在使用应用的 worker -> pid）、restart_requested（请求 owner 重启应用的 worker）
+    """
+
+    def __init__(self, path: str, lock_timeout: float = 60):
+        self.path = path
+        self.lock = FileLock(path + ".lock", timeout=lock_timeout)
+
+    @classmethod
+    def for_session(cls, run_id: str, state_dir: Optional[str] = None) -> "SharedAppState":
+        """按测试运行 ID 生成状态文件，同一次 xdist 运行的所有 worker 拿到的是同一个文件"""
+        state_dir = state_dir or tempfile.gettempdir()
+        os.makedirs(state_dir, exist_ok=True)
+        return cls(os.path.join(state_dir, f"rwa_app_state_{run_id}.json"))
+
+    @contextmanager
+    def locked(self):
+        """在锁内执行读-改-写"""
+        with self.lock:
+            yield self
+
+    def read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write(self, state: Dict[str, Any]) -> None:
+        """原子写入：先写临时文件再替换，读方永远不会读到半个文件"""
+        state["updated_at"] = time.time()
+        write_json_atomic(self.path, state)
@@ -0,0 +1,305 @@
+"""
+测试基类 - 在 SeleniumBase 的 BaseCase 上补充项目通用能力
+1）login_by_api：通过后端接口注册/登录，再把会话注入浏览器，省掉表单操作和页面跳转等待
+只有真正测试登录界面的用例才需要走 UI 登录，其余用例直接调用这里拿到已登录的浏览器
+2）lease_user：从预创建的用户池中独占租借一个用户，用例结束后自动归还
+3）requires_app = True 的测试类：先启动浏览器，再等待后台启动的应用，两者并行
+4）浏览器复用：同一 worker（或同一测试类）共用一个浏览器，用例之间只做一次批量脚本 + 一次清 cookie 重置状态，
+跑满 N 条用例或浏览器崩溃后才重建；每条用例的 setUp 耗时都会记录下来，便于和不复用时对比
+5）请求拦截：浏览器创建后通过 CDP 拦截图片、字体等测试用不到的请求（yaml 中的 network_blocking），
+每条用例结束时统计拦截的请求数和节省的字节数
+6）WebDriver 命令统计：每条用例的命令次数和往返耗时；fill_form / read_states 把整张表单的填写、
+多个元素状态的读取合并成一次 execute_script，省掉逐个元素的往返
+7）性能预算模式（--perf-budget）：采集每次页面加载/路由切换的性能数据，超出预算或比基线退化时用例失败
+"""
+import json
+import logging
+import statistics
+import time
+from typing import Optional, Dict, Any, List
+
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+from seleniumbase import BaseCase
+from seleniumbase import config as sb_config
+
+from config.config import get_config
+from utils import endpoints, timing, waits
+from utils.api_client import RwaApiClient
+from utils.command_profiler import CommandProfiler
+from utils.excep_manager import AppStatus, handle_app_failure
+from utils.network_blocking import NetworkBlocker
+from utils.perf_budget import PerfRecorder
+from utils.test_data import get_user_pool, get_scenario
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+# 一次脚本调用清空前端存储（原来是 localStorage、sessionStorage 各一次调用）
+RESET_STATE_SCRIPT = """
+try { window.localStorage.clear(); } catch (e) {}
+try { window.sessionStorage.clear(); } catch (e) {}
+"""
+
+# 一次填写多个输入框：React 受控组件要用原生 value setter 赋值再派发 input 事件，状态才会更新；
+# focusout 触发 onBlur（表单校验的 touched）；返回找不到的选择器
+FILL_FORM_SCRIPT = """
+var values = arguments[0], submit = arguments[1], missing = [];
+Object.keys(values).forEach(function (selector) {
+    var el = document.querySelector(selector);
+    if (!el) { missing.push(selector); return; }
+    var proto = el.tagName === "TEXTAREA" ? HTMLTextAreaElement.prototype
+        : el.tagName === "SELECT" ? HTMLSelectElement.prototype : HTMLInputElement.prototype;
+    el.focus();
+    if (el.type === "checkbox" || el.type === "radio") {
+        if (el.checked !== Boolean(values[selector])) { el.click(); }
+    } else {
+        Object.getOwnPropertyDescriptor(proto, "value").set.call(el, values[selector]);
+        el.dispatchEvent(new Event("input", {bubbles: true}));
+        el.dispatchEvent(new Event("change", {bubbles: true}));
+    }
+    el.dispatchEvent(new FocusEvent("focusout", {bubbles: true}));
+});
+if (submit && !missing.length) {
+    var button = document.querySelector(submit);
+    if (button) { button.click(); } else { missing.push(submit); }
+}
+return missing;
+"""
+
+# 一次读取多个元素的状态（是否存在、可见、可用、选中、文本、值）以及当前页面地址
+READ_STATES_SCRIPT = """
+var states = {};
+arguments[0].forEach(function (selector) {
+    var el = document.querySelector(selector);
+    if (!el) { states[selector] = {present: false, visible: false}; return; }
+    var style = window.getComputedStyle(el), rect = el.getBoundingClientRect();
+    states[selector] = {
+        present: true,
+        visible: style.display !== "none" && style.visibility !== "hidden" && style.opacity !== "0"
+            && rect.width > 0 && rect.height > 0,
+        enabled: !el.disabled,
+        checked: Boolean(el.checked),
+        text: (el.innerText || "").trim(),
+        value: el.value === undefined ? null : el.value
+    };
+});
+return {url: location.href, states: states};
+"""
+
+# 当前进程共享浏览器的使用情况
+_SHARED_DRIVER_STATE: Dict[str, Any] = {"tests": 0, "owner": None}
+# 每条用例 setUp 的耗时（秒），会话结束时汇总输出
+SETUP_LATENCIES: List[float] = []
+# 当前进程的请求拦截规则和统计（--network-blocking 覆盖 yaml 中的 enabled）
+NETWORK_BLOCKER = NetworkBlocker.from_config()
+# 当前进程的 WebDriver 命令统计
+COMMAND_PROFILER = CommandProfiler.from_config()
+# 当前进程的页面性能采集（--perf-budget 开启）
+PERF_RECORDER = PerfRecorder.from_config()
+
+
+def setup_latency_summary() -> Optional[str]:
+    """setUp 耗时汇总，没有数据时返回 None"""
+    if not SETUP_LATENCIES:
+        return None
+    latencies = sorted(SETUP_LATENCIES)
+    p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+    return (f"浏览器 setUp 耗时（复用模式: {BaseTest.browser_reuse}）: {len(latencies)} 条，"
+            f"平均 {statistics.mean(latencies):.3f}s，中位数 {statistics.median(latencies):.3f}s，"
+            f"P90 {p90:.3f}s，最大 {latencies[-1]:.3f}s")
+
+
+class BaseTest(BaseCase):
+    """项目测试基类"""
+
+    # 是否依赖被测应用：为 True 时 conftest 会自动加上 requires_app 标记，setUp 中等待应用启动完成
+    requires_app = False
+
+    # 浏览器复用范围："worker"（整个进程共用）、"class"（每个测试类一个）、"none"（每条用例新开，即原有行为）
+    browser_reuse = config.browser.reuse
+    # 同一个浏览器最多跑多少条用例后重建，防止内存泄漏等问题累积
+    recycle_after = config.browser.recycle_after
+
+    def setUp(self):
+        start_time = time.perf_counter()
+        # 复用浏览器时重置状态的命令也算在本条用例里
+        COMMAND_PROFILER.start(self.id())
+        if self.browser_reuse != "none":
+            sb_config.reuse_session = True
+            self._prepare_shared_driver()
+        if NETWORK_BLOCKER.active and NETWORK_BLOCKER.report:
+            # 让 SeleniumBase 创建浏览器时开启性能日志（goog:loggingPrefs），用来统计拦截的请求
+            sb_config.log_cdp_events = True
+        super().setUp()
+        COMMAND_PROFILER.attach(self.driver)
+        NETWORK_BLOCKER.apply(self.driver)
+        PERF_RECORDER.install(self.driver)
+        waits.install_network_tracker(self.driver)
+        if self.requires_app:
+            self._wait_for_app()
+        _SHARED_DRIVER_STATE["tests"] += 1
+        _SHARED_DRIVER_STATE["owner"] = type(self).__qualname__
+        duration = time.perf_counter() - start_time
+        SETUP_LATENCIES.append(duration)
+        timing.record("setUp", duration, browser_reuse=self.browser_reuse)
+
+    def tearDown(self):
+        """
+        浏览器关闭（不复用时）之前统计本条用例的 WebDriver 命令、拦截的请求和页面性能数据；
+        性能预算没有通过时，在浏览器正常收尾之后让用例失败
+        """
+        stats = COMMAND_PROFILER.finish()
+        if stats:
+            timing.record("webdriver_commands", stats.total_time, count=stats.count,
+                          top=[{"command": command, "count": count, "total": round(total, 4)}
+                               for command, count, total, _ in stats.top(COMMAND_PROFILER.top)])
+        driver = getattr(self, "driver", None)
+        violations = []
+        if PERF_RECORDER.enabled and driver is not None:
+            try:
+                violations = PERF_RECORDER.check(PERF_RECORDER.harvest(self, self.id()))
+            except WebDriverException as e:
+                logger.warning(f"读取页面性能数据失败: {e.__class__.__name__}")
+        if NETWORK_BLOCKER.active and driver is not None:
+            stats = NETWORK_BLOCKER.collect(driver, self.id())
+            if stats:
+                blocked, saved, unknown = stats
+                timing.record("network_blocking", 0.0, blocked=blocked, bytes_saved=saved, unknown_size=unknown)
+        super().tearDown()
+        if violations:
+            self.fail("性能预算未通过:\n" + "\n".join(violations))
+
+    def fill_form(self, values: Dict[str, Any], submit: Optional[str] = None) -> None:
+        """
+        一次 execute_script 填写整张表单（逐个 self.type 每个字段要等待、清空、输入好几次往返）
+        :param values: CSS 选择器 -> 值；复选框/单选框的值为是否选中
+        :param submit: 填完后点击的提交按钮选择器
+        :raises NoSuchElementException: 有找不到的元素时（此时不会点击提交）
+        """
+        missing = self.execute_script(FILL_FORM_SCRIPT, values, submit)
+        if missing:
+            raise NoSuchElementException(f"填写表单时找不到元素: {missing}")
+
+    def read_states(self, *selectors: str) -> Dict[str, Any]:
+        """
+        一次 execute_script 读取多个元素的状态，替代连续的 is_element_visible / get_text / get_current_url
+        :return: {"url": 当前地址, "states": {选择器: {present, visible, enabled, checked, text, value}}}
+        """
+        return self.execute_script(READ_STATES_SCRIPT, list(selectors))
+
+    @staticmethod
+    def _wait_for_app() -> None:
+        """浏览器已经启动好后再等待应用（应用在收集完成后就已开始后台启动），失败时按策略 skip/fail/xfail"""
+        from conftest import get_app_manager
+        manager = get_app_manager()
+        if manager.wait_for_app().status == AppStatus.FAILED:
+            handle_app_failure(manager)
+
+    @property
+    def frontend_url(self) -> str:
+        """前端地址：每个 worker 使用独立实例时是实例的端口，否则为 yaml 中的 api.frontend_url"""
+        return endpoints.frontend_url()
+
+    def _prepare_shared_driver(self) -> None:
+        """
+        在 SeleniumBase 取用共享浏览器之前处理：
+        1）换测试类（class 模式）或跑满 recycle_after 条用例 -> 关闭浏览器，由 super().setUp() 重新创建
+        2）否则一次脚本清空存储 + 一次清 cookie；浏览器已崩溃时这里会抛异常，同样重建
+        """
+        driver = getattr(sb_config, "shared_driver", None)
+        if driver is None:
+            return
+
+        owner_changed = self.browser_reuse == "class" and _SHARED_DRIVER_STATE["owner"] != type(self).__qualname__
+        if owner_changed or _SHARED_DRIVER_STATE["tests"] >= self.recycle_after:
+            self._recycle_shared_driver()
+            return
+
+        try:
+            driver.execute_script(RESET_STATE_SCRIPT)
+            driver.delete_all_cookies()
+        except WebDriverException as e:
+            logger.warning(f"共享浏览器不可用，重新创建: {e.__class__.__name__}")
+            self._recycle_shared_driver()
+
+    @staticmethod
+    def _recycle_shared_driver() -> None:
+        try:
+            sb_config.shared_driver.quit()
+        except WebDriverException:
+            pass
+        sb_config.shared_driver = None
+        _SHARED_DRIVER_STATE["tests"] = 0
+
+    def login_by_api(self, username: Optional[str] = None, password: Optional[str] = None,
+                     path: str = "/") -> Dict[str, Any]:
+        """
+        通过后端接口登录并把会话注入浏览器
+        :param username: 用户名，为 None 时先通过接口注册一个新用户
+        :param password: 密码，默认取 yaml 中的 api.default_password
+        :param path: 注入会话后打开的前端页面
+        :return: 登录用户信息（含 password）
+        """
+        client = RwaApiClient()
+        try:
+            if username is None:
+                user = client.create_user(password=password)
+                username, password = user["username"], user["password"]
+            password = password or config.api.default_password
+            user = client.login(username, password)
+            user["password"] = password
+            self.inject_session(client, path=path)
+        finally:
+            client.close()
+        return user
+
+    def lease_user(self, login: bool = False, path: str = "/") -> Dict[str, Any]:
+        """
+        从用户池租借一个用户，用例结束（含失败）后自动归还
+        :param login: 是否同时通过接口登录并注入浏览器
+        :param path: 登录后打开的前端页面
+        :return: 用户信息（含 password）
+        """
+        from conftest import get_app_manager
+        pool = get_user_pool(get_app_manager())
+        user = pool.lease()
+        self.addCleanup(pool.release, user)
+        if login:
+            self.login_by_api(user["username"], user["password"], path=path)
+        return user
+
+    def use_scenario(self, name: str, login_as: Optional[str] = None, path: str = "/") -> Dict[str, Any]:
+        """
+        取得批量造好的测试数据（yaml/data_scenarios.yaml 中的场景，同一进程只准备一次，定义不变时跨会话复用）
+        :param name: 场景名
+        :param login_as: 用户别名，传入时通过接口登录该组的第一个用户并注入浏览器
+        :param path: 登录后打开的前端页面
+        :return: users（别名 -> 用户列表）、transactions、contacts
+        """
+        from conftest import get_app_manager
+        scenario = get_scenario(name, get_app_manager())
+        if login_as:
+            user = scenario["users"][login_as][0]
+            self.login_by_api(user["username"], user["password"], path=path)
+        return scenario
+
+    def inject_session(self, client: RwaApiClient, path: str = "/") -> None:
+        """
+        把接口会话注入浏览器：
+        1）cookie 只能写到当前页面所在的域名，所以先确保浏览器停在前端域名下
+        2）cookie 按域名不按端口区分，后端 3001 下发的 connect.sid 在前端 3000 同样有效
+        3）同时写入前端持久化的登录态，打开页面后直接处于已登录状态
+        """
+        if not self.get_current_url().startswith(self.frontend_url):
+            self.open(self.frontend_url + "/signin")
+        for cookie in client.session_cookies():
+            self.add_cookie(cookie)
+
+        storage_key = config.api.auth_storage_key
+        if storage_key and client.user:
+            auth_state = {"value": "authorized", "context": {"user": client.user}}
+            self.execute_script(
+                "localStorage.setItem(arguments[0], arguments[1]);",
+                storage_key, json.dumps(auth_state)
+            )
+        self.open(self.frontend_url + path)
@@ -0,0 +1,112 @@
+
+"""
+WebDriver 命令统计 - self.type、self.click、is_element_visible、get_current_url 每一次都是一次到 chromedriver 的 HTTP 往返
+1）包装浏览器的 command_executor.execute（每个浏览器包装一次，复用的浏览器不重复包装），记录每条命令的名称和往返耗时
+2）按用例汇总：命令总数、总往返耗时、按总耗时排序的前 N 个命令；用例结束时写入日志和阶段耗时（plugins/timing.py）
+3）会话结束时在终端输出每条用例的汇总，找出往返最多的用例后可以改用 BaseTest.fill_form / read_states 批量操作
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Optional, Dict, List, Tuple
+
+from config.config import get_config
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+
+class CommandStats:
+    """一条用例的命令统计：命令名 -> [次数, 总耗时, 最大耗时]"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.commands: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def add(self, command: str, duration: float) -> None:
+        stats = self.commands[command]
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+
+    @property
+    def count(self) -> int:
+        return int(sum(stats[0] for stats in self.commands.values()))
+
+    @property
+    def total_time(self) -> float:
+        return sum(stats[1] for stats in self.commands.values())
+
+    def top(self, n: int) -> List[Tuple[str, int, float, float]]:
+        """按总耗时排序的前 n 个命令：(命令名, 次数, 总耗时, 最大耗时)"""
+        ranked = sorted(self.commands.items(), key=lambda item: -item[1][1])[:n]
+        return [(command, int(stats[0]), stats[1], stats[2]) for command, stats in ranked]
+
+    def describe(self, n: int) -> str:
+        top = "、".join(f"{command} {count} 次 {total:.2f}s" for command, count, total, _ in self.top(n))
+        return f"{self.name}: {self.count} 次命令，往返 {self.total_time:.2f}s（{top or '-'}）"
+
+
+class CommandProfiler:
+    """统计当前进程浏览器的 WebDriver 命令，同一时间只统计一条用例"""
+
+    def __init__(self, enabled: bool = True, top: int = 5):
+        """
+        :param enabled: 是否统计
+        :param top: 每条用例报告的命令数
+        """
+        self.enabled = enabled
+        self.top = top
+        self.current: Optional[CommandStats] = None
+        self.finished: List[CommandStats] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "CommandProfiler":
+        return cls(enabled=config.browser.profile_commands, top=config.browser.profile_top)
+
+    def attach(self, driver) -> None:
+        """包装浏览器的命令执行器（每个浏览器一次）"""
+        executor = getattr(driver, "command_executor", None)
+        if not self.enabled or executor is None or getattr(executor, "_rwa_profiled", False):
+            return
+        original = executor.execute
+
+        def execute(command, params=None):
+            start_time = time.perf_counter()
+            try:
+                return original(command, params)
+            finally:
+                stats = self.current
+                if stats is not None:
+                    with self._lock:
+                        stats.add(command, time.perf_counter() - start_time)
+
+        executor.execute = execute
+        executor._rwa_profiled = True
+
+    def start(self, name: str) -> None:
+        if self.enabled:
+            self.current = CommandStats(name)
+
+    def finish(self) -> Optional[CommandStats]:
+        """结束当前用例的统计并返回；没有在统计时返回 None"""
+        stats, self.current = self.current, None
+        if stats is None:
+            return None
+        self.finished.append(stats)
+        logger.info(f"WebDriver 命令统计 {stats.describe(self.top)}")
+        return stats
+
+    def summary(self, top_tests: int = 10) -> Optional[List[str]]:
+        """会话汇总：总体情况 + 往返耗时最多的若干条用例（每条带前 N 个命令）"""
+        if not self.finished:
+            return None
+        count = sum(stats.count for stats in self.finished)
+        total = sum(stats.total_time for stats in self.finished)
+        lines = [f"WebDriver 命令: {len(self.finished)} 条用例共 {count} 次往返，总耗时 {total:.2f}s，"
+                 f"平均每条 {count / len(self.finished):.0f} 次"]
+        for stats in sorted(self.finished, key=lambda s: -s.total_time)[:top_tests]:
+            lines.append("  " + stats.describe(self.top))
+        return lines
@@ -0,0 +1,141 @@
+
+"""
+数据库快照与恢复 - 测试之间把应用的数据恢复到快照，避免数据越跑越多、接口越来越慢
+1）Real World App 后端使用 lowdb，数据就是 app 目录下的 data/database.json，内存中另有一份，
+   所以只能通过后端重新加载种子数据的接口（RWA 为 POST /testData/seed）恢复，直接替换数据文件不生效
+2）应用健康后（以及用户池补齐、场景数据造好后）读取数据文件做一次快照，快照保存在 app.database.snapshot_dir（.cache 下）
+3）不修改应用检出目录中的任何文件，恢复有两种方式：
+   - reseed_payload：把快照作为请求体 POST 给重新加载接口（需要后端接口接受请求体）
+   - 种子文件：后端只读固定的种子文件（RWA 的 data/database-seed.json）时，只有独立实例复制出来的种子文件可以写，
+     快照时把快照写到复制的种子文件（原内容先备份，会话结束时还原），恢复只需一次 HTTP 调用
+   两种方式都不可用时（例如共用检出目录中的应用）不做快照/恢复
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+from config.config import get_config
+from utils import endpoints, timing
+from utils.app_state import atomic_replace
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+
+class DatabaseSnapshot:
+    """应用数据文件的快照，以及恢复耗时统计"""
+
+    def __init__(self, db_file: str, snapshot_dir: str, reseed_url: str, seed_file: Optional[str] = None):
+        """
+        :param db_file: 应用的数据文件（只读）
+        :param snapshot_dir: 快照和种子文件备份的存放目录
+        :param reseed_url: 重新加载数据的接口
+        :param seed_file: 接口读取的种子文件（必须是独立实例复制出来的文件）；为 None 时把快照作为请求体 POST 给接口
+        """
+        self.db_file = db_file
+        self.snapshot_dir = snapshot_dir
+        self.reseed_url = reseed_url
+        self.seed_file = seed_file
+        self.snapshot_path = os.path.join(snapshot_dir, os.path.basename(db_file) + ".snapshot")
+        self.seed_backup = os.path.join(snapshot_dir, os.path.basename(seed_file) + ".backup") if seed_file else None
+        self.restores = 0
+        self.restore_time = 0.0
+        self._payload: Optional[bytes] = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def method(self) -> str:
+        return "seed_file" if self.seed_file else "payload"
+
+    @classmethod
+    def from_config(cls, app_dir: str, source_dir: Optional[str] = None) -> Optional["DatabaseSnapshot"]:
+        """
+        按 yaml 中的 app.database 创建；没有配置数据文件/重新加载接口，或者只能改写检出目录中的种子文件时返回 None
+        :param app_dir: 应用运行的目录（独立实例时是实例目录）
+        :param source_dir: 应用检出目录，其中的文件不会被改写，默认 app.dir
+        """
+        db_config = config.app.database
+        if not db_config.file or not db_config.reseed_endpoint:
+            return None
+        seed_file = None
+        if not db_config.reseed_payload:
+            seed_file = os.path.join(app_dir, db_config.seed_file)
+            source_dir = os.path.realpath(source_dir or config.resolve_path(config.app.dir))
+            # 实例目录中没有复制的条目是链接到检出目录的，按真实路径判断
+            if os.path.realpath(seed_file).startswith(source_dir + os.sep):
+                logger.warning(f"种子文件 {seed_file} 在应用检出目录中，不做数据库快照/恢复"
+                               f"（使用独立实例，或后端接口接受请求体时设置 app.database.reseed_payload）")
+                return None
+        # 每个应用目录（独立实例各有一个）单独一个子目录，快照和种子备份互不覆盖
+        app_key = hashlib.md5(os.path.abspath(app_dir).encode("utf-8")).hexdigest()[:8]
+        return cls(
+            db_file=os.path.join(app_dir, db_config.file),
+            snapshot_dir=os.path.join(config.resolve_path(db_config.snapshot_dir), app_key),
+            reseed_url=endpoints.api_url() + "/" + db_config.reseed_endpoint.lstrip("/"),
+            seed_file=seed_file,
+        )
+
+    @staticmethod
+    def _atomic_copy(src: str, dst: str) -> None:
+        """复制到 dst（原子替换，见 atomic_replace）"""
+        with atomic_replace(dst) as tmp_path:
+            shutil.copyfile(src, tmp_path)
+
+    def snapshot(self) -> None:
+        """对当前数据做快照；种子文件方式下同时把快照写到（复制出来的）种子文件"""
+        start_time = time.perf_counter()
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self._atomic_copy(self.db_file, self.snapshot_path)
+        if self.seed_file:
+            # 备份已存在说明上次会话没有正常结束，那份备份才是原始种子文件，不能覆盖
+            if not os.path.exists(self.seed_backup):
+                shutil.copyfile(self.seed_file, self.seed_backup)
+            self._atomic_copy(self.snapshot_path, self.seed_file)
+        else:
+            with open(self.snapshot_path, "rb") as f:
+                self._payload = f.read()
+        duration = time.perf_counter() - start_time
+        timing.record("db_snapshot", duration)
+        logger.info(f"数据库快照完成: {self.db_file}，耗时 {duration * 1000:.1f}ms")
+
+    def restore(self) -> float:
+        """把数据恢复到快照，返回耗时（秒）"""
+        start_time = time.perf_counter()
+        with self._lock:
+            self._reseed()
+            duration = time.perf_counter() - start_time
+            self.restores += 1
+            self.restore_time += duration
+        timing.record("db_restore", duration, method=self.method)
+        return duration
+
+    def _reseed(self) -> None:
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        if self.seed_file:
+            response = self._session.post(self.reseed_url, timeout=10)
+        else:
+            response = self._session.post(self.reseed_url, data=self._payload, timeout=10,
+                                          headers={"Content-Type": "application/json"})
+        if response.status_code >= 400:
+            raise RuntimeError(f"重新加载数据失败: POST {self.reseed_url} 返回 {response.status_code}")
+
+    def cleanup(self) -> None:
+        """还原原始种子文件，关闭连接（快照文件保留，下次会话会覆盖）"""
+        if self.seed_backup and os.path.exists(self.seed_backup):
+            os.replace(self.seed_backup, self.seed_file)
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def summary(self) -> Optional[str]:
+        if not self.restores:
+            return None
+        return (f"数据库恢复: {self.restores} 次，总耗时 {self.restore_time:.2f}s，"
+                f"平均 {self.restore_time / self.restores * 1000:.1f}ms")
@@ -0,0 +1,36 @@
+
+"""
+当前进程使用的应用地址
+1）默认就是 yaml 中的 api.base_url / api.frontend_url
+2）每个 worker 使用独立实例时，由 AppManager 在分配端口后改成实例的地址，测试、接口客户端、用户池都从这里取
+"""
+from typing import Optional
+
+from config.config import get_config
+
+config = get_config()
+
+_API_URL: Optional[str] = None
+_FRONTEND_URL: Optional[str] = None
+
+
+def set_base_urls(api_url: Optional[str] = None, frontend_url: Optional[str] = None) -> None:
+    """设置当前进程的后端/前端地址，传 None 恢复为 yaml 中的默认值"""
+    global _API_URL, _FRONTEND_URL
+    _API_URL = api_url
+    _FRONTEND_URL = frontend_url
+
+
+def api_url() -> str:
+    """后端地址（不带结尾的 /）"""
+    return (_API_URL or config.api.base_url).rstrip("/")
+
+
+def frontend_url() -> str:
+    """前端地址（不带结尾的 /）"""
+    return (_FRONTEND_URL or config.api.frontend_url).rstrip("/")
+
+
+def is_default() -> bool:
+    """是否仍在使用 yaml 中的默认地址"""
+    return api_url() == config.api.base_url.rstrip("/")
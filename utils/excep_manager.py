@@ -4,22 +4,39 @@
 1）让上层（conftest.py、装饰器）只需要判断 manager.result.status，不关心启动细节。
 2）在AppManager 中增加了健康检查的缓存机制，无需每次测试之前都进行一次检查
 """
+import contextvars
 import os
+import re
 import subprocess
 import time
-import signal
+import threading
 import functools
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from typing import Optional, Dict, Any, Callable
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from enum import Enum
 
 import pytest
 
-from utils.operate_yaml import read_yaml
+from config.config import get_config, ServiceConfig
+from utils import timing
+from utils import endpoints
+from utils.app_state import SharedAppState, pid_alive
+from utils.data_store import DatabaseSnapshot
+from utils.health_monitor import HealthStatus, HealthMonitor
+from utils.instances import InstanceRegistry, prepare_instance_dir
+from utils.process_tree import ProcessRegistry, new_group_kwargs, terminate_tree, wait_ports_released
+from utils.readiness import ReadinessProbe, is_healthy
+from utils.stream_capture import StreamCapture
 
 logger = logging.getLogger(__name__)
-config=read_yaml("pytest_app_config.yaml")
+config = get_config()
+
+# 独立实例的服务因端口被占用启动失败时，重新分配端口的次数
+PORT_CONFLICT_RETRIES = 2
+# node（EADDRINUSE）、Python（Address already in use）等端口被占用时的输出
+ADDRESS_IN_USE = re.compile(r"EADDRINUSE|address already in use|address in use", re.IGNORECASE)
 
 class AppStatus(Enum):
     """应用状态枚举"""
@@ -30,38 +47,100 @@ class AppStatus(Enum):
     STOPPED = "应用启动终止"
 
 
+@dataclass
+class ServiceResult:
+    """单个服务的启动结果"""
+    name: str
+    status: AppStatus
+    process: Optional[subprocess.Popen] = None
+    error: Optional[str] = None
+    capture: Optional[StreamCapture] = None
+    # 附加到的已在运行的服务，结束时不停止
+    external: bool = False
+    # 最近一次健康检查结果，None 表示还没检查过
+    healthy: Optional[bool] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
 @dataclass
 class AppResult:
-    """应用启动结果"""
+    """应用启动结果；process/capture 为第一个服务（失败时 capture 为失败服务）的，services 按服务给出状态"""
     status: AppStatus
     process: Optional[subprocess.Popen] = None
     error: Optional[str] = None
-    stdout: str = ""
-    stderr: str = ""
+    capture: Optional[StreamCapture] = None
     start_time: float = field(default_factory=time.time)
     metadata: Dict[str, Any] = field(default_factory=dict)
+    services: Dict[str, ServiceResult] = field(default_factory=dict)
+
+    @property
+    def stdout(self) -> str:
+        """应用 stdout（环形缓冲区中最近的输出）"""
+        return self.capture.stdout.text() if self.capture else ""
+
+    @property
+    def stderr(self) -> str:
+        """应用 stderr（环形缓冲区中最近的输出）"""
+        return self.capture.stderr.text() if self.capture else ""
 
 
 class AppManager:
     """统一的应用管理器，提供异常处理和状态管理"""
 
-    def __init__(self, app_dir: str, max_retries: int = 2, health_check_url: Optional[str] = None):
+    def __init__(self, app_dir: str, max_retries: int = 2, health_check_url: Optional[str] = None,
+                 shared_state: Optional[SharedAppState] = None, worker_id: str = "master",
+                 attach_existing: bool = True, instances: Optional[InstanceRegistry] = None):
         """
         :param app_dir: 应用目录
         :param max_retries:最大重试次数
         :param health_check_url:健康检查网址
+        :param shared_state: xdist 多 worker 共享的状态文件，为 None 时按单进程方式管理应用
+        :param worker_id: 当前 worker 标识（xdist 下为 gw0、gw1...）
+        :param attach_existing: 启动前先做一次健康检查，应用已在运行时直接附加，不再启动新进程
+        :param instances: 实例注册表，传入时当前 worker 在独立的目录和端口上启动自己的实例（不能和 shared_state 同时使用）
         """
         self.app_dir = app_dir
         self.max_retries = max_retries
         self.health_check_url = health_check_url
+        self.shared_state = shared_state
+        self.worker_id = worker_id
+        self.attach_existing = attach_existing
+        # 启动失败时的处理策略（由 --app-fail-strategy 覆盖）
+        self.fail_strategy = config.pytest.fail_strategy
+        # 共享模式下，只有真正启动了应用的 worker 才负责停止应用
+        self._owns_shared_app = False
         self._app_result: Optional[AppResult] = None
         self._exception_handler: Optional[Callable] = None
-        #优化后：增加了缓存机制
-        self._health_check_cache = {
-            "status": None,
-            "timestamp": 0,
-            "ttl": 60  # 缓存60秒
-        }
+        # 唯一的一份健康状态缓存，应用运行期间由后台监控线程刷新
+        self.health = HealthStatus(ttl=config.app.health_monitor.ttl)
+        self._health_monitor: Optional[HealthMonitor] = None
+        # 后台启动（start_app_async）的结果，None 表示还没有开始启动
+        self._start_future: Optional[Future] = None
+        self._start_lock = threading.Lock()
+        # 重启互斥：同一进程内多个线程同时发现应用挂掉时只重启一次
+        self._restart_lock = threading.Lock()
+        # 共享状态文件中应用的“代数”，每次有 worker 真正启动应用时加 1，用于判断是否已被别人重启过
+        self._generation = 0
+        self.restart_count = 0
+        # 应用健康后做的数据库快照，测试之间据此恢复数据；未配置或不能隔离时为 None
+        self.database: Optional[DatabaseSnapshot] = None
+        # 要启动的服务；只配置了单个 command 时就是一个名为 app 的服务，健康检查地址以传入的为准
+        self.services = config.app.service_list()
+        if not config.app.services:
+            self.services = [replace(self.services[0], health_check=health_check_url)]
+        # 独立实例：租到的槽位（目录、端口、热实例进程），启动前才租借
+        self.instances = instances
+        self._slot: Optional[Dict[str, Any]] = None
+        self._source_app_dir = app_dir
+        self._source_health_check_url = health_check_url
+        self._source_services = list(self.services)
+        self._port_map: Dict[int, int] = {}
+        self._warm_pids: Dict[str, int] = {}
+        # 本进程启动的进程组登记，会话开始时据此清理上次崩溃留下的进程
+        self.processes = ProcessRegistry.from_config()
+        # 强制结束（温和结束超时）的进程组数，以及最近一次 stop_app 的耗时、端口释放情况
+        self.killed_groups = 0
+        self.teardown: Dict[str, Any] = {}
 
     def set_exception_handler(self, handler: Callable):
         """设置自定义异常处理器，这是为“可插拔异常处理”预留的接口。但此处还未被定义"""
@@ -79,178 +158,747 @@ class AppManager:
             self._default_exception_handler(result, test_item)
 
     def start_app(self) -> AppResult:
-        """启动应用，统一处理所有异常"""
-        for attempt in range(self.max_retries + 1):
-            try:
-                logger.info(f"尝试启动应用 (尝试 {attempt + 1}/{self.max_retries + 1})")
-
-                # 检查应用目录是否存在
-                import os
-                if not os.path.exists(self.app_dir):
-                    error_msg = f"应用目录不存在: {self.app_dir}"
-                    logger.error(error_msg)
-                    if attempt == self.max_retries:
-                        self._app_result = AppResult(
-                            status=AppStatus.FAILED,
-                            error=error_msg
-                        )
-                        return self._app_result
-                    continue
-
-                # 启动应用（Windows 需要 shell=True）
-                import platform
-                is_windows = platform.system() == "Windows"
-                startup_command=config["app"]["command"]
-
-                
-                # 启动应用
-                process = subprocess.Popen(
-                    startup_command,  # 使用配置文件中的启动命令
-                    cwd=self.app_dir,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    encoding='utf-8',
-                    shell=is_windows
-                )
-
-                # 等待并检查启动状态
-                time.sleep(2)  # 初始等待
-
-                if process.poll() is not None:
-                    # 进程已退出
-                    stdout, stderr = process.communicate()
-                    error_msg = f"进程已退出，返回码: {process.returncode}"
-
-                    self._app_result = AppResult(
-                        status=AppStatus.FAILED,
-                        error=error_msg,
-                        stdout=stdout,
-                        stderr=stderr
-                    )
+        """启动应用，统一处理所有异常；共享模式下由一个 worker 启动，其余 worker 直接附加"""
+        if self.shared_state:
+            result = self._start_shared_app()
+        else:
+            result = self._start_local_app()
 
-                    if attempt == self.max_retries:
-                        return self._app_result
-                    continue
+        if result.status == AppStatus.RUNNING:
+            # 刚确认过就绪，直接写入缓存，然后交给后台线程刷新
+            self.health.update(True)
+            self._start_health_monitor()
+            self.snapshot_database()
+        return result
 
-                # 健康检查
-                if self.health_check_url:
-                    if not self._health_check(process):
-                        process.terminate()
-                        process.wait()
-
-                        if attempt == self.max_retries:
-                            self._app_result = AppResult(
-                                status=AppStatus.FAILED,
-                                error="健康检查失败",
-                                process=process
-                            )
-                            return self._app_result
-                        continue
+    def snapshot_database(self, refresh: bool = False) -> None:
+        """
+        对应用数据做快照（应用健康后自动调用；用户池补齐后会 refresh 一次，让预创建的用户也在快照里）
+        多个 worker 共用一个应用时不做：一个 worker 恢复数据会清掉其他 worker 正在用的数据；
+        附加到不是本次会话启动的应用时默认也不做（app.database.isolate_attached）
+        :param refresh: 已有快照时是否重新快照；重启应用后保留原快照，而不是把测试留下的数据当成快照
+        """
+        if self.shared_state:
+            if config.app.database.file:
+                logger.warning("多个 worker 共用同一个应用，不做数据库快照/恢复")
+            return
+        if self.database is not None and not refresh:
+            return
+        attached = self._slot is None and self._app_result and self._app_result.metadata.get("external")
+        if attached and not config.app.database.isolate_attached:
+            # 别人启动的应用（例如本地开发中的实例）里的数据不归测试管，恢复快照会把它清掉
+            if config.app.database.file and not refresh:
+                logger.warning("应用不是本次会话启动的，不做数据库快照/恢复（需要时设置 app.database.isolate_attached）")
+            return
+        try:
+            if self.database is None:
+                self.database = DatabaseSnapshot.from_config(self.app_dir, self._source_app_dir)
+            if self.database:
+                self.database.snapshot()
+        except OSError as e:
+            logger.warning(f"数据库快照失败，测试之间不恢复数据: {e}")
+            self.database = None
+
+    def restore_database(self) -> Optional[float]:
+        """把应用数据恢复到快照，返回耗时（秒）；没有快照时返回 None"""
+        if self.database is None or not self.result or self.result.status != AppStatus.RUNNING:
+            return None
+        return self.database.restore()
+
+    def restart_app(self) -> AppResult:
+        """
+        应用挂掉后重启（加锁，只重启一次）：
+        1）拿到锁后先强制做一次健康检查，别的线程/worker 已经重启好时直接复用
+        2）单进程模式停止旧进程后重新启动；共享模式见 _restart_shared_app，只有 owner 会结束并重启应用
+        """
+        with self._restart_lock, timing.timed("app_restart") as info:
+            if self.quick_health_check(force=True):
+                info["outcome"] = "already_healthy"
+                return self._app_result
 
-                # 启动成功
+            logger.warning(f"[{self.worker_id}] 应用不健康，尝试重启")
+            self._stop_health_monitor()
+            if self.shared_state:
+                result = self._restart_shared_app()
+                if result.status == AppStatus.RUNNING:
+                    self._start_health_monitor()
+                info["outcome"] = result.status.name
+                return result
+
+            self._stop_local_app(release=False)
+            self.restart_count += 1
+            result = self.start_app()
+            info["outcome"] = result.status.name
+            if result.status == AppStatus.RUNNING:
+                # 重启后的数据是测试留下的，恢复到原快照
+                self.restore_database()
+            return result
+
+    def _restart_shared_app(self) -> AppResult:
+        """
+        共享模式重启：
+        1）owner（或 owner 进程已经不在时接管的 worker）把状态文件中的当前这一代作废、结束旧进程，
+        再由 _start_shared_app 重新启动
+        2）其他 worker 不碰 owner 的进程，只在状态文件中登记 restart_requested，等 owner 启动新一代后附加；
+        等待期间应用恢复健康就直接返回，超时则按启动失败处理
+        3）当前这一代已经被作废（别人正在或已经重启好）时直接交给 _start_shared_app 等待/附加
+        """
+        state_file = self.shared_state
+        wait_timeout = config.app.startup_timeout * (self.max_retries + 1) + 30
+        deadline = time.time() + wait_timeout
+        requested = False
+        while True:
+            with state_file.locked():
+                state = state_file.read()
+                current = state.get("generation", 0) == self._generation \
+                    and state.get("status") != AppStatus.STARTING.name
+                # 状态文件中的 owner 才是当前这一代的负责人（重启时可能已经换成别的 worker）
+                can_restart = state.get("owner") == self.worker_id or not pid_alive(state.get("owner_pid"))
+                if current and can_restart:
+                    state["status"] = AppStatus.STOPPED.name
+                    state.pop("restart_requested", None)
+                    state_file.write(state)
+                    self._kill_stale_app(state.get("app_pid"))
+                elif current and not requested:
+                    state["restart_requested"] = self.worker_id
+                    state_file.write(state)
+                    requested = True
+            if not current or can_restart:
+                if current:
+                    self.restart_count += 1
+                return self.start_app()
+
+            if self.quick_health_check(force=True):
+                return self._app_result
+            if time.time() > deadline:
                 self._app_result = AppResult(
-                    status=AppStatus.RUNNING,
-                    process=process,
-                    metadata={"attempt": attempt + 1}
+                    status=AppStatus.FAILED,
+                    error=f"等待 {state.get('owner')} 重启应用超时（{wait_timeout}s）",
+                    metadata={"shared": True, "owner": state.get("owner")}
                 )
-
-                logger.info("应用启动成功")
                 return self._app_result
+            time.sleep(1)
 
-            except Exception as e:
-                logger.error(f"启动尝试 {attempt + 1} 失败: {str(e)}")
+    def _kill_stale_app(self, app_pid: Optional[int]) -> None:
+        """
+        共享模式重启前结束卡死的旧进程，避免新进程端口冲突；
+        只由 owner 调用，或者 owner 进程已经不在时由接管的 worker 结束它留下的进程
+        """
+        if self._owns_shared_app:
+            self._stop_local_app()
+        elif app_pid and pid_alive(app_pid):
+            self._terminate(app_pid)
 
-                if attempt == self.max_retries:
+    def start_app_async(self) -> Future:
+        """
+        在后台线程中启动应用（重复调用只会启动一次），返回结果的 Future
+        会话收集完成后就开始启动，和会话级 fixture、浏览器启动并行进行，测试真正需要时再 wait_for_app
+        """
+        with self._start_lock:
+            if self._start_future is None:
+                future: Future = Future()
+
+                def run():
+                    try:
+                        future.set_result(self.start_app())
+                    except BaseException as e:
+                        future.set_exception(e)
+
+                self._start_future = future
+                threading.Thread(target=run, name="app-startup", daemon=True).start()
+            return self._start_future
+
+    def wait_for_app(self, timeout: Optional[float] = None) -> AppResult:
+        """等待应用启动完成（还没开始启动时立即开始），返回启动结果"""
+        future = self.start_app_async()
+        if future.done():
+            return future.result()
+        with timing.timed("app_wait"):
+            return future.result(timeout)
+
+    @property
+    def started(self) -> bool:
+        """是否已经开始启动（后台启动中或已完成）"""
+        return self._start_future is not None
+
+    def _start_health_monitor(self) -> None:
+        """应用运行后启动后台健康监控（keep-alive 连接，定时刷新缓存）"""
+        if not self.health_check_url or self._health_monitor:
+            return
+        self._health_monitor = HealthMonitor(
+            self.health_check_url,
+            self.health,
+            interval=config.app.health_monitor.interval
+        ).start()
+
+    def _stop_health_monitor(self) -> None:
+        if self._health_monitor:
+            self._health_monitor.stop()
+            self._health_monitor = None
+
+    def _start_shared_app(self) -> AppResult:
+        """
+        共享模式启动：
+        1）状态为 RUNNING 且应用进程存活 -> 登记为使用者后直接附加，不再重复启动
+        2）状态为 FAILED -> 直接复用失败结果，避免每个 worker 再等一遍启动超时
+        3）没有人在启动（或负责启动的 worker 已崩溃） -> 当前 worker 接管并真正启动应用
+        4）其他 worker 正在启动 -> 轮询状态文件等待结果
+        """
+        state_file = self.shared_state
+        wait_timeout = config.app.startup_timeout * (self.max_retries + 1) + 30
+        deadline = time.time() + wait_timeout
+
+        while True:
+            with state_file.locked():
+                state = state_file.read()
+                status = state.get("status")
+                app_pid = state.get("app_pid")
+
+                if status == AppStatus.RUNNING.name and (app_pid is None or pid_alive(app_pid)):
+                    state.setdefault("clients", {})[self.worker_id] = os.getpid()
+                    state_file.write(state)
+                    self._generation = state.get("generation", 0)
+                    # 重启时别的 worker 抢先启动了新一代，当前 worker 不再是 owner
+                    self._owns_shared_app = state.get("owner") == self.worker_id
+                    self._app_result = AppResult(
+                        status=AppStatus.RUNNING,
+                        metadata={"shared": True, "attached": True, "owner": state.get("owner"), "app_pid": app_pid}
+                    )
+                    logger.info(f"[{self.worker_id}] 附加到 {state.get('owner')} 启动的应用")
+                    return self._app_result
+
+                if status == AppStatus.FAILED.name:
+                    self._generation = state.get("generation", 0)
                     self._app_result = AppResult(
                         status=AppStatus.FAILED,
-                        error=str(e),
-                        metadata={"last_exception": e}
+                        error=state.get("error") or "应用启动失败（由其他 worker 报告）",
+                        metadata={"shared": True, "owner": state.get("owner")}
                     )
                     return self._app_result
 
+                if status != AppStatus.STARTING.name or not pid_alive(state.get("owner_pid")):
+                    # 重启时保留其他 worker 的登记，新的 owner 要等它们都注销后才能停止应用
+                    self._generation = state.get("generation", 0) + 1
+                    state_file.write({
+                        "status": AppStatus.STARTING.name,
+                        "owner": self.worker_id,
+                        "owner_pid": os.getpid(),
+                        "generation": self._generation,
+                        "clients": {**state.get("clients", {}), self.worker_id: os.getpid()},
+                    })
+                    break
+
+            if time.time() > deadline:
+                self._app_result = AppResult(
+                    status=AppStatus.FAILED,
+                    error=f"等待其他 worker 启动应用超时（{wait_timeout}s）",
+                    metadata={"shared": True}
+                )
+                return self._app_result
+            time.sleep(0.05)
+
+        # 当前 worker 成为 owner，真正启动应用，并把结果发布到状态文件
+        self._owns_shared_app = True
+        result = self._start_local_app()
+        with state_file.locked():
+            state = state_file.read()
+            state.update({
+                "status": result.status.name,
+                "app_pid": result.process.pid if result.process else None,
+                "healthy": result.status == AppStatus.RUNNING,
+                "checked_at": time.time(),
+                "error": result.error,
+            })
+            state_file.write(state)
+        result.metadata.update({"shared": True, "owner": self.worker_id})
+        return result
+
+    def _start_local_app(self) -> AppResult:
+        """
+        在当前进程中启动所有服务：
+        1）没有依赖关系的服务并发启动、并行探测就绪，依赖的服务全部就绪后才启动下游服务
+        2）已在运行且健康的服务直接附加（不会在结束时停止它），只启动没有运行的服务
+        3）任一服务失败时，停止本次已启动的其他服务，结果中按服务给出状态
+        """
+        # 检查应用目录是否存在
+        if not os.path.exists(self.app_dir):
+            error_msg = f"应用目录不存在: {self.app_dir}"
+            logger.error(error_msg)
+            self._app_result = AppResult(status=AppStatus.FAILED, error=error_msg)
+            return self._app_result
+
+        if self.instances and self._slot is None:
+            try:
+                self._prepare_instance()
+            except (OSError, TimeoutError) as e:
+                self._app_result = AppResult(status=AppStatus.FAILED, error=f"准备独立实例失败: {e}")
+                return self._app_result
+
+        result = self._start_services()
+        # 分配端口到服务真正监听之间，端口可能被别的程序抢走：给这些服务换端口后整体重新启动
+        for _ in range(PORT_CONFLICT_RETRIES):
+            if result.status == AppStatus.RUNNING or self._slot is None:
+                break
+            busy = [r.name for r in result.services.values()
+                    if r.status != AppStatus.RUNNING and self._address_in_use(r)]
+            if not busy:
+                break
+            ports = self.instances.reassign_ports(self._slot["index"], busy)
+            logger.warning(f"[{self.worker_id}] 服务 {busy} 的端口已被占用，重新分配端口后再启动: {ports}")
+            self._slot["ports"] = ports
+            self._apply_ports(ports)
+            result = self._start_services()
+        return result
+
+    def _start_services(self) -> AppResult:
+        """按依赖关系启动所有服务，结果同时保存到 self._app_result"""
+        services = {service.name: service for service in self.services}
+        results: Dict[str, ServiceResult] = {}
+        pending = dict(services)
+        futures: Dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=len(services), thread_name_prefix="service-start") as executor:
+            while pending or futures:
+                for name, service in list(pending.items()):
+                    deps = [results.get(dep) for dep in service.depends_on]
+                    failed_deps = [dep for dep, r in zip(service.depends_on, deps)
+                                   if r is not None and r.status != AppStatus.RUNNING]
+                    if failed_deps:
+                        results[name] = ServiceResult(name, AppStatus.FAILED,
+                                                      error=f"依赖的服务未就绪: {failed_deps}")
+                        del pending[name]
+                    elif all(r is not None for r in deps):
+                        # 复制调用方的上下文：测试中重启应用时，启动尝试的耗时仍归到这条测试（utils.timing）
+                        futures[executor.submit(contextvars.copy_context().run, self._start_service, service)] = name
+                        del pending[name]
+                if not futures:
+                    continue
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures.pop(future)] = future.result()
+
+        # 按配置顺序汇总
+        ordered = {name: results[name] for name in services}
+        failed = [r for r in ordered.values() if r.status != AppStatus.RUNNING]
+        primary = next((r for r in ordered.values() if r.process), None)
+        if failed:
+            self._stop_services(ordered.values())
+            culprit = next((r for r in failed if r.capture), None)
+            self._app_result = AppResult(
+                status=AppStatus.FAILED,
+                error="; ".join(f"服务 {r.name}: {r.error}" for r in failed),
+                process=primary.process if primary else None,
+                capture=(culprit or primary).capture if (culprit or primary) else None,
+                services=ordered,
+            )
+            return self._app_result
+
+        self._app_result = AppResult(
+            status=AppStatus.RUNNING,
+            process=primary.process if primary else None,
+            capture=primary.capture if primary else None,
+            services=ordered,
+            metadata={
+                "external": all(r.external for r in ordered.values()),
+                "time_to_ready": max(r.metadata.get("time_to_ready") or 0.0 for r in ordered.values()),
+                "ready_signal": {name: r.metadata.get("ready_signal") for name, r in ordered.items()},
+            }
+        )
+        logger.info(f"应用启动成功: {', '.join(ordered)}")
         return self._app_result
 
-    def _health_check(self, process: subprocess.Popen, timeout: int = 30) -> bool:
-        """执行健康检查
-        处理器处理的第二类异常：请求异常
+    def _prepare_instance(self) -> None:
         """
-        import requests
-        from requests.exceptions import RequestException
-        #超时了就算失败
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if process.poll() is not None:
-                return False
-
+        租借实例槽位并改写服务配置：工作目录换成实例目录，端口换成分配的端口并通过环境变量传给命令，
+        健康检查地址和测试使用的前后端地址（utils.endpoints）同步改成实例的端口
+        """
+        instances_config = config.app.instances
+        source_services = self._source_services
+        slot = self.instances.lease(self._source_app_dir, [service.name for service in source_services])
+        self._slot = slot
+        prepare_instance_dir(self._source_app_dir, slot["dir"], instances_config.copy)
+
+        # 上次会话留下的热实例：不复用（或不允许附加）时先结束，避免占着端口
+        warm_pids = {name: pid for name, pid in slot.get("pids", {}).items() if pid_alive(pid)}
+        if warm_pids and not (instances_config.reuse and self.attach_existing):
+            for pid in warm_pids.values():
+                self._terminate(pid)
+            warm_pids = {}
+        self._warm_pids = warm_pids
+
+        self.app_dir = slot["dir"]
+        self._apply_ports(slot["ports"])
+        logger.info(f"[{self.worker_id}] 使用实例 slot-{slot['index']}，端口 {slot['ports']}")
+
+    def _apply_ports(self, ports: Dict[str, int]) -> None:
+        """按实例端口改写服务配置、健康检查地址和 utils.endpoints（重新分配端口后再调用一次）"""
+        instances_config = config.app.instances
+        source_services = self._source_services
+        port_env = {f"{name.upper()}_PORT": str(port) for name, port in ports.items()}
+        self._port_map = {service.port: ports[service.name] for service in source_services}
+
+        services = []
+        for service in source_services:
+            env = {key: value.format(**port_env) for key, value in {**instances_config.env, **service.env}.items()}
+            env["PORT"] = str(ports[service.name])
+            env.update(port_env)
+            services.append(replace(
+                service,
+                port=ports[service.name],
+                health_check=self.rewrite_url(service.health_check),
+                env=env,
+            ))
+        self.services = services
+        self.health_check_url = self.rewrite_url(self._source_health_check_url)
+        endpoints.set_base_urls(self.rewrite_url(config.api.base_url), self.rewrite_url(config.api.frontend_url))
+
+    def _address_in_use(self, result: ServiceResult) -> bool:
+        """服务是否因为端口被占用而启动失败（看输出；保留为热实例的服务输出在实例目录的日志文件里）"""
+        text = result.error or ""
+        if result.capture:
+            text += result.capture.stderr.text() + result.capture.stdout.text()
+        else:
+            log_path = os.path.join(self.app_dir, f"{result.name}.log")
             try:
-                #只有在返回码为200才行
-                response = requests.get(self.health_check_url, timeout=2)
-                if response.status_code == 200:
-                    return True
-            except RequestException:
+                with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+                    f.seek(max(0, os.path.getsize(log_path) - 64 * 1024))
+                    text += f.read()
+            except OSError:
                 pass
+        return bool(ADDRESS_IN_USE.search(text))
+
+    def rewrite_url(self, url: Optional[str]) -> Optional[str]:
+        """把配置中的地址改成当前实例的端口（没有使用独立实例时原样返回）"""
+        if not url or not self._port_map:
+            return url
+        return re.sub(r":(\d+)(?=/|$)",
+                      lambda m: f":{self._port_map.get(int(m.group(1)), m.group(1))}", url, count=1)
+
+    def _start_service(self, service: ServiceConfig) -> ServiceResult:
+        """启动单个服务（带重试），在线程池中执行"""
+        health_url = service.health_url
+        # 本地/CI 上服务经常已经在运行，先探测一次，健康就直接附加，避免端口冲突和 30 秒启动
+        if self.attach_existing and health_url and is_healthy(health_url, timeout=1):
+            logger.info(f"检测到服务 {service.name} 已在运行，直接附加: {health_url}")
+            return ServiceResult(service.name, AppStatus.RUNNING, external=True, healthy=True,
+                                 metadata={"time_to_ready": 0.0, "ready_signal": "external"})
+
+        cwd = os.path.join(self.app_dir, service.dir) if service.dir else self.app_dir
+        env = {**os.environ, **service.env} if service.env else None
+        startup_timeout = service.startup_timeout or config.app.startup_timeout
+        # 启动应用（Windows 需要 shell=True）
+        import platform
+        is_windows = platform.system() == "Windows"
+        result = ServiceResult(service.name, AppStatus.FAILED, error="未启动")
+        # 要保留为热实例的服务不能用管道：本进程退出后管道断开，应用再写输出会出错退出
+        detached = self._slot is not None and config.app.instances.reuse
+        log_path = os.path.join(self.app_dir, f"{service.name}.log") if detached else None
 
-            time.sleep(1)
+        for attempt in range(self.max_retries + 1):
+            # 每次启动尝试单独计时（由 plugins/timing.py 输出）
+            with timing.timed("app_start_attempt", attempt=attempt + 1, service=service.name):
+                process = None
+                try:
+                    logger.info(f"尝试启动服务 {service.name} (尝试 {attempt + 1}/{self.max_retries + 1})")
+                    if detached:
+                        # 输出写文件、放到新的进程组中，本进程退出后实例继续运行；就绪只能靠健康检查判断
+                        with open(log_path, "a", encoding="utf-8") as log:
+                            process = subprocess.Popen(
+                                service.command, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=log,
+                                stderr=subprocess.STDOUT, shell=is_windows, **new_group_kwargs()
+                            )
+                        self.processes.add(process.pid, service.name)
+                        probe = ReadinessProbe(health_url, ready_pattern=None)
+                        capture = None
+                    else:
+                        process = subprocess.Popen(
+                            service.command,  # 使用配置文件中的启动命令
+                            cwd=cwd,
+                            env=env,
+                            # Windows 下 CTRL_BREAK 结束 yarn.cmd 时，cmd 会询问“终止批处理操作吗”，stdin 为空时直接结束
+                            stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            text=True,
+                            encoding='utf-8',
+                            # 输出不一定是 UTF-8（如 GBK 控制台），无法解码的字节替换掉，否则读取线程会因解码错误退出
+                            errors='replace',
+                            shell=is_windows,
+                            # 独立的进程组：停止时连同 yarn 拉起的 node 子进程一起结束
+                            **new_group_kwargs()
+                        )
+                        self.processes.add(process.pid, service.name)
+                        # 等待就绪：健康检查指数退避 + 可选的 stdout 就绪正则，任一信号满足即可
+                        probe = ReadinessProbe(health_url, ready_pattern=service.ready_pattern)
+                        capture = self._capture_output(process, probe, service.name)
+                    ready = probe.wait(process, timeout=startup_timeout)
+
+                    if process.poll() is not None:
+                        # 组长已退出，它拉起的子进程可能还占着端口，重试前一起结束；再等读取线程把剩余输出读完
+                        self._terminate(process.pid, process)
+                        if capture:
+                            capture.close()
+                        error = f"进程已退出，返回码: {process.returncode}"
+                        result = ServiceResult(service.name, AppStatus.FAILED, capture=capture,
+                                               error=error + (f"（输出见 {log_path}）" if log_path else ""))
+                        continue
 
-        return False
+                    if not ready:
+                        self._terminate(process.pid, process)
+                        if capture:
+                            capture.close()
+                        result = ServiceResult(service.name, AppStatus.FAILED, process=process, capture=capture,
+                                               error="健康检查失败",
+                                               metadata={"health_probes": probe.health_probes})
+                        continue
+
+                    logger.info(f"服务 {service.name} 启动成功")
+                    return ServiceResult(
+                        service.name, AppStatus.RUNNING, process=process, capture=capture, healthy=True,
+                        metadata={
+                            "attempt": attempt + 1,
+                            "time_to_ready": probe.time_to_ready,
+                            "ready_signal": probe.ready_signal,
+                            "health_probes": probe.health_probes,
+                        }
+                    )
 
-    def quick_health_check(self, force: bool = False) -> None | int | bool:
+                except Exception as e:
+                    logger.error(f"服务 {service.name} 启动尝试 {attempt + 1} 失败: {str(e)}")
+                    if process is not None:
+                        # 启动后才出错（如读取输出失败），不结束就会在重试时泄漏一个进程
+                        self._terminate(process.pid, process)
+                    result = ServiceResult(service.name, AppStatus.FAILED, error=str(e),
+                                           metadata={"last_exception": e})
+
+        return result
+
+    @staticmethod
+    def _capture_output(process: subprocess.Popen, probe: ReadinessProbe, service_name: str = "app") -> StreamCapture:
+        """后台持续读取 stdout/stderr 到环形缓冲区，stdout 同时交给就绪探测器；多个服务各写各的日志文件"""
+        output_config = config.app.output
+        log_file = config.resolve_path(output_config.log_file)
+        if log_file and config.app.services:
+            root, ext = os.path.splitext(log_file)
+            log_file = f"{root}.{service_name}{ext}"
+        return StreamCapture(
+            process,
+            max_lines=output_config.buffer_lines,
+            log_file=log_file,
+            log_max_bytes=output_config.log_max_bytes,
+            log_backups=output_config.log_backups,
+            on_stdout_line=probe.feed_line
+        ).start()
+
+    def check_services(self) -> Dict[str, bool]:
+        """并行探测每个服务的健康状态（结果同时写回 result.services），用于区分“前端正常但后端挂了”"""
+        services = [service for service in self.services if service.health_url]
+        if not services:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(services), thread_name_prefix="service-health") as executor:
+            states = dict(zip(
+                (service.name for service in services),
+                executor.map(lambda service: is_healthy(service.health_url), services)
+            ))
+        if self._app_result:
+            for name, healthy in states.items():
+                if name in self._app_result.services:
+                    self._app_result.services[name].healthy = healthy
+        return states
+
+    def quick_health_check(self, force: bool = False) -> bool:
         """
-        快速健康检查（带缓存）
+        快速健康检查：优先读后台监控刷新的缓存，缓存过期或 force 时才真正请求
         :param force: 是否强制检查（忽略缓存）
         :return: 应用是否健康
         """
-        import time
-
-        # 检查缓存
-        if not force:
-            cache = self._health_check_cache
-            current_time = time.time()
-            if cache["status"] is not None and (current_time - cache["timestamp"]) < cache["ttl"]:
-                return cache["status"]
-
-        # 执行实际检查
         if not self.health_check_url:
             return True
 
-        try:
-            import requests
-            response = requests.get(self.health_check_url, timeout=2)
-            is_healthy = response.status_code == 200
-
-            # 更新缓存
-            self._health_check_cache = {
-                "status": is_healthy,
-                "timestamp": time.time(),
-                "ttl": 60
-            }
-            return is_healthy
-        except Exception:
-            self._health_check_cache = {
-                "status": False,
-                "timestamp": time.time(),
-                "ttl": 60
-            }
-            return False
-
+        if not force:
+            cached = self.health.get()
+            if cached is not None:
+                return cached
+
+        if len(self.services) > 1:
+            # 多个服务时要求全部健康，只看其中一个会漏掉“前端正常但后端挂了”
+            healthy = all(self.check_services().values())
+            self.health.update(healthy)
+            return healthy
+        if self._health_monitor:
+            return self._health_monitor.probe()
+        healthy = is_healthy(self.health_check_url)
+        self.health.update(healthy)
+        return healthy
 
     def stop_app(self):
         """
         停止应用：
         需要主动调用，调用时会先检查应用状态，如果还在进程中，才由停止进程的必要
+        共享模式下先注销当前 worker，只有 owner 会在所有使用者都释放后真正停止应用
+        停止后确认本进程启动的服务端口都已释放，并记录停止耗时（由 plugins/timing.py 输出）
         """
-        if self._app_result and self._app_result.process:
+        start_time = time.perf_counter()
+        killed_before = self.killed_groups
+        self._stop_health_monitor()
+        if self.shared_state:
+            self._stop_shared_app()
+        else:
+            self._stop_local_app()
+        if self.database:
+            self.database.cleanup()
+
+        busy_ports = wait_ports_released(self._stopped_ports())
+        if busy_ports:
+            logger.warning(f"应用停止后端口仍被占用: {busy_ports}")
+        duration = time.perf_counter() - start_time
+        self.teardown = {"duration": duration, "killed": self.killed_groups - killed_before, "busy_ports": busy_ports}
+        timing.record("app_teardown", duration, killed=self.teardown["killed"], busy_ports=busy_ports)
+        logger.info(f"应用停止耗时 {duration:.2f}s")
+
+    def _stopped_ports(self):
+        """本进程启动、刚刚停止的服务的端口（外部服务和保留为热实例的服务不算）"""
+        if not self._app_result:
+            return []
+        services = {service.name: service for service in self.services}
+        ports = []
+        for name, service_result in self._app_result.services.items():
+            service = services.get(name)
+            if service is None or service_result.external or not service_result.process \
+                    or service_result.status != AppStatus.STOPPED:
+                continue
+            port = service.port
+            if not port and service.health_url:
+                from urllib.parse import urlsplit
+                port = urlsplit(service.health_url).port
+            if port:
+                ports.append(port)
+        return ports
+
+    def _terminate(self, pid: int, process: Optional[subprocess.Popen] = None) -> str:
+        """结束进程树（温和结束超时后强制结束）并删除登记"""
+        outcome = terminate_tree(pid, process=process)
+        if outcome == "killed":
+            self.killed_groups += 1
+        self.processes.remove(pid)
+        return outcome
+
+    def teardown_summary(self) -> Optional[str]:
+        if not self.teardown:
+            return None
+        summary = f"应用停止: 耗时 {self.teardown['duration']:.2f}s，强制结束 {self.teardown['killed']} 个进程组"
+        if self.teardown["busy_ports"]:
+            summary += f"，端口仍被占用: {self.teardown['busy_ports']}"
+        return summary
+
+    def _stop_shared_app(self):
+        """
+        共享模式停止：非 owner 只注销自己；owner 等待其他存活的 worker 全部注销后再停止应用，
+        等待期间处理其他 worker 的重启请求
+        """
+        state_file = self.shared_state
+        self._unregister_client()
+
+        if not self._owns_shared_app:
+            if self._app_result and self._app_result.status == AppStatus.RUNNING:
+                self._app_result.status = AppStatus.STOPPED
+            return
+
+        while True:
+            with state_file.locked():
+                state = state_file.read()
+                # 已崩溃的 worker 不会再注销，这里顺手清理掉
+                clients = {wid: pid for wid, pid in state.get("clients", {}).items() if pid_alive(pid)}
+                if not clients:
+                    state.update({"status": AppStatus.STOPPED.name, "clients": {}, "healthy": False})
+                    state_file.write(state)
+                    break
+                requested = state.pop("restart_requested", None)
+                if requested:
+                    state_file.write(state)
+            if requested:
+                # owner 自己的测试已经跑完，其他 worker 还在用应用并请求重启
+                logger.info(f"[{self.worker_id}] {requested} 请求重启应用")
+                self.restart_app()
+                self._stop_health_monitor()
+                # 重新启动时会把当前 worker 登记为使用者，这里再注销一次
+                self._unregister_client()
+                continue
+            time.sleep(0.2)
+
+        self._stop_local_app()
+
+    def _unregister_client(self) -> None:
+        with self.shared_state.locked():
+            state = self.shared_state.read()
+            state.get("clients", {}).pop(self.worker_id, None)
+            self.shared_state.write(state)
+
+    def _stop_local_app(self, release: bool = True):
+        """
+        停止当前进程启动的应用；附加到的外部应用不是本进程启动的，绝不停止
+        :param release: 独立实例是否归还槽位；重启时为 False，停止后在同一个槽位（同样的端口）上重新启动
+        """
+        if self._slot is not None:
+            self._release_instance(release)
+            return
+        if self._app_result and self._app_result.metadata.get("external"):
+            logger.info("应用为外部启动，不做停止操作...")
+            self._app_result.status = AppStatus.STOPPED
+            return
+        if self._app_result and self._app_result.services:
             logger.info("停止应用...")
-            self._app_result.process.terminate()
-            self._app_result.process.wait()
+            self._stop_services(self._app_result.services.values())
+            self._app_result.status = AppStatus.STOPPED
+        elif self._app_result and self._app_result.process:
+            logger.info("停止应用...")
+            self._terminate(self._app_result.process.pid, self._app_result.process)
+            if self._app_result.capture:
+                self._app_result.capture.close()
             self._app_result.status = AppStatus.STOPPED
         else:
             logger.info("进程已经停止，无需进行操作...")
 
+    def _release_instance(self, release: bool) -> None:
+        """独立实例：会话结束且开启 reuse 时保留为热实例（记下进程号），否则停止；release 时归还槽位"""
+        services = self._app_result.services if self._app_result else {}
+        running = self._app_result is not None and self._app_result.status == AppStatus.RUNNING
+        if release and running and config.app.instances.reuse:
+            pids = dict(self._warm_pids)
+            pids.update({name: r.process.pid for name, r in services.items() if r.process})
+            # 热实例交给实例注册表管理，不能被当成孤儿进程清理
+            for pid in pids.values():
+                self.processes.remove(pid)
+            logger.info(f"保留热实例 slot-{self._slot['index']}，下次会话直接复用")
+        else:
+            pids = {}
+            self._stop_services(services.values())
+            # 附加到的上次会话的热实例不在 services 的进程里，按进程号结束
+            for pid in self._warm_pids.values():
+                self._terminate(pid)
+            self._warm_pids = {}
+        if self._app_result:
+            self._app_result.status = AppStatus.STOPPED
+        if release:
+            self.instances.release(self._slot["index"], pids)
+            self._slot = None
+
+    def _stop_services(self, results) -> None:
+        """按启动的逆序停止本进程启动的服务（下游服务先停），外部服务不动"""
+        for service_result in reversed(list(results)):
+            if service_result.external or not service_result.process:
+                continue
+            # 组长已退出时它拉起的子进程可能还在，照样按进程组结束
+            logger.info(f"停止服务 {service_result.name}...")
+            self._terminate(service_result.process.pid, service_result.process)
+            if service_result.capture:
+                service_result.capture.close()
+            service_result.status = AppStatus.STOPPED
+
     @property
     def result(self) -> Optional[AppResult]:
-        """获取启动结果"""
+        """获取启动结果；后台启动尚未完成时返回 None（重试过程中的中间结果不对外暴露）"""
+        if self._start_future is not None and not self._start_future.done():
+            return None
         return self._app_result
 
 def handle_app_failure(app_manager: AppManager, strategy: str = None, test_item=None) -> None:
@@ -267,15 +915,17 @@ def handle_app_failure(app_manager: AppManager, strategy: str = None, test_item=
 
     # 构建错误信息
     error_msg = f"应用启动失败: {app_manager.result.error}"
-    if app_manager.result.stderr:
-        error_msg += f"\n错误输出:\n{app_manager.result.stderr[:500]}..."
+    capture = app_manager.result.capture
+    if capture and capture.stderr.total_lines:
+        # 只取最近的输出，真正的报错通常在最后几行
+        error_msg += f"\n错误输出（最近 20 行）:\n{capture.stderr.tail(20)}"
 
     # 获取策略
     if strategy is None:
         if test_item and hasattr(test_item, 'config'):
             strategy = test_item.config.getoption("--app-fail-strategy", "skip")
         else:
-            strategy = "skip"
+            strategy = app_manager.fail_strategy
 
     # 根据策略处理
     if strategy == "fail":
@@ -0,0 +1,110 @@
+
+"""
+应用健康监控 - 后台线程定时检查应用健康状态，写入唯一的一份状态缓存
+1）检查复用同一个 requests.Session（keep-alive），不再每次新建连接
+2）每条测试前的检查只读缓存，O(1) 且没有网络 I/O
+3）记录命中/未命中次数和最近一次状态变化的时间，便于观察剩余开销
+"""
+import logging
+import threading
+import time
+from typing import Optional, Dict, Any
+
+from utils.readiness import is_healthy
+
+logger = logging.getLogger(__name__)
+
+
+class HealthStatus:
+    """应用健康状态缓存，AppManager 持有唯一一份"""
+
+    def __init__(self, ttl: float = 15):
+        """
+        :param ttl: 缓存有效期（秒），超过该时间未刷新视为未知
+        """
+        self.ttl = ttl
+        self.healthy: Optional[bool] = None
+        self.checked_at = 0.0
+        self.changed_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.probes = 0
+        self.changes = 0
+        self._lock = threading.Lock()
+
+    def update(self, healthy: bool) -> None:
+        with self._lock:
+            now = time.time()
+            if healthy != self.healthy:
+                if self.healthy is not None:
+                    self.changes += 1
+                    logger.warning(f"应用健康状态变化: {self.healthy} -> {healthy}")
+                self.changed_at = now
+            self.healthy = healthy
+            self.checked_at = now
+            self.probes += 1
+
+    def get(self) -> Optional[bool]:
+        """读取缓存：有效则返回健康状态（命中），过期或未知返回 None（未命中）"""
+        with self._lock:
+            if self.healthy is not None and time.time() - self.checked_at < self.ttl:
+                self.hits += 1
+                return self.healthy
+            self.misses += 1
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "healthy": self.healthy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "probes": self.probes,
+                "changes": self.changes,
+                "checked_at": self.checked_at,
+                "changed_at": self.changed_at,
+            }
+
+
+class HealthMonitor:
+    """后台健康监控线程：每隔 interval 秒检查一次，结果写入 HealthStatus"""
+
+    def __init__(self, health_check_url: str, status: HealthStatus, interval: float = 5, timeout: float = 2):
+        """
+        :param health_check_url: 健康检查网址
+        :param status: 结果写入的状态缓存
+        :param interval: 检查间隔（秒）
+        :param timeout: 单次请求超时（秒）
+        """
+        import requests
+        self.health_check_url = health_check_url
+        self.status = status
+        self.interval = interval
+        self.timeout = timeout
+        self._session = requests.Session()
+        # requests.Session 不保证线程安全，后台线程和 force 检查共用时加锁
+        self._session_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def probe(self) -> bool:
+        """立即检查一次并刷新缓存"""
+        with self._session_lock:
+            healthy = is_healthy(self.health_check_url, timeout=self.timeout, session=self._session)
+        self.status.update(healthy)
+        return healthy
+
+    def start(self) -> "HealthMonitor":
+        self._thread = threading.Thread(target=self._run, name="app-health-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.probe()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(self.timeout + 1)
+        self._session.close()
@@ -0,0 +1,175 @@
+
+"""
+每个 worker 独立的应用实例
+1）每个实例一个槽位：独立的工作目录（数据目录复制，其余文件链接到原应用目录）和一组空闲端口
+2）端口通过环境变量传给启动命令：PORT 为服务自己的端口，<服务名>_PORT 为各服务的端口，
+   app.instances.env / services[].env 中的值可以用 {API_PORT} 这样的占位符引用
+3）槽位登记在 .cache 下的注册表文件中，独占租借；开启 reuse 时会话结束不停止实例，
+   下次会话租到同一个槽位时，实例仍然健康就直接附加（热实例），省掉启动时间
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+
+from config.config import get_config
+from utils.app_state import FileLock, pid_alive, write_json_atomic
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+
+def find_free_port(exclude=()) -> int:
+    """
+    让系统分配一个当前空闲的端口
+    端口在这里关闭后、服务真正监听之前可能被别的程序占用，服务因此启动失败时由 AppManager 调用
+    InstanceRegistry.reassign_ports 换端口重试
+    """
+    while True:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        if port not in exclude:
+            return port
+
+
+def port_in_use(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.2)
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+def _link(src: str, dst: str) -> None:
+    """链接到原应用目录；Windows 没有创建符号链接的权限时，目录用 junction，文件用硬链接"""
+    try:
+        os.symlink(src, dst, target_is_directory=os.path.isdir(src))
+        return
+    except OSError:
+        if os.name != "nt":
+            raise
+    if os.path.isdir(src):
+        import subprocess
+        subprocess.run(["cmd", "/c", "mklink", "/J", dst, src], check=True, capture_output=True)
+    else:
+        os.link(src, dst)
+
+
+def prepare_instance_dir(app_dir: str, instance_dir: str, copy_paths: List[str]) -> None:
+    """
+    准备实例工作目录：copy_paths 中的条目（数据目录，以及会按自身所在目录定位数据文件的代码）复制一份，
+    其余顶层条目（node_modules、package.json 等）链接到原应用目录；目录已存在时只补缺失的条目
+    """
+    os.makedirs(instance_dir, exist_ok=True)
+    copy_set = {os.path.normpath(path) for path in copy_paths}
+    for name in os.listdir(app_dir):
+        src = os.path.join(app_dir, name)
+        dst = os.path.join(instance_dir, name)
+        if os.path.lexists(dst):
+            continue
+        if name in copy_set:
+            if os.path.isdir(src):
+                shutil.copytree(src, dst, symlinks=True)
+            else:
+                shutil.copy2(src, dst)
+        else:
+            _link(src, dst)
+
+
+class InstanceRegistry:
+    """
+    实例注册表，文件内容为 JSON：slots（每个槽位的 index、dir、ports、pids、lease_pid、app_dir）
+    所有读写都在文件锁保护下进行
+    """
+
+    def __init__(self, state_dir: str, count: int = 0):
+        """
+        :param state_dir: 注册表和实例目录所在目录
+        :param count: 最多实例数，0 表示不限（每个 worker 一个）
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_dir = state_dir
+        self.count = count
+        self.path = os.path.join(state_dir, "registry.json")
+        self.lock = FileLock(self.path + ".lock")
+
+    @classmethod
+    def from_config(cls) -> "InstanceRegistry":
+        instances_config = config.app.instances
+        return cls(config.resolve_path(instances_config.state_dir), count=instances_config.count)
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"slots": []}
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        write_json_atomic(self.path, data, indent=2)
+
+    @contextmanager
+    def _locked(self):
+        with self.lock:
+            data = self._load()
+            yield data
+            self._save(data)
+
+    def lease(self, app_dir: str, service_names: List[str], timeout: float = 300) -> Dict[str, Any]:
+        """
+        独占租借一个槽位：优先选同一应用目录下已有的空闲槽位（可能还有热实例），
+        没有时新建槽位并分配端口；达到 count 上限时等待其他 worker 归还
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self._locked() as data:
+                slots = data["slots"]
+                free = [slot for slot in slots
+                        if slot.get("app_dir") == app_dir and not pid_alive(slot.get("lease_pid"))]
+                if free:
+                    slot = free[0]
+                elif not self.count or len(slots) < self.count:
+                    index = max((s["index"] for s in slots), default=-1) + 1
+                    slot = {"index": index, "app_dir": app_dir,
+                            "dir": os.path.join(self.state_dir, f"slot-{index}"), "ports": {}, "pids": {}}
+                    slots.append(slot)
+                else:
+                    slot = None
+
+                if slot is not None:
+                    used = {port for s in slots for port in s.get("ports", {}).values()}
+                    warm = any(pid_alive(pid) for pid in slot.get("pids", {}).values())
+                    for name in service_names:
+                        # 没有热实例时，原来分配的端口可能已经被别的程序占用，重新分配
+                        if name not in slot["ports"] or (not warm and port_in_use(slot["ports"][name])):
+                            port = find_free_port(exclude=used)
+                            slot["ports"][name] = port
+                            used.add(port)
+                    slot["lease_pid"] = os.getpid()
+                    slot["leased_at"] = time.time()
+                    return dict(slot)
+            if time.time() > deadline:
+                raise TimeoutError(f"{timeout}s 内没有空闲的应用实例（app.instances.count={self.count}）")
+            time.sleep(0.2)
+
+    def reassign_ports(self, index: int, service_names: List[str]) -> Dict[str, int]:
+        """给槽位中端口被占用的服务重新分配端口，返回槽位的全部端口"""
+        with self._locked() as data:
+            used = {port for s in data["slots"] for port in s.get("ports", {}).values()}
+            slot = next(s for s in data["slots"] if s["index"] == index)
+            for name in service_names:
+                port = find_free_port(exclude=used)
+                slot["ports"][name] = port
+                used.add(port)
+            return dict(slot["ports"])
+
+    def release(self, index: int, pids: Optional[Dict[str, int]] = None) -> None:
+        """归还槽位，并记录仍在运行的热实例进程（pids 为空表示实例已停止）"""
+        with self._locked() as data:
+            for slot in data["slots"]:
+                if slot["index"] == index:
+                    slot["lease_pid"] = None
+                    slot["pids"] = pids or {}
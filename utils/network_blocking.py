@@ -0,0 +1,176 @@
+
+"""
+浏览器请求拦截 - UI 测试不关心图片、字体、source map、头像和第三方统计脚本，下载它们却占了大部分导航时间
+1）拦截规则在 yaml 的 network_blocking 中配置：url_patterns 为 URL 通配符（* 匹配任意字符），
+   resource_types 按资源类型（Image、Font、Media...）拦截，换算成对应扩展名的通配符
+2）通过 CDP（Network.setBlockedURLs）下发给 Chrome/Edge，被拦截的请求在浏览器内直接失败，不产生网络流量；
+   每个浏览器只下发一次，复用的浏览器不重复下发
+3）report 为 true 时开启浏览器性能日志，每条用例结束时统计被拦截的请求数和节省的字节数：
+   被拦截的请求没有下载，大小取自关闭拦截运行时记下的同一 URL 的实际传输大小（.cache 下的大小缓存），没记录过的计为大小未知
+"""
+import json
+import logging
+import os
+import re
+from typing import Optional, Dict, List, Tuple
+
+from config.config import get_config
+from utils.app_state import write_json_atomic
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+# CDP 的 setBlockedURLs 只支持 URL 通配符，资源类型按常见扩展名换算
+RESOURCE_TYPE_EXTENSIONS = {
+    "Image": ["png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "bmp", "avif"],
+    "Font": ["woff", "woff2", "ttf", "otf", "eot"],
+    "Media": ["mp4", "webm", "ogg", "mp3", "wav", "m4a"],
+}
+
+
+def patterns_for_resource_types(resource_types: List[str]) -> List[str]:
+    """资源类型换算成 URL 通配符（带查询参数的 URL 同样匹配）"""
+    patterns = []
+    for resource_type in resource_types:
+        for extension in RESOURCE_TYPE_EXTENSIONS.get(resource_type, []):
+            patterns += [f"*.{extension}", f"*.{extension}?*"]
+    return patterns
+
+
+def _compile(pattern: str) -> "re.Pattern":
+    return re.compile(".*".join(re.escape(part) for part in pattern.split("*")) + r"\Z", re.IGNORECASE)
+
+
+class NetworkBlocker:
+    """按 yaml 配置给浏览器下发拦截规则，并统计每条用例拦截的请求和节省的字节数"""
+
+    def __init__(self, patterns: List[str], enabled: bool = True, report: bool = True,
+                 size_cache: Optional[str] = None):
+        """
+        :param patterns: 要拦截的 URL 通配符
+        :param enabled: 是否拦截；关闭时只在 report 为 true 时记录这些 URL 的实际大小
+        :param report: 是否开启浏览器性能日志统计拦截效果
+        :param size_cache: URL -> 传输字节数 的缓存文件
+        """
+        self.patterns = patterns
+        self.enabled = enabled
+        self.report = report
+        self.size_cache = size_cache
+        self._regexes = [_compile(pattern) for pattern in patterns]
+        self.sizes: Dict[str, int] = self._load_sizes()
+        self._sizes_changed = False
+        # 每条用例的统计：(nodeid 或用例名, 拦截请求数, 节省字节数, 大小未知的请求数)
+        self.per_test: List[Tuple[str, int, int, int]] = []
+
+    @classmethod
+    def from_config(cls) -> "NetworkBlocker":
+        blocking = config.network_blocking
+        return cls(
+            patterns=list(blocking.url_patterns) + patterns_for_resource_types(blocking.resource_types),
+            enabled=blocking.enabled,
+            report=blocking.report,
+            size_cache=config.resolve_path(blocking.size_cache),
+        )
+
+    @property
+    def active(self) -> bool:
+        return bool(self.patterns) and (self.enabled or self.report)
+
+    def matches(self, url: str) -> bool:
+        return any(regex.match(url) for regex in self._regexes)
+
+    # ------------------------------------------------------------ 浏览器
+
+    def apply(self, driver) -> None:
+        """给浏览器下发拦截规则（每个浏览器一次）；不是 Chromium 内核的浏览器不支持 CDP，跳过"""
+        if not self.enabled or not self.patterns or getattr(driver, "_rwa_blocked_urls", False):
+            return
+        if not hasattr(driver, "execute_cdp_cmd"):
+            logger.info("当前浏览器不支持 CDP，不拦截请求")
+            driver._rwa_blocked_urls = True
+            return
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.patterns})
+        driver._rwa_blocked_urls = True
+        logger.debug(f"已下发 {len(self.patterns)} 条请求拦截规则")
+
+    def collect(self, driver, test_name: str) -> Optional[Tuple[int, int, int]]:
+        """
+        读取（并清空）浏览器性能日志，统计这段时间内拦截的请求
+        :return: (拦截请求数, 节省字节数, 大小未知的请求数)；没有开启性能日志时返回 None
+        """
+        if not self.report:
+            return None
+        try:
+            entries = driver.get_log("performance")
+        except Exception as e:
+            if "performance" in str(e):
+                # 浏览器创建时没有开启性能日志（或不是 Chrome），本进程不再统计
+                logger.info("浏览器没有开启性能日志，不再统计拦截效果")
+                self.report = False
+            else:
+                logger.debug(f"读取浏览器性能日志失败: {e.__class__.__name__}")
+            return None
+
+        urls: Dict[str, str] = {}
+        blocked = saved = unknown = 0
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            method, params = message.get("method"), message.get("params", {})
+            if method == "Network.requestWillBeSent":
+                urls[params.get("requestId")] = params.get("request", {}).get("url", "")
+            elif method == "Network.loadingFailed" and params.get("blockedReason") == "inspector":
+                blocked += 1
+                size = self.sizes.get(urls.get(params.get("requestId"), ""))
+                if size is None:
+                    unknown += 1
+                else:
+                    saved += size
+            elif method == "Network.loadingFinished" and not self.enabled:
+                # 关闭拦截时记下本该拦截的 URL 的实际大小，供开启拦截时估算节省的字节数
+                url = urls.get(params.get("requestId"), "")
+                if url and self.matches(url):
+                    self.sizes[url] = int(params.get("encodedDataLength") or 0)
+                    self._sizes_changed = True
+
+        if self.enabled:
+            self.per_test.append((test_name, blocked, saved, unknown))
+        return blocked, saved, unknown
+
+    # ------------------------------------------------------------ 大小缓存与汇总
+
+    def _load_sizes(self) -> Dict[str, int]:
+        if not self.size_cache:
+            return {}
+        try:
+            with open(self.size_cache, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_sizes(self) -> None:
+        """合并写回大小缓存（多个 worker 各自合并，先写临时文件再替换）"""
+        if not self.size_cache or not self._sizes_changed:
+            return
+        sizes = self._load_sizes()
+        sizes.update(self.sizes)
+        os.makedirs(os.path.dirname(self.size_cache), exist_ok=True)
+        write_json_atomic(self.size_cache, sizes)
+        self._sizes_changed = False
+
+    def summary(self, top: int = 5) -> Optional[List[str]]:
+        if not self.per_test:
+            return None
+        blocked = sum(item[1] for item in self.per_test)
+        saved = sum(item[2] for item in self.per_test)
+        unknown = sum(item[3] for item in self.per_test)
+        lines = [f"请求拦截: {len(self.per_test)} 条用例共拦截 {blocked} 个请求，"
+                 f"节省约 {saved / 1024:.1f} KB（平均每条 {blocked / len(self.per_test):.1f} 个、"
+                 f"{saved / 1024 / len(self.per_test):.1f} KB），{unknown} 个请求大小未知"]
+        for name, count, size, _ in sorted(self.per_test, key=lambda item: -item[2])[:top]:
+            if count:
+                lines.append(f"  {name}: {count} 个请求，{size / 1024:.1f} KB")
+        return lines
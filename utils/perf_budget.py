@@ -0,0 +1,254 @@
+
+"""
+前端性能预算 - 部署前的冒烟流程同时用来发现 Real World App 自身的性能退化
+1）开启后（--perf-budget 或 yaml 中 perf.enabled）通过 CDP 给每个新页面注入采集脚本：
+   - 整页加载（navigation）：Navigation Timing（ttfb、dom_content_loaded、load）和 LCP
+   - 前端路由切换（pushState/replaceState/popstate，route_change）：按路由分段
+   - 两者都记录 CLS、长任务（long_tasks 次数、long_task_time 总时长）、期间加载的资源数和传输字节数
+   页面跳走前（pagehide）把记录暂存到 sessionStorage，用例结束时一次取回，点击触发的整页跳转同样不会丢数据
+2）每条记录按路由（/transaction/xxx 这类带 ID 的路径按 perf.route_patterns 归并）保存到 .cache 下的历史文件
+3）超过 yaml 中 perf.budgets 的预算，或比该路由最近几次的中位数（滚动基线）慢太多时，用例失败
+"""
+import json
+import logging
+import os
+import re
+import statistics
+import time
+from collections import defaultdict
+from typing import Optional, Dict, Any, List
+
+from config.config import get_config
+from utils.app_state import FileLock, write_json_atomic
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+# 注入每个新页面的采集脚本；不是 Chrome 时只能在取回时注入当前页面（buffered 的观察器仍能拿到已发生的条目）
+PERF_OBSERVER_SCRIPT = """
+(function () {
+    if (window.__rwaPerf) { return; }
+    var KEY = "__rwaPerf";
+    var perf = window.__rwaPerf = {records: [], current: null};
+    function newRoute(type) {
+        return {type: type, path: location.pathname, start: type === "navigation" ? 0 : performance.now(),
+                lcp: null, cls: 0, long_tasks: 0, long_task_time: 0};
+    }
+    perf.finish = function () {
+        var r = perf.current;
+        if (!r) { return; }
+        var end = performance.now();
+        var resources = performance.getEntriesByType("resource").filter(function (e) {
+            return e.startTime >= r.start && e.startTime <= end;
+        });
+        r.resources = resources.length;
+        r.transfer_bytes = resources.reduce(function (sum, e) { return sum + (e.transferSize || 0); }, 0);
+        if (r.type === "navigation") {
+            var nav = performance.getEntriesByType("navigation")[0];
+            if (nav) {
+                r.ttfb = nav.responseStart;
+                r.dom_content_loaded = nav.domContentLoadedEventEnd || null;
+                r.load = nav.loadEventEnd || null;
+            }
+        }
+        delete r.start;
+        perf.records.push(r);
+        perf.current = null;
+    };
+    function routeChanged() {
+        if (perf.current && perf.current.path === location.pathname) { return; }
+        perf.finish();
+        perf.current = newRoute("route_change");
+    }
+    ["pushState", "replaceState"].forEach(function (name) {
+        var original = history[name];
+        history[name] = function () {
+            var result = original.apply(this, arguments);
+            routeChanged();
+            return result;
+        };
+    });
+    window.addEventListener("popstate", routeChanged);
+    function observe(type, callback) {
+        try {
+            new PerformanceObserver(function (list) { list.getEntries().forEach(callback); })
+                .observe({type: type, buffered: true});
+        } catch (e) {}
+    }
+    observe("largest-contentful-paint", function (e) {
+        if (perf.current && perf.current.type === "navigation") { perf.current.lcp = e.startTime; }
+    });
+    observe("layout-shift", function (e) {
+        if (perf.current && !e.hadRecentInput) { perf.current.cls += e.value; }
+    });
+    observe("longtask", function (e) {
+        if (perf.current) { perf.current.long_tasks += 1; perf.current.long_task_time += e.duration; }
+    });
+    window.addEventListener("pagehide", function () {
+        perf.finish();
+        try {
+            var saved = JSON.parse(sessionStorage.getItem(KEY) || "[]");
+            sessionStorage.setItem(KEY, JSON.stringify(saved.concat(perf.records)));
+        } catch (e) {}
+        perf.records = [];
+    });
+    perf.current = newRoute("navigation");
+})();
+"""
+
+# 取回之前页面暂存的记录和当前页面（结束当前路由）的记录，取回后清空
+HARVEST_SCRIPT = PERF_OBSERVER_SCRIPT + """
+var records = [];
+try {
+    records = JSON.parse(sessionStorage.getItem("__rwaPerf") || "[]");
+    sessionStorage.removeItem("__rwaPerf");
+} catch (e) {}
+window.__rwaPerf.finish();
+records = records.concat(window.__rwaPerf.records);
+window.__rwaPerf.records = [];
+return records;
+"""
+
+METRICS = ("ttfb", "dom_content_loaded", "load", "lcp", "cls", "long_tasks", "long_task_time",
+           "resources", "transfer_bytes")
+
+
+def format_metric(metric: str, value: float) -> str:
+    if metric == "cls":
+        return f"{value:.3f}"
+    if metric == "transfer_bytes":
+        return f"{value / 1024:.1f}KB"
+    if metric in ("long_tasks", "resources"):
+        return f"{value:.0f}"
+    return f"{value:.0f}ms"
+
+
+class PerfRecorder:
+    """采集每条用例的页面性能数据，按路由对照预算和滚动基线，并维护历史"""
+
+    def __init__(self, enabled: bool = False, history_file: Optional[str] = None, settings=None):
+        """
+        :param enabled: 是否采集
+        :param history_file: 按路由保存历史记录的文件
+        :param settings: yaml 中的 perf 段
+        """
+        self.enabled = enabled
+        self.history_file = history_file
+        self.settings = settings or config.perf
+        self._route_patterns = [(re.compile(pattern), key) for pattern, key in self.settings.route_patterns.items()]
+        # 会话开始时的历史，作为本次运行的基线（本次的记录不参与本次的比较）
+        self.history: Dict[str, List[Dict[str, Any]]] = self._load()
+        self.samples: List[Dict[str, Any]] = []
+        self.violations: List[str] = []
+
+    @classmethod
+    def from_config(cls) -> "PerfRecorder":
+        perf = config.perf
+        return cls(enabled=perf.enabled, history_file=config.resolve_path(perf.history_file), settings=perf)
+
+    def route_key(self, path: str) -> str:
+        """按 perf.route_patterns 把带 ID 的路径归并成一个路由，纯数字的路径段统一换成 :id"""
+        for regex, key in self._route_patterns:
+            if regex.search(path):
+                return key
+        return re.sub(r"/\d+(?=/|$)", "/:id", path.rstrip("/") or "/")
+
+    # ------------------------------------------------------------ 浏览器
+
+    def install(self, driver) -> None:
+        """给之后打开的每个页面注入采集脚本（每个浏览器一次）；没有 CDP 时在取回时注入当前页面"""
+        if not self.enabled or getattr(driver, "_rwa_perf_observer", False):
+            return
+        try:
+            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": PERF_OBSERVER_SCRIPT})
+        except Exception:
+            logger.info("当前浏览器不支持 CDP，只采集用例结束时所在页面的性能数据")
+        driver._rwa_perf_observer = True
+
+    def harvest(self, sb, test_name: str) -> List[Dict[str, Any]]:
+        """取回本条用例的记录，补上路由和用例名后加入本次运行的样本"""
+        records = sb.execute_script(HARVEST_SCRIPT) or []
+        samples = []
+        for record in records:
+            sample = {metric: record[metric] for metric in METRICS if record.get(metric) is not None}
+            sample.update({"route": self.route_key(record.get("path") or "/"), "type": record.get("type"),
+                           "test": test_name, "ts": time.time()})
+            samples.append(sample)
+        self.samples.extend(samples)
+        return samples
+
+    # ------------------------------------------------------------ 预算与基线
+
+    def baseline(self, key: str, metric: str) -> Optional[float]:
+        """
+        滚动基线：历史中最近 baseline_window 次的中位数，样本不足 min_samples 时返回 None
+        :param key: 路由|类型，整页加载和路由切换分开比较
+        """
+        values = [sample[metric] for sample in self.history.get(key, [])[-self.settings.baseline_window:]
+                  if metric in sample]
+        if len(values) < self.settings.min_samples:
+            return None
+        return statistics.median(values)
+
+    def check(self, samples: List[Dict[str, Any]]) -> List[str]:
+        """对照预算和滚动基线，返回违反项的说明"""
+        budgets = self.settings.budgets
+        violations = []
+        for sample in samples:
+            route = sample["route"]
+            budget = {**budgets.get("default", {}), **budgets.get(route, {})}
+            for metric, limit in budget.items():
+                value = sample.get(metric)
+                if value is not None and value > limit:
+                    violations.append(f"{route}（{sample['type']}）{metric} {format_metric(metric, value)} "
+                                      f"超出预算 {format_metric(metric, limit)}")
+            for metric in self.settings.regression_metrics:
+                value, base = sample.get(metric), self.baseline(f"{route}|{sample['type']}", metric)
+                if value is None or base is None:
+                    continue
+                if value > base * (1 + self.settings.regression_threshold) \
+                        and value - base >= self.settings.regression_min_delta:
+                    violations.append(f"{route}（{sample['type']}）{metric} {format_metric(metric, value)} "
+                                      f"比基线 {format_metric(metric, base)} 慢 {value / base - 1:.0%}"
+                                      f"（最近 {self.settings.baseline_window} 次的中位数）")
+        self.violations.extend(violations)
+        return violations
+
+    # ------------------------------------------------------------ 历史
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        if not self.history_file:
+            return {}
+        try:
+            with open(self.history_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self) -> None:
+        """把本次的样本追加到历史（按 路由|类型 分组，每组只保留最近 history_size 次），多个 worker 在文件锁内合并"""
+        if not self.history_file or not self.samples:
+            return
+        os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
+        with FileLock(self.history_file + ".lock"):
+            history = self._load()
+            for sample in self.samples:
+                key = f"{sample['route']}|{sample['type']}"
+                history[key] = (history.get(key, []) + [sample])[-self.settings.history_size:]
+            write_json_atomic(self.history_file, history)
+
+    def summary(self) -> Optional[List[str]]:
+        if not self.samples:
+            return None
+        by_route: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for sample in self.samples:
+            by_route[f"{sample['route']}（{sample['type']}）"].append(sample)
+        lines = [f"性能预算: {len(self.samples)} 次页面/路由记录，{len(self.violations)} 项超出预算或退化"]
+        for route, samples in sorted(by_route.items()):
+            parts = []
+            for metric in ("lcp", "load", "cls", "long_task_time", "transfer_bytes"):
+                values = [sample[metric] for sample in samples if metric in sample]
+                if values:
+                    parts.append(f"{metric} {format_metric(metric, statistics.median(values))}")
+            lines.append(f"  {route}: {len(samples)} 次，中位数 " + ("，".join(parts) or "-"))
+        return lines
@@ -0,0 +1,255 @@
+
+"""
+应用进程树管理 - yarn dev 会再拉起 node 子进程，只结束 yarn 本身会留下继续占着端口、消耗 CPU 的孤儿进程
+1）启动时把每个服务放进独立的进程组（POSIX 新会话 / Windows CREATE_NEW_PROCESS_GROUP），停止时按进程组结束整棵进程树
+2）先温和结束（SIGTERM / CTRL_BREAK_EVENT），超时后强制结束（SIGKILL / taskkill /F /T），不会无限等待
+3）启动的进程组登记在 .cache 下的进程登记文件中（连同启动它的测试进程），会话开始时清理
+   上次崩溃的会话留下的进程组（启动它的测试进程已经不在了）；保留为热实例的进程由实例注册表管理，不在这里登记
+"""
+import json
+import logging
+import os
+import signal
+import subprocess
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterable
+
+from config.config import get_config
+from utils.app_state import FileLock, pid_alive, write_json_atomic
+from utils.instances import port_in_use
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+
+def new_group_kwargs() -> Dict[str, Any]:
+    """subprocess.Popen 的参数：让子进程成为新进程组的组长，进程组号就是它的 pid"""
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _send(pid: int, sig: int) -> bool:
+    """
+    向进程组发信号，进程组不存在时返回 False
+    只按进程组发送：这里的 pid 都是用 new_group_kwargs 启动的组长，进程组不在时同号的进程只可能是复用了 pid 的无关进程
+    """
+    try:
+        os.killpg(pid, sig)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _group_running(pgid: int) -> Optional[bool]:
+    """
+    Linux 上扫描 /proc：进程组中是否还有没退出的进程（僵尸进程不算）
+    孤儿进程退出后要等 init 回收，容器里的 init 可能根本不回收，只用 killpg(pgid, 0) 会一直误判为存活；
+    扫描要读所有进程的 stat，只在 killpg 认为进程组还在时低频确认
+    没有 /proc 的平台返回 None
+    """
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return None
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        # ) 之后依次是 state、ppid、pgrp；不是组长的进程按 pid 本身判断
+        if len(fields) > 2 and str(pgid) in (fields[2], entry) and fields[0] != "Z":
+            return True
+    return False
+
+
+def tree_alive(pid: int, process: Optional[subprocess.Popen] = None) -> bool:
+    """进程组中是否还有进程（组长已退出但子进程还在也算）：POSIX 上是一次 killpg(pgid, 0)，只剩僵尸进程时同样返回 True"""
+    if process is not None:
+        # 回收已退出的组长，否则僵尸进程会让进程组一直显得存活
+        process.poll()
+    if os.name == "nt":
+        return pid_alive(pid)
+    return _send(pid, 0)
+
+
+def _wait_gone(pid: int, process: Optional[subprocess.Popen], timeout: float, scan_interval: float = 1) -> bool:
+    """
+    等待进程组全部退出：每 50ms 用 tree_alive 检查；它认为还在时，每 scan_interval 秒（以及超时前）
+    扫一次 /proc，只剩僵尸进程时视为已退出
+    """
+    deadline = time.monotonic() + timeout
+    next_scan = time.monotonic() + scan_interval
+    while tree_alive(pid, process):
+        now = time.monotonic()
+        if now >= next_scan or now >= deadline:
+            if _group_running(pid) is False:
+                return True
+            next_scan = now + scan_interval
+        if now >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def _soft_stop(pid: int) -> None:
+    """温和结束：POSIX 向进程组发 SIGTERM；Windows 向进程组发 CTRL_BREAK_EVENT（控制台程序收不到 taskkill 不带 /F 的关闭消息）"""
+    if os.name == "nt":
+        try:
+            os.kill(pid, signal.CTRL_BREAK_EVENT)
+        except OSError:
+            pass
+    else:
+        _send(pid, signal.SIGTERM)
+
+
+def terminate_tree(pid: int, timeout: Optional[float] = None, process: Optional[subprocess.Popen] = None) -> str:
+    """
+    结束进程树：先温和结束，timeout 秒内没有全部退出再强制结束
+    :param pid: 进程组组长的 pid（用 new_group_kwargs 启动的进程）
+    :param timeout: 温和结束的等待时间，默认取 yaml 中的 app.stop_timeout
+    :param process: 本进程启动的 Popen 对象，传入时顺便回收退出码
+    :return: gone（本来就不在了）、terminated（温和结束）、killed（强制结束）
+    """
+    timeout = config.app.stop_timeout if timeout is None else timeout
+    if not tree_alive(pid, process):
+        return "gone"
+
+    _soft_stop(pid)
+    if _wait_gone(pid, process, timeout):
+        return "terminated"
+    logger.warning(f"进程组 {pid} 在 {timeout}s 内没有退出，强制结束")
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/T", "/F", "/PID", str(pid)], capture_output=True)
+    else:
+        _send(pid, signal.SIGKILL)
+
+    if not _wait_gone(pid, process, 5):
+        logger.error(f"进程组 {pid} 强制结束后仍未退出")
+    return "killed"
+
+
+def wait_ports_released(ports: Iterable[int], timeout: float = 5) -> List[int]:
+    """等待端口释放，返回超时后仍被占用的端口"""
+    busy = [port for port in ports if port]
+    deadline = time.monotonic() + timeout
+    while busy:
+        busy = [port for port in busy if port_in_use(port)]
+        if not busy or time.monotonic() >= deadline:
+            break
+        time.sleep(0.1)
+    return busy
+
+
+def _start_marker(pid: int) -> Optional[str]:
+    """
+    进程的启动时间标记，用来识别 pid 是否已被复用；进程不存在或读不到时返回 None
+    Linux 取 /proc/<pid>/stat 第 22 列，Windows 取 GetProcessTimes 的创建时间，其他 POSIX 平台取 ps -o lstart
+    """
+    if os.name == "nt":
+        import ctypes
+        from ctypes import wintypes
+        process_query_limited_information = 0x1000
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(process_query_limited_information, False, pid)
+        if not handle:
+            return None
+        try:
+            creation, exited, kernel, user = (wintypes.FILETIME() for _ in range(4))
+            if not kernel32.GetProcessTimes(handle, ctypes.byref(creation), ctypes.byref(exited),
+                                            ctypes.byref(kernel), ctypes.byref(user)):
+                return None
+            return str((creation.dwHighDateTime << 32) | creation.dwLowDateTime)
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except FileNotFoundError:
+        if os.path.isdir("/proc/self"):
+            return None
+    except (OSError, IndexError):
+        return None
+    try:
+        result = subprocess.run(["ps", "-o", "lstart=", "-p", str(pid)], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+class ProcessRegistry:
+    """
+    进程登记文件，内容为 JSON：groups（进程组号 -> service、owner_pid、started_at、marker）
+    所有读写都在文件锁保护下进行
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = FileLock(path + ".lock")
+
+    @classmethod
+    def from_config(cls) -> "ProcessRegistry":
+        return cls(config.resolve_path(config.app.process_registry))
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"groups": {}}
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        write_json_atomic(self.path, data, indent=2)
+
+    @contextmanager
+    def _locked(self):
+        with self.lock:
+            data = self._load()
+            yield data
+            self._save(data)
+
+    def add(self, pid: int, service: str) -> None:
+        with self._locked() as data:
+            data["groups"][str(pid)] = {
+                "service": service,
+                "owner_pid": os.getpid(),
+                "started_at": time.time(),
+                "marker": _start_marker(pid),
+            }
+
+    def remove(self, pid: int) -> None:
+        with self._locked() as data:
+            data["groups"].pop(str(pid), None)
+
+    def reap_orphans(self, timeout: Optional[float] = None) -> List[int]:
+        """
+        结束启动它的测试进程已经退出的进程组（上次会话崩溃或被强制中断时留下的），返回结束的进程组号
+        组长还在时先核对启动时间标记：对不上（pid 已被复用）或无法确认时只删登记不结束
+        """
+        with self._locked() as data:
+            orphans = {pid: entry for pid, entry in data["groups"].items() if not pid_alive(entry.get("owner_pid"))}
+            for pid in orphans:
+                del data["groups"][pid]
+
+        reaped = []
+        for pid_text, entry in orphans.items():
+            pid = int(pid_text)
+            marker = _start_marker(pid)
+            if marker is None and os.name != "nt" and not pid_alive(pid):
+                # 组长已退出：POSIX 上进程组还有进程时，组号不会分配给新进程，剩下的就是当时那组孤儿
+                pass
+            elif marker is None or marker != entry.get("marker"):
+                logger.info(f"进程 {pid} 的启动时间与登记的服务 {entry.get('service')} 对不上或无法确认，不清理")
+                continue
+            outcome = terminate_tree(pid, timeout)
+            if outcome != "gone":
+                logger.warning(f"清理上次会话遗留的服务 {entry.get('service')} 进程组 {pid}（{outcome}）")
+                reaped.append(pid)
+        return reaped
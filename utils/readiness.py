@@ -0,0 +1,115 @@
+
+"""
+应用就绪探测 - 替代启动时固定的 sleep + 每秒一次的健康检查
+1）HTTP 健康检查按指数退避轮询：首个间隔很短，服务一就绪就能发现，之后逐步放宽避免空转
+2）可选的 stdout 就绪正则（pytest_app_config.yaml 中的 app.ready_pattern），与健康检查任一满足即视为就绪
+"""
+import logging
+import re
+import subprocess
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def is_healthy(health_check_url: str, timeout: float = 2, session=None) -> bool:
+    """
+    执行一次健康检查，只有返回码为 200 才算健康
+    :param session: 可复用的 requests.Session，为 None 时使用一次性连接
+    """
+    import requests
+    from requests.exceptions import RequestException
+    try:
+        response = (session or requests).get(health_check_url, timeout=timeout)
+        return response.status_code == 200
+    except RequestException:
+        return False
+
+
+class ReadinessProbe:
+    """应用就绪探测器，一次启动尝试对应一个实例"""
+
+    def __init__(self, health_check_url: Optional[str] = None, ready_pattern: Optional[str] = None,
+                 initial_interval: float = 0.05, max_interval: float = 1.0, factor: float = 2.0,
+                 request_timeout: float = 2, grace: float = 2):
+        """
+        :param health_check_url: 健康检查网址
+        :param ready_pattern: stdout 就绪正则，匹配到任意一行即视为就绪
+        :param initial_interval: 第一次轮询间隔（秒）
+        :param max_interval: 轮询间隔上限（秒）
+        :param factor: 退避倍数
+        :param request_timeout: 单次健康检查请求超时（秒）
+        :param grace: 两种信号都没有配置时，进程存活多久视为启动成功（秒）
+        """
+        self.health_check_url = health_check_url
+        self.ready_pattern = re.compile(ready_pattern) if ready_pattern else None
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.request_timeout = request_timeout
+        self.grace = grace
+        self._stdout_ready = threading.Event()
+
+        # 探测结果，供 AppResult.metadata 使用
+        self.ready_signal: Optional[str] = None
+        self.time_to_ready: Optional[float] = None
+        self.health_probes = 0
+
+    def feed_line(self, line: str) -> None:
+        """由 stdout 读取线程逐行调用"""
+        if self.ready_pattern and not self._stdout_ready.is_set() and self.ready_pattern.search(line):
+            self._stdout_ready.set()
+
+    def wait(self, process: subprocess.Popen, timeout: float = 30) -> bool:
+        """
+        等待应用就绪
+        :param process: 应用进程，进程退出则立即判定失败
+        :param timeout: 最长等待时间（秒）
+        :return: 是否就绪
+        """
+        start_time = time.time()
+        deadline = start_time + timeout
+
+        if not self.health_check_url and not self.ready_pattern:
+            # 没有任何就绪信号，只能确认进程没有立即退出
+            try:
+                process.wait(timeout=min(self.grace, timeout))
+                return False
+            except subprocess.TimeoutExpired:
+                return self._mark_ready("process", start_time)
+
+        session = None
+        if self.health_check_url:
+            import requests
+            session = requests.Session()
+        interval = self.initial_interval
+        try:
+            while True:
+                if self._stdout_ready.is_set():
+                    return self._mark_ready("stdout", start_time)
+                if process.poll() is not None:
+                    return False
+                if session and self._probe(session):
+                    return self._mark_ready("health", start_time)
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                # 用 Event.wait 代替 sleep：stdout 就绪信号一到立刻醒来，不用等本轮间隔结束
+                self._stdout_ready.wait(min(interval, remaining))
+                interval = min(interval * self.factor, self.max_interval)
+        finally:
+            if session:
+                session.close()
+
+    def _probe(self, session) -> bool:
+        self.health_probes += 1
+        return is_healthy(self.health_check_url, timeout=self.request_timeout, session=session)
+
+    def _mark_ready(self, signal: str, start_time: float) -> bool:
+        self.ready_signal = signal
+        self.time_to_ready = round(time.time() - start_time, 3)
+        logger.info(f"应用就绪（信号: {signal}，耗时 {self.time_to_ready}s，健康检查 {self.health_probes} 次）")
+        return True
@@ -0,0 +1,130 @@
+
+"""
+应用输出捕获 - 后台线程持续读取应用进程的 stdout/stderr
+1）应用以 PIPE 方式启动，如果没人读取，输出多的 yarn dev 会写满系统管道缓冲区并阻塞，导致服务卡死
+2）读到的内容只保留在定长环形缓冲区里，不论会话跑多久，内存占用都是固定的
+3）可选写入按大小滚动的日志文件，方便事后排查完整输出
+"""
+import logging
+import os
+import subprocess
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Optional, Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """定长环形缓冲区：只保留最近 max_lines 行，单行超过 max_line_length 时截断"""
+
+    def __init__(self, max_lines: int = 2000, max_line_length: int = 4096):
+        self.max_line_length = max_line_length
+        self._lines = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self.total_lines = 0
+
+    def append(self, line: str) -> None:
+        if len(line) > self.max_line_length:
+            line = line[:self.max_line_length] + "...(截断)\n"
+        with self._lock:
+            self._lines.append(line)
+            self.total_lines += 1
+
+    def tail(self, n: int) -> str:
+        """最近 n 行"""
+        if n <= 0:
+            return ""
+        with self._lock:
+            lines = list(self._lines)[-n:]
+        return "".join(lines)
+
+    def text(self) -> str:
+        with self._lock:
+            return "".join(self._lines)
+
+
+class StreamCapture:
+    """持续读取进程的 stdout/stderr 到环形缓冲区，可选同时写入滚动日志文件"""
+
+    def __init__(self, process: subprocess.Popen, max_lines: int = 2000, log_file: Optional[str] = None,
+                 log_max_bytes: int = 5 * 1024 * 1024, log_backups: int = 3,
+                 on_stdout_line: Optional[Callable[[str], None]] = None):
+        """
+        :param process: 以 stdout=PIPE、stderr=PIPE、text=True、errors="replace" 启动的进程
+        :param max_lines: 每个流保留的最大行数
+        :param log_file: 滚动日志文件路径，为 None 时不写文件
+        :param log_max_bytes: 单个日志文件的最大字节数
+        :param log_backups: 保留的历史日志文件个数
+        :param on_stdout_line: stdout 每读到一行时的回调（如就绪探测）
+        """
+        self.process = process
+        self.stdout = RingBuffer(max_lines)
+        self.stderr = RingBuffer(max_lines)
+        self.on_stdout_line = on_stdout_line
+        self._threads: List[threading.Thread] = []
+        self._file_logger: Optional[logging.Logger] = None
+        self._file_handler: Optional[RotatingFileHandler] = None
+
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            self._file_handler = RotatingFileHandler(log_file, maxBytes=log_max_bytes,
+                                                     backupCount=log_backups, encoding="utf-8")
+            self._file_handler.setFormatter(logging.Formatter("%(asctime)s [%(stream)s] %(message)s"))
+            # 每个进程一个独立的 logger，不向上传播，避免应用输出混进测试日志
+            self._file_logger = logging.getLogger(f"{__name__}.app.{process.pid}")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(self._file_handler)
+
+    def start(self) -> "StreamCapture":
+        for name, stream, buffer in (("stdout", self.process.stdout, self.stdout),
+                                     ("stderr", self.process.stderr, self.stderr)):
+            if stream is None:
+                continue
+            thread = threading.Thread(target=self._drain, args=(name, stream, buffer),
+                                      name=f"app-{name}-reader", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _drain(self, name: str, stream, buffer: RingBuffer) -> None:
+        """
+        读取线程主体：读到 EOF（进程退出或管道关闭）为止
+        单行处理出错（回调、写日志文件）只记录，继续读取；读取线程一旦提前退出，管道就没人读，应用会被写满的管道阻塞
+        """
+        try:
+            for line in iter(stream.readline, ""):
+                try:
+                    self._handle_line(name, line, buffer)
+                except Exception as e:
+                    logger.warning(f"处理应用 {name} 输出出错（继续读取）: {e.__class__.__name__}: {e}")
+        except (ValueError, OSError) as e:
+            if self.process.poll() is None:
+                # 进程还在运行但读取失败，之后的输出不再被读取
+                logger.warning(f"应用 {name} 读取线程异常退出（pid {self.process.pid}）: {e.__class__.__name__}: {e}")
+            else:
+                # 进程退出后管道被关闭
+                logger.debug(f"应用 {name} 管道已关闭: {e}")
+        else:
+            logger.debug(f"应用 {name} 输出读取结束（pid {self.process.pid}）")
+
+    def _handle_line(self, name: str, line: str, buffer: RingBuffer) -> None:
+        buffer.append(line)
+        if name == "stdout" and self.on_stdout_line:
+            self.on_stdout_line(line)
+        if self._file_logger:
+            self._file_logger.info(line.rstrip("\n"), extra={"stream": name})
+
+    def join(self, timeout: float = 2) -> None:
+        """等待读取线程把剩余输出读完（进程退出后调用）"""
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def close(self) -> None:
+        self.join()
+        if self._file_handler:
+            self._file_logger.removeHandler(self._file_handler)
+            self._file_handler.close()
+            self._file_handler = None
@@ -1 +1,451 @@
-#测试数据管理
\ No newline at end of file
+#测试数据管理
+"""
+测试数据管理
+1）UserPool：会话开始时通过接口并发预创建 N 个用户，测试按需独占租借，用完归还
+2）用户池持久化到文件，下次运行直接复用，不再重复注册；xdist 多 worker 通过文件锁保证同一用户不会被同时租借
+3）DataFactory：按 yaml 中声明的场景（用户、银行账户、联系人、交易）通过接口并发批量造数，
+   结果按场景定义的哈希缓存到文件，定义没变且数据仍在时直接复用
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple
+
+from urllib.parse import urlparse
+
+from config.config import get_config, load_yaml, ConfigError
+from utils import endpoints, timing
+from utils.api_client import RwaApiClient, ApiError
+from utils.app_state import FileLock, pid_alive, write_json_atomic
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+
+def _per_backend_path(path: str) -> str:
+    """独立实例各有各的数据，按后端端口分文件，避免多个 worker 互相作废对方的数据"""
+    if endpoints.is_default():
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{urlparse(endpoints.api_url()).port}{ext}"
+
+
+class UserPool:
+    """
+    预创建的测试用户池，文件内容为 JSON：
+    api_url（用户所在的后端）、users（username/password/id/lease_pid/leased_at）
+    """
+
+    def __init__(self, path: str, size: int = 8, concurrency: int = 8, api_url: Optional[str] = None):
+        """
+        :param path: 用户池文件路径
+        :param size: 池中用户数量
+        :param concurrency: 并发创建用户的线程数
+        :param api_url: 后端地址，默认取当前进程的后端地址（utils.endpoints）
+        """
+        self.path = path
+        self.size = size
+        self.concurrency = concurrency
+        self.api_url = api_url or endpoints.api_url()
+        # 首次创建用户期间会一直持有锁，超时时间要覆盖整个创建过程
+        self.lock = FileLock(path + ".lock", timeout=300, stale=600)
+
+    @classmethod
+    def from_config(cls) -> "UserPool":
+        pool_config = config.user_pool
+        path = _per_backend_path(config.resolve_path(pool_config.path))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return cls(path, size=pool_config.size, concurrency=pool_config.concurrency)
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("api_url") != self.api_url:
+            # 换了后端，旧用户不存在，整个池作废
+            data = {"api_url": self.api_url, "users": []}
+        return data
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        write_json_atomic(self.path, data, indent=2)
+
+    def ensure(self) -> None:
+        """保证池中有 size 个可用用户：复用文件中的用户，缺多少并发补多少"""
+        with self.lock:
+            data = self._load()
+            if data["users"] and not self._is_valid(data["users"][0]):
+                # 应用数据被重置过，持久化的用户已经不存在
+                logger.warning("用户池中的用户已失效，重新创建")
+                data["users"] = []
+
+            missing = self.size - len(data["users"])
+            if missing > 0:
+                start_time = time.time()
+                data["users"].extend(self._create_users(missing))
+                logger.info(f"用户池新建 {missing} 个用户，耗时 {time.time() - start_time:.2f}s")
+            self._save(data)
+
+    def _is_valid(self, user: Dict[str, Any]) -> bool:
+        client = RwaApiClient(self.api_url)
+        try:
+            client.login(user["username"], user["password"])
+            return True
+        except ApiError:
+            return False
+        finally:
+            client.close()
+
+    def _create_users(self, count: int) -> List[Dict[str, Any]]:
+        """并发注册用户，每个线程使用独立的客户端（requests.Session 不保证线程安全）"""
+
+        def create(_):
+            client = RwaApiClient(self.api_url)
+            try:
+                user = client.create_user(prefix="pooluser")
+            finally:
+                client.close()
+            return {"username": user["username"], "password": user["password"], "id": user.get("id"),
+                    "lease_pid": None, "leased_at": None}
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, count)) as executor:
+            return list(executor.map(create, range(count)))
+
+    def lease(self, timeout: float = 60) -> Dict[str, Any]:
+        """
+        独占租借一个用户；持有者进程已退出的租约会被回收
+        :param timeout: 池中没有空闲用户时的最长等待时间（秒）
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self.lock:
+                data = self._load()
+                for user in data["users"]:
+                    if user["lease_pid"] is None or not pid_alive(user["lease_pid"]):
+                        user["lease_pid"] = os.getpid()
+                        user["leased_at"] = time.time()
+                        self._save(data)
+                        return dict(user)
+            if time.time() > deadline:
+                raise TimeoutError(f"用户池 {self.path} 在 {timeout}s 内没有空闲用户")
+            time.sleep(0.1)
+
+    def release(self, user: Dict[str, Any]) -> None:
+        """归还用户"""
+        with self.lock:
+            data = self._load()
+            for pooled in data["users"]:
+                if pooled["username"] == user["username"]:
+                    pooled["lease_pid"] = None
+                    pooled["leased_at"] = None
+            self._save(data)
+
+    @contextmanager
+    def leased(self, timeout: float = 60):
+        user = self.lease(timeout)
+        try:
+            yield user
+        finally:
+            self.release(user)
+
+
+_USER_POOL: Optional[UserPool] = None
+
+
+def get_user_pool(app_manager=None) -> UserPool:
+    """
+    获取当前进程的用户池（首次调用时补齐用户）
+    :param app_manager: 传入时在补齐用户后重新做数据库快照，之后恢复数据不会清掉池中的用户
+    """
+    global _USER_POOL
+    if _USER_POOL is None:
+        _USER_POOL = UserPool.from_config()
+        _USER_POOL.ensure()
+        if app_manager is not None:
+            app_manager.snapshot_database(refresh=True)
+    return _USER_POOL
+
+
+# ---------------------------------------------------------------- 批量造数
+
+SCENARIO_KEYS = ("users", "contacts", "transactions")
+TRANSACTION_TYPES = ("payment", "request")
+PRIVACY_LEVELS = ("public", "private", "contacts")
+
+
+def normalize_scenario(name: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验场景定义并补齐默认值，返回的结果同时用于计算哈希（写法不同但含义相同的定义哈希一致）
+    :raises ConfigError: 定义不合法（未知字段、引用了不存在的别名等）
+    """
+    def fail(message):
+        raise ConfigError(f"数据场景 {name}: {message}")
+
+    def integer(value, where):
+        if isinstance(value, bool) or not isinstance(value, int):
+            fail(f"{where} 必须是整数，实际为: {value!r}")
+        return value
+
+    if not isinstance(spec, dict) or set(spec) - set(SCENARIO_KEYS):
+        fail(f"只支持 {list(SCENARIO_KEYS)}，实际为: {spec!r}")
+    if not isinstance(spec.get("users") or {}, dict):
+        fail(f"users 必须是 别名 -> 用户定义 的字典，实际为: {spec['users']!r}")
+    users = {}
+    for alias, user in (spec.get("users") or {}).items():
+        alias, user = str(alias), user or {}
+        if not isinstance(user, dict):
+            fail(f"users.{alias} 必须是 {{count, bank_accounts, settings}} 形式的字典，实际为: {user!r}")
+        if set(user) - {"count", "bank_accounts", "settings"}:
+            fail(f"users.{alias} 中有未知字段: {sorted(set(user) - {'count', 'bank_accounts', 'settings'})}")
+        users[alias] = {"count": integer(user.get("count", 1), f"users.{alias}.count"),
+                        "bank_accounts": integer(user.get("bank_accounts", 0), f"users.{alias}.bank_accounts"),
+                        "settings": dict(user.get("settings") or {})}
+        if users[alias]["count"] <= 0 or users[alias]["bank_accounts"] < 0:
+            fail(f"users.{alias} 的 count 必须大于 0，bank_accounts 不能为负数")
+    if not users:
+        fail("至少需要一个用户")
+
+    def aliases(value, where):
+        value = value if isinstance(value, list) else [value]
+        for alias in value:
+            if alias not in users:
+                fail(f"{where} 引用了未定义的用户 {alias!r}")
+        return value
+
+    def single_alias(value, where):
+        if isinstance(value, list):
+            fail(f"{where} 只能是一个别名，实际为: {value!r}（多组用户请分成多条交易）")
+        return aliases(value, where)[0]
+
+    def items(key):
+        value = spec.get(key) or []
+        if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+            fail(f"{key} 必须是字典列表，实际为: {value!r}")
+        return value
+
+    contacts = [{"user": aliases(item.get("user"), "contacts.user"),
+                 "contacts": aliases(item.get("contacts"), "contacts.contacts")}
+                for item in items("contacts")]
+    transactions = []
+    for item in items("transactions"):
+        transaction = {
+            "from": single_alias(item.get("from"), "transactions.from"),
+            "to": single_alias(item.get("to"), "transactions.to"),
+            "type": item.get("type", "payment"),
+            "amount": item.get("amount"),
+            "count": integer(item.get("count", 1), "transactions.count"),
+            "description": str(item.get("description", "")),
+            "privacy": item.get("privacy"),
+        }
+        if transaction["type"] not in TRANSACTION_TYPES:
+            fail(f"transactions.type 必须是 {list(TRANSACTION_TYPES)} 之一，实际为: {transaction['type']!r}")
+        if transaction["privacy"] is not None and transaction["privacy"] not in PRIVACY_LEVELS:
+            fail(f"transactions.privacy 必须是 {list(PRIVACY_LEVELS)} 之一，实际为: {transaction['privacy']!r}")
+        if isinstance(transaction["amount"], bool) or not isinstance(transaction["amount"], (int, float)) \
+                or transaction["amount"] <= 0:
+            fail(f"transactions.amount 必须是正数，实际为: {transaction['amount']!r}")
+        if transaction["count"] <= 0:
+            fail("transactions.count 必须大于 0")
+        if not users[transaction["from"]]["bank_accounts"]:
+            # 付款余额不足时从发起人的银行账户转入，RWA 也要求先有银行账户才能发起交易
+            fail(f"transactions 的发起人 {transaction['from']} 至少需要一个银行账户（bank_accounts）")
+        if transaction["from"] == transaction["to"] and users[transaction["from"]]["count"] < 2:
+            fail(f"transactions 中 {transaction['from']} 组只有一个用户，不能给自己发起交易")
+        transactions.append(transaction)
+    return {"users": users, "contacts": contacts, "transactions": transactions}
+
+
+def scenario_hash(spec: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class DataFactory:
+    """
+    按场景定义通过接口批量造数，缓存文件内容为 JSON：
+    api_url（数据所在的后端）、scenarios（场景名 -> 哈希、用户、交易等造数结果）
+    """
+
+    def __init__(self, path: str, scenario_file: Optional[str] = None, concurrency: int = 8,
+                 api_url: Optional[str] = None):
+        """
+        :param path: 缓存文件路径
+        :param scenario_file: 场景定义的 yaml 文件
+        :param concurrency: 并发调用接口的线程数
+        :param api_url: 后端地址，默认取当前进程的后端地址（utils.endpoints）
+        """
+        self.path = path
+        self.scenario_file = scenario_file
+        self.concurrency = concurrency
+        self.api_url = api_url or endpoints.api_url()
+        # 首次造数期间会一直持有锁，其他 worker 等造完直接复用
+        self.lock = FileLock(path + ".lock", timeout=600, stale=900)
+
+    @classmethod
+    def from_config(cls) -> "DataFactory":
+        factory_config = config.data_factory
+        path = _per_backend_path(config.resolve_path(factory_config.cache))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return cls(path, scenario_file=config.resolve_path(factory_config.scenario_file),
+                   concurrency=factory_config.concurrency)
+
+    def load_spec(self, name: str) -> Dict[str, Any]:
+        """从场景文件读取场景定义"""
+        scenarios = (load_yaml(self.scenario_file) or {}).get("scenarios") or {}
+        if name not in scenarios:
+            raise ConfigError(f"{self.scenario_file} 中没有数据场景 {name}，已定义: {sorted(scenarios)}")
+        return scenarios[name]
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("api_url") != self.api_url:
+            # 换了后端，缓存的数据不存在
+            data = {"api_url": self.api_url, "scenarios": {}}
+        return data
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        write_json_atomic(self.path, data, indent=2)
+
+    def ensure(self, name: str, spec: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        取得场景数据：缓存中哈希一致且数据仍在时直接复用，否则重新造数
+        :param spec: 场景定义，为 None 时从场景文件读取
+        :return: (场景数据, 是否新造)
+        """
+        spec = normalize_scenario(name, self.load_spec(name) if spec is None else spec)
+        spec_hash = scenario_hash(spec)
+        start_time = time.perf_counter()
+        with self.lock:
+            data = self._load()
+            cached = data["scenarios"].get(name)
+            if cached and cached.get("hash") == spec_hash and self._is_valid(cached):
+                timing.record("data_seed", time.perf_counter() - start_time, scenario=name, cached=True)
+                return cached, False
+            if cached:
+                logger.info(f"数据场景 {name} 的定义已修改或数据已失效，重新创建")
+            scenario = self.seed(name, spec)
+            scenario["hash"] = spec_hash
+            data["scenarios"][name] = scenario
+            self._save(data)
+        duration = time.perf_counter() - start_time
+        timing.record("data_seed", duration, scenario=name, cached=False)
+        logger.info(f"数据场景 {name} 创建完成: {sum(len(users) for users in scenario['users'].values())} 个用户，"
+                    f"{scenario['contacts']} 个联系人，{len(scenario['transactions'])} 笔交易，耗时 {duration:.2f}s")
+        return scenario, True
+
+    def _is_valid(self, scenario: Dict[str, Any]) -> bool:
+        """应用数据被重置过时场景中的用户已经不存在，取第一个用户登录验证"""
+        user = next(iter(scenario["users"].values()))[0]
+        client = RwaApiClient(self.api_url)
+        try:
+            client.login(user["username"], user["password"])
+            return True
+        except ApiError:
+            return False
+        finally:
+            client.close()
+
+    def _map(self, func, items: List[Any]) -> List[Any]:
+        """有界并发执行，任一任务失败时抛出它的异常"""
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def seed(self, name: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按（已校验的）场景定义造数，分两轮并发：
+        1）注册并登录所有用户，同时完成用户设置和银行账户（都只涉及本人）
+        2）每个用户添加联系人、发起交易（接收人在第一轮都已存在）
+        每个用户的操作都用自己的客户端在同一个线程中顺序执行（requests.Session 不保证线程安全）
+        """
+        keys = [(alias, index) for alias, user in spec["users"].items() for index in range(user["count"])]
+        clients: Dict[Tuple[str, int], RwaApiClient] = {}
+        users: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+        def create_user(key):
+            alias, _ = key
+            settings = spec["users"][alias]
+            client = clients[key] = RwaApiClient(self.api_url)
+            user = client.create_user(prefix=alias)
+            client.login(user["username"], user["password"])
+            if settings["settings"]:
+                client.update_user(user["id"], **settings["settings"])
+            accounts = [client.create_bank_account(f"{alias} Bank {number + 1}", f"{number + 1:09d}", "987654321")
+                        for number in range(settings["bank_accounts"])]
+            users[key] = {"username": user["username"], "password": user["password"], "id": user.get("id"),
+                          "bank_accounts": [account.get("id") for account in accounts]}
+
+        def group(alias):
+            return [(alias, index) for index in range(spec["users"][alias]["count"])]
+
+        # 按发起人分组：联系人、交易
+        contact_tasks: Dict[Tuple[str, int], List[Tuple[str, int]]] = {key: [] for key in keys}
+        for item in spec["contacts"]:
+            for owner in (key for owner_alias in item["user"] for key in group(owner_alias)):
+                for alias in item["contacts"]:
+                    contact_tasks[owner] += [key for key in group(alias)
+                                             if key != owner and key not in contact_tasks[owner]]
+        transaction_tasks: Dict[Tuple[str, int], List[Tuple[Dict[str, Any], Tuple[str, int]]]] = \
+            {key: [] for key in keys}
+        for item in spec["transactions"]:
+            for sender_index, sender in enumerate(group(item["from"])):
+                receivers = [key for key in group(item["to"]) if key != sender]
+                for number in range(item["count"]):
+                    transaction_tasks[sender].append((item, receivers[(sender_index + number) % len(receivers)]))
+
+        def connect_user(key):
+            client = clients[key]
+            for contact in contact_tasks[key]:
+                client.add_contact(users[contact]["id"])
+            created = []
+            for item, receiver in transaction_tasks[key]:
+                transaction = client.create_transaction(users[receiver]["id"], item["amount"], item["type"],
+                                                        item["description"], item["privacy"])
+                created.append({"id": transaction.get("id"), "type": item["type"], "amount": item["amount"],
+                                "sender": users[key]["username"], "receiver": users[receiver]["username"]})
+            return created
+
+        try:
+            self._map(create_user, keys)
+            transactions = [item for created in self._map(connect_user, keys) for item in created]
+        finally:
+            for client in clients.values():
+                client.close()
+        return {
+            "users": {alias: [users[key] for key in group(alias)] for alias in spec["users"]},
+            "contacts": sum(len(contacts) for contacts in contact_tasks.values()),
+            "transactions": transactions,
+            "seeded_at": time.time(),
+        }
+
+
+_DATA_FACTORY: Optional[DataFactory] = None
+_SCENARIOS: Dict[str, Dict[str, Any]] = {}
+
+
+def get_scenario(name: str, app_manager=None, spec: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    获取场景数据（当前进程内只准备一次）
+    :param name: 场景名，spec 为 None 时从 data_factory.scenario_file 中读取定义
+    :param app_manager: 传入时在新造数后重新做数据库快照，之后恢复数据不会清掉场景数据
+    :param spec: 直接传入的场景定义
+    :return: users（别名 -> 用户列表，含 password、bank_accounts）、transactions、contacts
+    """
+    global _DATA_FACTORY
+    if name not in _SCENARIOS:
+        if _DATA_FACTORY is None:
+            _DATA_FACTORY = DataFactory.from_config()
+        scenario, created = _DATA_FACTORY.ensure(name, spec)
+        if created and app_manager is not None:
+            app_manager.snapshot_database(refresh=True)
+        _SCENARIOS[name] = scenario
+    return _SCENARIOS[name]
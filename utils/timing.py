@@ -0,0 +1,77 @@
+
+"""
+阶段耗时采集 - 供 plugins/timing.py 插件汇总输出
+1）业务代码（AppManager 启动尝试、重试装饰器、BaseTest.setUp 等）只调用 record/timed 记录事件，不依赖 pytest
+2）插件未启用时不保存任何事件，开销只有一次布尔判断
+3）事件在记录时就确定归属：插件在每条测试运行期间设置当前 nodeid（contextvars），后台线程（后台启动应用、
+   健康监控等）不继承，记录的事件 nodeid 为 None，即归到会话；需要时调用方也可以显式传 nodeid
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+_ENABLED = False
+_EVENTS: List[Dict[str, Any]] = []
+_LOCK = threading.Lock()
+# 当前正在运行的测试，由 plugins/timing.py 在 pytest_runtest_protocol 期间设置
+_NODEID: contextvars.ContextVar = contextvars.ContextVar("timing_nodeid", default=None)
+
+
+def enable(flag: bool = True) -> None:
+    global _ENABLED
+    _ENABLED = flag
+
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+
+@contextmanager
+def attribute_to(nodeid: Optional[str]):
+    """代码块内（同一线程及复制了上下文的线程）记录的事件归到 nodeid"""
+    token = _NODEID.set(nodeid)
+    try:
+        yield
+    finally:
+        _NODEID.reset(token)
+
+
+def record(phase: str, duration: float, **fields) -> None:
+    """
+    记录一个阶段耗时
+    :param phase: 阶段名称，如 app_start_attempt、retry_attempt、setUp
+    :param duration: 耗时（秒）
+    :param fields: 附加字段（如 attempt、outcome），可以用 nodeid 显式指定归属
+    """
+    if not _ENABLED:
+        return
+    event = {"phase": phase, "duration": round(duration, 6), "ts": time.time(), "nodeid": _NODEID.get()}
+    event.update(fields)
+    with _LOCK:
+        _EVENTS.append(event)
+
+
+@contextmanager
+def timed(phase: str, **fields):
+    """
+    计时上下文，yield 出的 fields 可以在代码块内补充字段（如结果）
+    使用示例:
+        with timing.timed("retry_attempt", attempt=1) as info:
+            ...
+            info["outcome"] = "passed"
+    """
+    start_time = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record(phase, time.perf_counter() - start_time, **fields)
+
+
+def drain() -> List[Dict[str, Any]]:
+    """取出并清空已记录的事件"""
+    global _EVENTS
+    with _LOCK:
+        events, _EVENTS = _EVENTS, []
+    return events
@@ -0,0 +1,207 @@
+
+"""
+条件等待 - 替代测试中的 while 轮询和 time.sleep 固定等待
+1）条件判断尽量放在浏览器里轮询（execute_async_script），一次 WebDriver 往返，条件满足立刻返回
+2）无法在浏览器内判断的条件，用 wait_until 按短间隔指数放宽轮询
+3）find_sleep_calls 静态扫描测试函数里的 time.sleep，由 conftest 在收集阶段给出警告
+   （收集阶段就会导入本模块，selenium 只在真正等待时才导入）
+"""
+import ast
+import functools
+import logging
+import os
+import time
+from typing import Callable, Optional, Dict, List, Any
+
+logger = logging.getLogger(__name__)
+
+# 统计页面内进行中的 fetch/XHR 请求数和最近一次网络活动时间，注入一次即可
+NETWORK_TRACKER_SCRIPT = """
+(function () {
+    if (window.__rwaNetwork) { return; }
+    var tracker = window.__rwaNetwork = {pending: 0, lastActivity: Date.now()};
+    function begin() { tracker.pending += 1; tracker.lastActivity = Date.now(); }
+    function end() { tracker.pending = Math.max(0, tracker.pending - 1); tracker.lastActivity = Date.now(); }
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function () {
+            begin();
+            return originalFetch.apply(this, arguments).then(
+                function (response) { end(); return response; },
+                function (error) { end(); throw error; }
+            );
+        };
+    }
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        begin();
+        this.addEventListener("loadend", end);
+        return originalSend.apply(this, arguments);
+    };
+})();
+"""
+
+# 在浏览器内轮询条件的通用骨架：条件满足或超时后通过回调一次性返回
+_POLL_TEMPLATE = """
+var done = arguments[arguments.length - 1];
+var args = arguments;
+var deadline = Date.now() + %(timeout_ms)d;
+function check() { %(condition)s }
+(function poll() {
+    var value;
+    try { value = check(); } catch (e) { value = null; }
+    if (value) { done({ok: true, value: value}); return; }
+    if (Date.now() > deadline) { done({ok: false, value: location.href}); return; }
+    setTimeout(poll, %(interval_ms)d);
+})();
+"""
+
+
+def _poll_in_browser(sb, condition: str, timeout: float, description: str, *args, interval: float = 0.05):
+    """
+    在浏览器内轮询 JS 条件（condition 为 check() 函数体，返回真值即满足，可通过 args[i] 取参数）
+    :return: 条件满足时 check() 的返回值
+    """
+    from selenium.common.exceptions import TimeoutException
+    script = _POLL_TEMPLATE % {
+        "timeout_ms": int(timeout * 1000),
+        "interval_ms": int(interval * 1000),
+        "condition": condition,
+    }
+    sb.driver.set_script_timeout(timeout + 5)
+    result = sb.driver.execute_async_script(script, *args)
+    if not result or not result.get("ok"):
+        current = result.get("value") if result else None
+        raise TimeoutException(f"{timeout}s 内未满足条件: {description}（当前页面: {current}）")
+    return result["value"]
+
+
+def wait_until(condition: Callable[[], Any], timeout: float = 10, description: str = "",
+               initial_interval: float = 0.05, max_interval: float = 0.5):
+    """
+    Python 侧的条件等待：间隔从 initial_interval 开始指数放宽，条件一满足立即返回
+    :return: condition() 的返回值
+    """
+    from selenium.common.exceptions import TimeoutException
+    deadline = time.time() + timeout
+    interval = initial_interval
+    while True:
+        value = condition()
+        if value:
+            return value
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutException(f"{timeout}s 内未满足条件: {description or condition}")
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+
+
+def wait_for_url_contains(sb, fragment: str, timeout: float = 10) -> str:
+    """等待当前 URL 包含 fragment，返回满足时的 URL"""
+    return _poll_in_browser(
+        sb, "return location.href.indexOf(args[0]) !== -1 ? location.href : null;",
+        timeout, f"URL 包含 {fragment}", fragment
+    )
+
+
+def wait_for_url_matches(sb, pattern: str, timeout: float = 10) -> str:
+    """等待当前 URL 匹配正则（JS 正则语法），返回满足时的 URL"""
+    return _poll_in_browser(
+        sb, "return new RegExp(args[0]).test(location.href) ? location.href : null;",
+        timeout, f"URL 匹配 {pattern}", pattern
+    )
+
+
+def wait_for_route_change(sb, from_url: Optional[str] = None, timeout: float = 10) -> str:
+    """
+    等待前端路由离开 from_url（单页应用 pushState 跳转同样适用）
+    :param from_url: 起始 URL，默认取调用时的当前 URL
+    :return: 跳转后的 URL
+    """
+    from_url = from_url or sb.get_current_url()
+    return _poll_in_browser(
+        sb, "return location.href !== args[0] ? location.href : null;",
+        timeout, f"路由离开 {from_url}", from_url
+    )
+
+
+def install_network_tracker(driver) -> None:
+    """
+    注入网络请求计数器（每个浏览器一次，由 BaseTest.setUp 调用）：
+    Chrome 下通过 CDP 注册到每个新文档，之后的页面加载都会自动带上；没有 CDP 时由 wait_for_network_idle 注入当前页面
+    """
+    if getattr(driver, "_rwa_network_tracker", None) is not None:
+        return
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": NETWORK_TRACKER_SCRIPT})
+        driver._rwa_network_tracker = True
+    except Exception:
+        driver._rwa_network_tracker = False
+
+
+def wait_for_network_idle(sb, idle_time: float = 0.5, timeout: float = 15) -> None:
+    """
+    等待页面网络空闲：没有进行中的 fetch/XHR，且持续 idle_time 秒没有新请求
+    计数器已通过 CDP 注册时不再注入；否则先注入当前页面（注入前已发出的请求无法统计）
+    """
+    if not getattr(sb.driver, "_rwa_network_tracker", False):
+        sb.execute_script(NETWORK_TRACKER_SCRIPT)
+    _poll_in_browser(
+        sb,
+        "var t = window.__rwaNetwork;"
+        "return document.readyState === 'complete' && t && t.pending === 0"
+        " && Date.now() - t.lastActivity >= args[0];",
+        timeout, f"网络空闲 {idle_time}s", int(idle_time * 1000)
+    )
+
+
+def wait_for_element_stable(sb, selector: str, frames: int = 3, timeout: float = 10) -> Dict[str, float]:
+    """
+    等待元素可见且位置/尺寸连续 frames 次检查不变（动画、布局抖动结束），返回元素的位置信息
+    """
+    condition = """
+        var el = document.querySelector(args[0]);
+        if (!el) { window.__rwaStable = null; return null; }
+        var r = el.getBoundingClientRect();
+        if (r.width === 0 || r.height === 0) { return null; }
+        var key = [r.x, r.y, r.width, r.height].join(",");
+        var s = window.__rwaStable;
+        if (!s || s.selector !== args[0] || s.key !== key) {
+            window.__rwaStable = {selector: args[0], key: key, count: 1};
+            return null;
+        }
+        s.count += 1;
+        return s.count >= args[1] ? {x: r.x, y: r.y, width: r.width, height: r.height} : null;
+    """
+    return _poll_in_browser(sb, condition, timeout, f"元素稳定 {selector}", selector, frames, interval=0.016)
+
+
+def find_sleep_calls(path: str) -> Dict[str, List[int]]:
+    """
+    静态扫描测试文件中 test_*/setUp 函数体内的 time.sleep / sleep 调用（每个文件按修改时间只解析一次）
+    :return: 函数名 -> 调用所在行号列表
+    """
+    return _scan_sleep_calls(path, os.stat(path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=None)
+def _scan_sleep_calls(path: str, mtime_ns: int) -> Dict[str, List[int]]:
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    found: Dict[str, List[int]] = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        if not (node.name.startswith("test") or node.name == "setUp"):
+            continue
+        for call in ast.walk(node):
+            if not isinstance(call, ast.Call):
+                continue
+            func = call.func
+            is_sleep = (isinstance(func, ast.Attribute) and func.attr == "sleep"
+                        and isinstance(func.value, ast.Name) and func.value.id == "time") \
+                or (isinstance(func, ast.Name) and func.id == "sleep")
+            if is_sleep:
+                found.setdefault(node.name, []).append(call.lineno)
+    return {name: sorted(lines) for name, lines in found.items()}